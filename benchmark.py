@@ -0,0 +1,183 @@
+import json
+import os
+import platform
+import sys
+import numpy as np
+import upload_picture
+import predictor
+import entropy_coder
+import reconstruct_original
+import instrumentation
+import synthetic
+from predictor_names import PREDICTORS
+
+# Cube sizes as (bands, rows, cols), from a quick check up to beyond PaviaU (103 x 610 x 340)
+SIZES = {
+    "small": (16, 64, 64),
+    "medium": (64, 256, 256),
+    "paviau": (103, 610, 340),
+    "large": (224, 1024, 512)
+}
+DEFAULT_SIZES = ("small", "medium", "paviau")
+
+# A stage regresses when it is slower (or its peak allocation larger) than the baseline by more than the tolerance
+DEFAULT_TOLERANCE = 0.25
+# Stages faster than this, or allocating less than this, in the baseline are too noisy to compare
+MIN_SECONDS = 0.005
+MIN_PEAK_BYTES = 1 << 20
+
+def benchmark_cube(shape, seed=0):
+    """
+    Builds a reproducible 12-bit synthetic scene (see synthetic.fill_scene).
+
+    Parameters:
+    shape (tuple): The (bands, rows, cols) shape of the cube.
+    seed (int): The seed of the scene.
+
+    Returns:
+    np.array: The np.uint16 cube.
+    """
+    return synthetic.generate_cube(shape, np.uint16, bit_depth=12, seed=seed)
+
+def run_pipeline(matrix, predictor_name, codec=entropy_coder.DEFAULT_CODEC, trace_memory=False):
+    """
+    Runs predict, residual, encode, decode and reconstruct on a cube under a trace.
+
+    Parameters:
+    matrix (np.array): The (bands, rows, cols) cube.
+    predictor_name (str): The name of the predictor function.
+    codec (str): The entropy coder, "huffman", "rans" or "golomb_rice".
+    trace_memory (bool): Whether to record the peak allocations, which slows the stages down.
+
+    Returns:
+    dict: The summary of every stage (see instrumentation.summarize).
+    """
+    predictor_function = getattr(predictor, predictor_name)
+    trace = instrumentation.start(trace_memory)
+    try:
+        compression_object = upload_picture.CompressionObject(matrix=matrix, name=predictor_name, shape=matrix.shape)
+        with instrumentation.stage("predict", matrix.nbytes):
+            compression_object = predictor.predict_residual(compression_object, predictor_function)
+        compression_object = entropy_coder.encode_image(compression_object, codec)
+        compression_object = entropy_coder.reconstruct_image(compression_object)
+        compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, predictor_function)
+    finally:
+        instrumentation.stop()
+    if not np.array_equal(compression_object.reconstructed_matrix, matrix):
+        raise ValueError(f"{predictor_name} with {codec} did not reconstruct the cube.")
+    return trace.summary()
+
+def run_benchmark(sizes=DEFAULT_SIZES, predictor_names=PREDICTORS, codecs=(entropy_coder.DEFAULT_CODEC,), repeats=3, seed=0):
+    """
+    Benchmarks every predictor with every codec at every cube size.
+    Every combination is timed repeats times without memory tracing and keeps the fastest time of
+    every stage, then runs once more with tracemalloc for the peak allocations.
+
+    Parameters:
+    sizes (tuple): Names from SIZES.
+    predictor_names (list): The names of the predictor functions.
+    codecs (tuple): The entropy coders.
+    repeats (int): The number of timed runs.
+    seed (int): The seed of the benchmark cubes.
+
+    Returns:
+    dict: For every "size/predictor/codec" key, the seconds, throughput (MB/s) and peak bytes of every stage.
+    """
+    results = {}
+    for size in sizes:
+        matrix = benchmark_cube(SIZES[size], seed)
+        for predictor_name in predictor_names:
+            for codec in codecs:
+                timings = [run_pipeline(matrix, predictor_name, codec) for _ in range(repeats)]
+                memory = run_pipeline(matrix, predictor_name, codec, trace_memory=True)
+                stages = {}
+                for name, entry in memory.items():
+                    seconds = min(timing[name]["seconds"] for timing in timings)
+                    stages[name] = {
+                        "seconds": seconds,
+                        "throughput": entry["bytes"] / 1e6 / seconds if entry["bytes"] and seconds > 0 else None,
+                        "peak_bytes": entry["peak_bytes"]
+                    }
+                results[f"{size}/{predictor_name}/{codec}"] = stages
+    return results
+
+def save_baseline(results, file_path):
+    """
+    Saves benchmark results as a JSON baseline, together with the machine they were measured on.
+    """
+    baseline = {
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "numpy": np.__version__},
+        "results": results
+    }
+    with open(file_path, "w") as file:
+        json.dump(baseline, file, indent=2)
+
+def load_baseline(file_path):
+    """
+    Loads the results of a JSON baseline written by save_baseline.
+    """
+    with open(file_path) as file:
+        return json.load(file)["results"]
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares benchmark results with a baseline. Only the combinations and stages in both are compared.
+
+    Parameters:
+    results (dict): The results of run_benchmark.
+    baseline (dict): The baseline results.
+    tolerance (float): The allowed relative slowdown (and peak allocation growth).
+
+    Returns:
+    list: The regressions as (key, stage, metric, baseline value, current value) tuples.
+    """
+    regressions = []
+    for key, stages in results.items():
+        for name, entry in stages.items():
+            reference = baseline.get(key, {}).get(name)
+            if reference is None:
+                continue
+            if reference["seconds"] >= MIN_SECONDS and entry["seconds"] > reference["seconds"] * (1 + tolerance):
+                regressions.append((key, name, "seconds", reference["seconds"], entry["seconds"]))
+            if (reference.get("peak_bytes") or 0) >= MIN_PEAK_BYTES and entry["peak_bytes"] is not None and entry["peak_bytes"] > reference["peak_bytes"] * (1 + tolerance):
+                regressions.append((key, name, "peak_bytes", reference["peak_bytes"], entry["peak_bytes"]))
+    return regressions
+
+def format_results(results):
+    """
+    Formats benchmark results as a table with a row per stage.
+    """
+    lines = [f"{'benchmark':<48} {'stage':<12} {'seconds':>10} {'MB/s':>10} {'peak MB':>10}"]
+    for key, stages in results.items():
+        for name, entry in stages.items():
+            throughput = f"{entry['throughput']:.1f}" if entry["throughput"] is not None else "-"
+            peak = f"{entry['peak_bytes'] / 1e6:.1f}" if entry["peak_bytes"] is not None else "-"
+            lines.append(f"{key:<48} {name:<12} {entry['seconds']:>10.4f} {throughput:>10} {peak:>10}")
+    return "\n".join(lines)
+
+def main(sizes=DEFAULT_SIZES, baseline_path="benchmark_baseline.json", update_baseline=False, tolerance=DEFAULT_TOLERANCE,
+         predictor_names=PREDICTORS, codecs=(entropy_coder.DEFAULT_CODEC,), repeats=3):
+    """
+    Main function to run the benchmark suite and compare it with the stored baseline.
+    Without a baseline (or with update_baseline set) the results are stored as the new baseline.
+
+    Returns:
+    list: The regressions (see compare).
+    """
+    results = run_benchmark(sizes, predictor_names, codecs, repeats)
+    print(format_results(results))
+
+    if update_baseline or not os.path.exists(baseline_path):
+        save_baseline(results, baseline_path)
+        print(f"Baseline saved to {baseline_path}")
+        return []
+
+    regressions = compare(results, load_baseline(baseline_path), tolerance)
+    for key, name, metric, reference, current in regressions:
+        print(f"REGRESSION {key} {name} {metric}: {reference:.6g} -> {current:.6g}")
+    if not regressions:
+        print(f"No regressions beyond {tolerance:.0%} of {baseline_path}")
+    return regressions
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,128 @@
+import numpy as np
+
+# Number of codes packed at a time, bounds the temporary memory
+PACK_CHUNK_SIZE = 1 << 20
+
+# Number of codes between two sync points, where decoding can start independently
+SYNC_INTERVAL = 1024
+
+def _or_into_words(words, word_index, contributions):
+    """
+    ORs every contribution into its 64-bit word. The word indices must be non-decreasing.
+    """
+    if word_index.size == 0:
+        return
+    group_starts = np.flatnonzero(np.diff(word_index)) + 1
+    group_starts = np.concatenate(([0], group_starts))
+    words[word_index[group_starts]] |= np.bitwise_or.reduceat(contributions, group_starts)
+
+def pack_codes(codes, lengths, bit_offset=0):
+    """
+    Packs variable-length codes into a byte buffer, most significant bit first.
+
+    Parameters:
+    codes (np.array): Code values, right aligned in an unsigned integer array.
+    lengths (np.array): The length in bits of every code (at most 64).
+    bit_offset (int): The number of zero bits before the first code, so that the buffer
+                      can be ORed into a stream that ends partway through a byte.
+
+    Returns:
+    tuple: A np.uint8 array with the packed bits and the number of valid bits in it (including bit_offset).
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if codes.shape != lengths.shape:
+        raise ValueError("Codes and lengths must have the same shape.")
+    if lengths.size and lengths.max() > 64:
+        raise ValueError("Codes longer than 64 bits are not supported.")
+
+    bit_length = bit_offset + int(lengths.sum())
+    words = np.zeros(bit_length // 64 + 1, dtype=np.uint64)
+    position = bit_offset  # Bit position of the first code of the chunk
+    for start in range(0, codes.size, PACK_CHUNK_SIZE):
+        chunk_codes = codes[start:start + PACK_CHUNK_SIZE]
+        chunk_lengths = lengths[start:start + PACK_CHUNK_SIZE]
+        code_ends = position + np.cumsum(chunk_lengths)
+        code_starts = code_ends - chunk_lengths
+        position = int(code_ends[-1])
+
+        # Every code lands in the word holding its first bit and may spill into the next one
+        word_index = code_starts >> 6
+        end_in_word = (code_starts & 63) + chunk_lengths  # Bit just past the code, from the word's MSB
+        spills = end_in_word > 64
+        head_shift = np.where(spills, 0, 64 - end_in_word).astype(np.uint64)
+        tail_shift = np.where(spills, end_in_word - 64, 0).astype(np.uint64)
+        head = (chunk_codes << head_shift) >> tail_shift
+        _or_into_words(words, word_index, head)
+
+        spill_shift = (128 - end_in_word[spills]).astype(np.uint64)
+        _or_into_words(words, word_index[spills] + 1, chunk_codes[spills] << spill_shift)
+
+    data = words.astype('>u8').view(np.uint8)[:(bit_length + 7) // 8].copy()
+    return data, bit_length
+
+def unpack_bits(data, bit_length):
+    """
+    Unpacks a packed byte buffer into one np.uint8 entry (0 or 1) per bit.
+
+    Parameters:
+    data (np.array): The packed np.uint8 buffer.
+    bit_length (int): The number of valid bits in the buffer.
+
+    Returns:
+    np.array: The unpacked bits.
+    """
+    return np.unpackbits(np.asarray(data, dtype=np.uint8), count=bit_length)
+
+def sync_offsets(lengths, interval=SYNC_INTERVAL):
+    """
+    Computes the bit offset of every interval-th code in a packed stream.
+    Decoding can start independently at each of these offsets.
+    With interval set to the number of pixels in a band, these are the band offsets.
+
+    Parameters:
+    lengths (np.array): The length in bits of every code in the stream.
+    interval (int): The number of codes between two sync points.
+
+    Returns:
+    np.array: The np.uint64 bit offsets of codes 0, interval, 2 * interval, ...
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    code_starts = np.cumsum(lengths) - lengths
+    return code_starts[::interval].astype(np.uint64)
+
+def as_words(data):
+    """
+    Views a packed byte buffer as big-endian 64-bit words, zero padded so that
+    peek_bits can read past the last valid bit.
+
+    Parameters:
+    data (np.array): The packed np.uint8 buffer.
+
+    Returns:
+    np.array: The np.uint64 words.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    padded = np.zeros((data.size // 8 + 2) * 8, dtype=np.uint8)
+    padded[:data.size] = data
+    return padded.view('>u8').astype(np.uint64)
+
+def peek_bits(words, positions, width):
+    """
+    Reads width bits starting at each bit position without consuming them.
+
+    Parameters:
+    words (np.array): The stream as returned by as_words.
+    positions (np.array): The bit positions to read from.
+    width (int): The number of bits to read (1 to 64).
+
+    Returns:
+    np.array: The bits read at every position as np.uint64 values.
+    """
+    positions = np.asarray(positions, dtype=np.uint64)
+    index = positions >> np.uint64(6)
+    offset = positions & np.uint64(63)
+    high = words[index] << offset
+    # Shifting by 64 is undefined, so the low word is shifted in two steps
+    low = (words[index + np.uint64(1)] >> np.uint64(1)) >> (np.uint64(63) - offset)
+    return (high | low) >> np.uint64(64 - width)
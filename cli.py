@@ -0,0 +1,264 @@
+import argparse
+import os
+import sys
+import time
+# Only the standard library and the names of the predictors are imported here: every command imports
+# the modules it needs when it runs, so that short jobs (and --help) do not pay for numpy, scipy or matplotlib
+from predictor_names import PREDICTORS
+
+CODECS = ["huffman", "rans", "golomb_rice"]
+# Compressed file formats by extension
+FORMATS = {".hsic": "container", ".hsis": "stream", ".hsit": "tiled"}
+
+def _shape(text):
+    """
+    Parses a "bands,rows,cols" shape.
+    """
+    shape = tuple(int(value) for value in text.split(","))
+    if len(shape) != 3:
+        raise argparse.ArgumentTypeError(f"Expected bands,rows,cols, got {text}.")
+    return shape
+
+def _range(text):
+    """
+    Parses a "start:stop" range, either end may be left out.
+    """
+    start, _, stop = text.partition(":")
+    return int(start) if start else 0, int(stop) if stop else None
+
+def _load_options(args):
+    """
+    Collects the upload_picture.load_cube options of the input file from the arguments.
+    """
+    extension = os.path.splitext(args.input)[1].lower()
+    if extension == ".mat":
+        return {"matrix_name": args.matrix_name}
+    if extension == ".npy":
+        return {"interleave": args.interleave or "bsq"}
+    if args.shape is None or args.dtype is None:
+        raise SystemExit("Raw cubes need --shape and --dtype.")
+    return {"shape": args.shape, "dtype": args.dtype, "interleave": args.interleave or "bsq", "offset": args.offset}
+
+def _file_format(path, chosen=None):
+    """
+    Picks the compressed file format, from the option or from the file extension.
+    """
+    file_format = chosen or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format is None:
+        raise SystemExit(f"Cannot tell the format of {path}, use --format or one of the extensions {', '.join(FORMATS)}.")
+    return file_format
+
+def _write_cube(path, cube):
+    """
+    Writes a (bands, rows, cols) cube to a .npy file, or to a raw BSQ file for any other extension.
+    """
+    import numpy as np
+    if os.path.splitext(path)[1].lower() == ".npy":
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=cube.dtype, shape=cube.shape)
+    else:
+        output = np.memmap(path, mode="w+", dtype=cube.dtype, shape=cube.shape)
+    output[...] = cube
+    output.flush()
+
+def compress(args):
+    """
+    Compresses a cube file to a container, stream or tiled file.
+    """
+    import upload_picture
+    import predictor
+
+    start_time = time.perf_counter()
+    compression_object = upload_picture.load_cube(args.input, **_load_options(args))
+    predictor_function = getattr(predictor, args.predictor)
+    file_format = _file_format(args.output, args.format)
+
+    if file_format == "stream":
+        import streaming
+        streaming.compress_to_file(compression_object, predictor_function, args.output, args.bands_per_chunk, args.codec)
+    elif file_format == "tiled":
+        import tiling
+        tiling.compress(compression_object, predictor_function, args.output, args.tile_size, args.workers or 1, args.codec)
+    else:
+        import container
+        if args.workers and args.workers > 1 and args.codec == "huffman":
+            import parallel
+            compression_object = parallel.compress(compression_object, predictor_function, args.workers)
+        else:
+            import entropy_coder
+            compression_object.lean = True
+            compression_object = predictor.predict_residual(compression_object, predictor_function)
+            compression_object = entropy_coder.encode_image(compression_object, args.codec, rle=False)
+        container.save(compression_object, args.output)
+
+    input_size = compression_object.matrix.nbytes
+    output_size = os.path.getsize(args.output)
+    print(f"{args.input} -> {args.output} ({file_format}, {args.predictor}, {args.codec}): "
+          f"{input_size} -> {output_size} bytes, ratio {input_size / output_size:.3f}, {time.perf_counter() - start_time:.2f} s")
+    return 0
+
+def decompress(args):
+    """
+    Decompresses a container, stream or tiled file, or a range of its bands (or a region of a tiled file),
+    to a .npy or raw BSQ file.
+    """
+    start_time = time.perf_counter()
+    file_format = _file_format(args.input, args.format)
+    band_start, band_stop = args.bands
+
+    if file_format == "stream":
+        import streaming
+        if args.bands != (0, None):
+            raise SystemExit("Stream files are always decompressed whole.")
+        if os.path.splitext(args.output)[1].lower() == ".npy":
+            import numpy as np
+            with open(args.input, "rb") as file:
+                bands = streaming.decompress_bands(file)
+                header = next(bands)
+                import reconstruct_original
+                dtype = reconstruct_original.original_dtype(header["untouched_dtype"], header["dtype"])
+                output = np.lib.format.open_memmap(args.output, mode="w+", dtype=dtype, shape=tuple(header["shape"]))
+                for start, values in bands:
+                    output[start:start + len(values)] = values
+            output.flush()
+        else:
+            streaming.decompress_to_memmap(args.input, args.output)
+    elif file_format == "tiled":
+        import tiling
+        (row_start, row_stop), (col_start, col_stop) = args.rows, args.cols
+        region = tiling.load_region(args.input, row_start, row_stop, col_start, col_stop, band_start, band_stop, args.workers or 1)
+        _write_cube(args.output, region.reconstructed_matrix)
+    else:
+        if args.workers and args.workers > 1 and args.bands == (0, None):
+            import parallel
+            compression_object = parallel.decompress(args.input, args.workers)
+        else:
+            import container
+            compression_object = container.load(args.input, band_start, band_stop)
+        _write_cube(args.output, compression_object.reconstructed_matrix)
+
+    print(f"{args.input} -> {args.output}: {os.path.getsize(args.output)} bytes, {time.perf_counter() - start_time:.2f} s")
+    return 0
+
+def bench(args):
+    """
+    Runs the benchmark suite against its baseline. Fails when a stage regressed.
+    """
+    import benchmark
+    regressions = benchmark.main(args.sizes, args.baseline, args.update_baseline, args.tolerance, args.predictors, args.codecs, args.repeats)
+    return 1 if regressions else 0
+
+def analyze(args):
+    """
+    Runs the compression analysis of the predictors on a cube file.
+    """
+    import compression_analysis
+    compression_analysis.main(
+        workers=args.workers, estimate=args.estimate, sample_fraction=args.sample_fraction, codec=args.codec,
+        lean=args.lean, store_path=args.store, trace_path=args.trace, path_to_original_image=args.input,
+        predictors=args.predictors, graphs=not args.no_graphs, output_dir=args.output_dir, **_load_options(args)
+    )
+    return 0
+
+def generate(args):
+    """
+    Generates a synthetic scene .npy file.
+    """
+    import synthetic
+    compression_object = synthetic.generate_scene(
+        args.output, args.shape, args.dtype, noise=args.noise, edges=args.edges, bit_depth=args.bit_depth, seed=args.seed
+    )
+    print(f"{args.output}: {compression_object.shape} {compression_object.matrix.dtype}, {os.path.getsize(args.output)} bytes")
+    return 0
+
+def _add_input_options(parser):
+    """
+    Adds the options that describe how to load an input cube file.
+    """
+    parser.add_argument("input", help="The cube file, .mat, .npy or raw.")
+    parser.add_argument("--matrix-name", help="The variable holding the cube in a .mat file (the largest 3D variable by default).")
+    parser.add_argument("--interleave", choices=["bsq", "bil", "bip"], help="The axis order of a .npy or raw cube (bsq, (bands, rows, cols), by default).")
+    parser.add_argument("--shape", type=_shape, help="The bands,rows,cols shape of a raw cube.")
+    parser.add_argument("--dtype", help="The sample type of a raw cube, with its byte order (e.g. '<u2').")
+    parser.add_argument("--offset", type=int, default=0, help="The number of header bytes of a raw cube.")
+
+def build_parser():
+    """
+    Builds the argument parser of every command.
+
+    Returns:
+    argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(prog="cli.py", description="Lossless hyperspectral image compression.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_compress = commands.add_parser("compress", help="Compress a cube file.")
+    _add_input_options(parser_compress)
+    parser_compress.add_argument("output", help="The compressed file, .hsic (container), .hsis (stream) or .hsit (tiled).")
+    parser_compress.add_argument("--format", choices=sorted(set(FORMATS.values())), help="The compressed file format (from the output extension by default).")
+    parser_compress.add_argument("--predictor", choices=PREDICTORS, default="median_edge_detector")
+    parser_compress.add_argument("--codec", choices=CODECS, default="huffman")
+    parser_compress.add_argument("--workers", type=int, help="The number of worker processes (container with huffman, and tiled files).")
+    parser_compress.add_argument("--bands-per-chunk", type=int, default=1, help="The number of bands of every chunk of a stream file.")
+    parser_compress.add_argument("--tile-size", type=int, default=64, help="The size of the tiles of a tiled file.")
+    parser_compress.set_defaults(function=compress)
+
+    parser_decompress = commands.add_parser("decompress", help="Decompress a compressed file.")
+    parser_decompress.add_argument("input", help="The compressed file.")
+    parser_decompress.add_argument("output", help="The decompressed cube, .npy or raw BSQ.")
+    parser_decompress.add_argument("--format", choices=sorted(set(FORMATS.values())), help="The compressed file format (from the input extension by default).")
+    parser_decompress.add_argument("--bands", type=_range, default=(0, None), help="The start:stop range of bands to decompress.")
+    parser_decompress.add_argument("--rows", type=_range, default=(0, None), help="The start:stop range of rows of a tiled file.")
+    parser_decompress.add_argument("--cols", type=_range, default=(0, None), help="The start:stop range of columns of a tiled file.")
+    parser_decompress.add_argument("--workers", type=int, help="The number of worker processes.")
+    parser_decompress.set_defaults(function=decompress)
+
+    parser_bench = commands.add_parser("bench", help="Run the benchmark suite against its baseline.")
+    parser_bench.add_argument("--sizes", nargs="+", default=["small", "medium", "paviau"], choices=["small", "medium", "paviau", "large"])
+    parser_bench.add_argument("--predictors", nargs="+", default=PREDICTORS, choices=PREDICTORS)
+    parser_bench.add_argument("--codecs", nargs="+", default=["huffman"], choices=CODECS)
+    parser_bench.add_argument("--repeats", type=int, default=3)
+    parser_bench.add_argument("--baseline", default="benchmark_baseline.json", help="The JSON baseline file.")
+    parser_bench.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser_bench.add_argument("--tolerance", type=float, default=0.25, help="The allowed relative slowdown.")
+    parser_bench.set_defaults(function=bench)
+
+    parser_analyze = commands.add_parser("analyze", help="Compare the predictors on a cube file.")
+    _add_input_options(parser_analyze)
+    parser_analyze.add_argument("--predictors", nargs="+", choices=PREDICTORS, help="The predictors to compare (all by default).")
+    parser_analyze.add_argument("--codec", choices=CODECS, default="huffman")
+    parser_analyze.add_argument("--workers", type=int, help="The number of worker processes (one per predictor by default).")
+    parser_analyze.add_argument("--estimate", action="store_true", help="Rank the predictors by their estimated size and only run the best one.")
+    parser_analyze.add_argument("--sample-fraction", type=float, help="Estimate from this fraction of the row strips.")
+    parser_analyze.add_argument("--lean", action="store_true", help="Release the intermediates of every stage.")
+    parser_analyze.add_argument("--store", help="Append the metrics to this CSV metrics store and skip the predictors already in it.")
+    parser_analyze.add_argument("--trace", help="Write a Chrome trace of the stages to this JSON file.")
+    parser_analyze.add_argument("--output-dir", help="Keep the container file of every predictor in this directory.")
+    parser_analyze.add_argument("--no-graphs", action="store_true", help="Do not draw the graphs (and do not load matplotlib).")
+    parser_analyze.set_defaults(function=analyze)
+
+    parser_generate = commands.add_parser("generate", help="Generate a synthetic scene .npy file.")
+    parser_generate.add_argument("output", help="The .npy file.")
+    parser_generate.add_argument("--shape", type=_shape, default=(103, 610, 340), help="The bands,rows,cols shape.")
+    parser_generate.add_argument("--dtype", choices=["uint8", "uint16"], default="uint16")
+    parser_generate.add_argument("--bit-depth", type=int, help="The number of significant bits (all the bits of the dtype by default).")
+    parser_generate.add_argument("--noise", type=float, default=2.0, help="The standard deviation of the noise.")
+    parser_generate.add_argument("--edges", type=float, default=0.3, help="The weight of the sharp-edged regions, between 0 and 1.")
+    parser_generate.add_argument("--seed", type=int, default=0)
+    parser_generate.set_defaults(function=generate)
+    return parser
+
+def main(argv=None):
+    """
+    Main function to run a command of the command line.
+
+    Parameters:
+    argv (list): The arguments (sys.argv[1:] by default).
+
+    Returns:
+    int: The exit code.
+    """
+    args = build_parser().parse_args(argv)
+    return args.function(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
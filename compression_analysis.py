@@ -1,18 +1,25 @@
 import numpy as np
+import os
 import time
-import matplotlib.pyplot as plt
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import upload_picture
+import container
 import predictor
-import residual_image
-import huffman_encoder
-import huffman_decoder
+import predictor_names
+import entropy_coder
 import reconstruct_original
+import parallel
+import estimator
+import metrics_store
+import instrumentation
 
 def calculate_mse(original, reconstructed):
     """
     Calculates the Mean Squared Error (MSE) between the original and reconstructed images.
     """
-    return np.mean((original - reconstructed) ** 2)
+    return np.mean((original.astype(np.float64) - reconstructed) ** 2)
 
 def calculate_compression_ratio(original_size, compressed_size):
     """
@@ -27,15 +34,25 @@ def save_results_to_text(file_path, results):
     with open(file_path, "w") as file:
         for result in results:
             file.write(f"Predictor: {result['predictor']}\n")
+            file.write(f"Entropy Coder: {result['codec']}\n")
             file.write(f"MSE: {result['mse']}\n")
             file.write(f"Compression Ratio: {result['compression_ratio']}\n")
             file.write(f"Compression Ratio (RLE): {result['compression_ratio_rle']}\n")
+            file.write(f"Compression Ratio (Container File): {result['compression_ratio_container']}\n")
             file.write(f"Time Taken:\n")
             file.write(f"For predicting and residual: {result['time_to_predict_and_residual']}\n")
             file.write(f"For encoding: {result['time_to_encode']}\n")
             file.write(f"For encoding with RLE: {result['time_to_encode_with_rle']}\n")
             file.write(f"Total Time (No RLE): {result['total_time_no_rle']}\n")
             file.write(f"Total Time (With RLE): {result['total_time_with_rle']}\n")
+            file.write(f"For decoding: {result.get('time_to_decode')}\n")
+            file.write(f"For decoding RLE: {result.get('time_to_decode_rle')}\n")
+            file.write(f"For reconstructing: {result.get('time_to_reconstruct')}\n")
+            if result.get("stage_summary"):
+                file.write("Stages:\n")
+                for name, entry in result["stage_summary"].items():
+                    throughput = f"{entry['throughput']:.1f} MB/s" if entry["throughput"] is not None else "-"
+                    file.write(f"{name}: {entry['seconds']:.6f} s, {entry['calls']} calls, {throughput}, peak {entry['peak_bytes']} bytes\n")
             file.write("Compression Object:\n")
             file.write(result['compression_object'] + "\n")
             file.write("=" * 50 + "\n")
@@ -44,6 +61,8 @@ def generate_graphs(results):
     """
     Generates graphs for MSE, compression ratio, and time complexity.
     """
+    import matplotlib.pyplot as plt  # Only loaded when graphs are drawn, it is slow to import
+
     predictors = list(set(result["predictor"] for result in results))
     predictors.sort()
 
@@ -136,87 +155,292 @@ def generate_graphs(results):
     plt.tight_layout()
     plt.savefig("time_complexity_comparison.png")
 
-def main():
+def generate_graphs_from_store(store_path, **filters):
     """
-    Main function to run the compression analysis.
+    Generates the graphs of generate_graphs from the results in a metrics store.
+    The results of every predictor are averaged over the scenes, codecs and parameters kept by the filters.
+
+    Parameters:
+    store_path (str): The path to the CSV metrics store.
+    filters: Key fields and the value to keep (e.g. scene="PaviaU", codec="huffman").
     """
-    path_to_original_image = r'C:\Users\Amir\Downloads\PaviaU.mat'
- 
-    # List of predictors to test
-    predictors = [
-        ("previous_pixel_predictor", predictor.previous_pixel_predictor),
-        ("first_pixel_predictor", predictor.first_pixel_predictor),
-        ("fixed_value_predictor", predictor.fixed_value_predictor),
-        ("wide_neighbor_oriented", predictor.wide_neighbor_oriented),
-        ("column_oriented", predictor.column_oriented),
-        ("median_edge_detector", predictor.median_edge_detector),
-        ("narrow_neighbor_oriented", predictor.narrow_neighbor_oriented),
-        ("inter_band_predictor", predictor.inter_band_predictor)
-    ]
+    results = metrics_store.load_results(store_path, **filters)
+    if not results:
+        raise ValueError(f"No results in {store_path} match {filters}.")
+    generate_graphs(results)
 
-    # Create the initial CompressionObject
-    object_to_compress = upload_picture.extract_matrix_from_mat(path_to_original_image)
+def evaluate_predictor(object_to_compress, predictor_name, predictor_function, codec=entropy_coder.DEFAULT_CODEC, lean=False, parameters="", trace=False,
+                       output_dir=None):
+    """
+    Runs the whole pipeline of one predictor and calculates its metrics.
+    The input matrix is only read, so it is shared between predictors without copying.
+    With lean set, every stage releases its intermediates (see upload_picture.CompressionObject),
+    and the results hold the summary of the object instead of its arrays.
+    With trace set, the stages of the pipeline are recorded (see instrumentation) into the "stages" of the results,
+    and their summary (see instrumentation.summarize) into the "stage_summary".
+    The container file is measured in a temporary directory, and only kept when output_dir is set.
 
-    results = []
+    Parameters:
+    object_to_compress (CompressionObject): The object containing the original matrix.
+    predictor_name (str): The name of the predictor.
+    predictor_function (function): The predictor to apply.
+    codec (str): The entropy coder of the encoded image, "huffman", "rans" or "golomb_rice".
+    lean (bool): Whether to release the intermediates of every stage.
+    parameters (str): A label of any other settings of the run, recorded with the metrics.
+    trace (bool): Whether to record the time, throughput and peak allocation of every stage.
+    output_dir (str): The directory to keep the compressed_<predictor_name>.hsic container file in (none by default).
 
-    for predictor_name, predictor_function in predictors:
-        # Create a copy of the initial CompressionObject
+    Returns:
+    dict: The metrics of the predictor.
+    """
+    recorded_trace = instrumentation.start() if trace else None
+    try:
         compression_object = upload_picture.CompressionObject(
-            matrix=object_to_compress.matrix.copy(),
+            matrix=object_to_compress.matrix,
             name=object_to_compress.name,
-            shape=object_to_compress.shape
+            shape=object_to_compress.shape,
+            lean=lean
         )
 
-        # Apply the predictor
-        start_time = time.time()
-        compression_object = predictor_function(compression_object)
+        # Apply the predictor and create the residual image
+        start_time = time.perf_counter()
+        with instrumentation.stage("predict", compression_object.matrix.nbytes):
+            compression_object = predictor.predict_residual(compression_object, predictor_function)
 
-        # Create the residual image
-        if predictor_name == "inter_band_predictor":
-            compression_object = residual_image.create_inter_band_residual(compression_object)
-        else:
-            compression_object = residual_image.create_residual_image(compression_object)
-        
-        end_time = time.time()
+        end_time = time.perf_counter()
         compression_object.predict_and_residual_time = end_time - start_time
 
         # Encode the image
-        compression_object = huffman_encoder.encode_image(compression_object)
-        
+        compression_object = entropy_coder.encode_image(compression_object, codec)
+
+        # Save the encoded image to a container file
+        with tempfile.TemporaryDirectory() if output_dir is None else contextlib.nullcontext(output_dir) as directory:
+            container_size = container.save(compression_object, os.path.join(directory, f"compressed_{predictor_name}.hsic"))
+
         # Decode the image
-        compression_object = huffman_decoder.reconstruct_image(compression_object)
+        compression_object = entropy_coder.reconstruct_image(compression_object)
         compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, predictor_function)
 
-
         # Calculate metrics
         mse = calculate_mse(compression_object.matrix, compression_object.reconstructed_matrix)
         original_size = compression_object.shape[0] * compression_object.shape[1] * compression_object.shape[2] * 4  # 4 bytes for 32-bit integer representation
-        compressed_size = len(compression_object.encoded_image) // 8  # Convert bits to bytes
-        compressed_size_rle = len(compression_object.encoded_image_with_rle) // 8  # Convert bits to bytes
+        compressed_size = compression_object.encoded_image.nbytes  # Packed bitstream size in bytes
+        compressed_size_rle = compression_object.encoded_image_with_rle.nbytes  # Packed bitstream size in bytes
         compression_ratio = calculate_compression_ratio(original_size, compressed_size)
         compression_ratio_rle = calculate_compression_ratio(original_size, compressed_size_rle)
+        compression_ratio_container = calculate_compression_ratio(original_size, container_size)
+    finally:
+        # A failed run must not leave its trace recording the stages of the next one
+        if recorded_trace is not None:
+            instrumentation.stop()
+    stages = recorded_trace.stages if recorded_trace is not None else None
+
+    return {
+        "scene": object_to_compress.name,
+        "predictor": predictor_name,
+        "codec": codec,
+        "parameters": parameters,
+        "mse": mse,
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "compressed_size_rle": compressed_size_rle,
+        "container_size": container_size,
+        "compression_ratio": compression_ratio,
+        "compression_ratio_rle": compression_ratio_rle,
+        "compression_ratio_container": compression_ratio_container,
+        "time_to_predict_and_residual": compression_object.predict_and_residual_time,
+        "time_to_encode": compression_object.encode_time,
+        "time_to_encode_with_rle": compression_object.encode_with_rle_time,
+        "total_time_no_rle": compression_object.predict_and_residual_time + compression_object.encode_time,
+        "total_time_with_rle": compression_object.predict_and_residual_time + compression_object.encode_with_rle_time,
+        "time_to_decode": compression_object.decode_time,
+        "time_to_decode_rle": compression_object.decode_rle_time,
+        "time_to_reconstruct": compression_object.reconstruct_time,
+        "stage_summary": instrumentation.summarize(stages) if stages is not None else None,
+        "compression_object": str(compression_object),
+        "stages": stages
+    }
+
+def _evaluate_shared_predictor(cube_spec, name, predictor_name, codec, lean, parameters, trace, output_dir):
+    """
+    Worker: evaluates one predictor on the read-only shared cube.
+    """
+    cube_shm, cube = parallel.attach_shared_array(cube_spec, read_only=True)
+    try:
+        object_to_compress = upload_picture.CompressionObject(matrix=cube, name=name, shape=cube.shape)
+        result = evaluate_predictor(object_to_compress, predictor_name, getattr(predictor, predictor_name), codec, lean, parameters, trace, output_dir)
+    finally:
+        # The shared block can only be closed once no array uses it
+        object_to_compress = cube = None
+        cube_shm.close()
+    return result
+
+def evaluate_predictors(object_to_compress, predictor_names, workers=None, codec=entropy_coder.DEFAULT_CODEC, lean=False, store_path=None, parameters="", trace=False,
+                        output_dir=None):
+    """
+    Evaluates the predictors concurrently, one worker process per predictor.
+    The cube is copied once into read-only shared memory that all the workers use.
+    The results of every predictor are saved as soon as its worker finishes.
+    With a metrics store (see metrics_store), the results are also appended to it, and the
+    predictors already measured for this scene, codec and parameters are skipped and read back instead.
+
+    Parameters:
+    object_to_compress (CompressionObject): The object containing the original matrix.
+    predictor_names (list): The names of the predictor functions to evaluate.
+    workers (int): The number of worker processes (one per predictor by default).
+    codec (str): The entropy coder of the encoded images, "huffman", "rans" or "golomb_rice".
+    lean (bool): Whether the workers release the intermediates of every stage (see evaluate_predictor).
+    store_path (str): The path to the CSV metrics store (none by default).
+    parameters (str): A label of any other settings of the run, part of the key in the store.
+    trace (bool): Whether the workers record the stages of their pipeline (see evaluate_predictor).
+    output_dir (str): The directory to keep the container files in (see evaluate_predictor).
+
+    Returns:
+    list: The metrics of every predictor, in the order of predictor_names.
+    """
+    results = {}
+    if store_path is not None:
+        stored = {
+            result["predictor"]: result
+            for result in metrics_store.load_results(store_path, scene=object_to_compress.name or "", codec=codec, parameters=parameters)
+        }
+        results = {predictor_name: stored[predictor_name] for predictor_name in predictor_names if predictor_name in stored}
+        predictor_names_to_run = [predictor_name for predictor_name in predictor_names if predictor_name not in results]
+    else:
+        predictor_names_to_run = list(predictor_names)
+    if not predictor_names_to_run:
+        return [results[predictor_name] for predictor_name in predictor_names]
+
+    workers = workers or len(predictor_names_to_run)
+    matrix = object_to_compress.matrix
+    cube_shm, cube, cube_spec = parallel.create_shared_array(matrix.shape, matrix.dtype)
+    try:
+        cube[...] = matrix
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_evaluate_shared_predictor, cube_spec, object_to_compress.name, predictor_name, codec, lean, parameters, trace, output_dir): predictor_name
+                for predictor_name in predictor_names_to_run
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                # Save individual results to a separate file
+                save_results_to_text(f"results_{result['predictor']}.txt", [result])
+                if store_path is not None:
+                    metrics_store.append_results(store_path, [result])
+    finally:
+        del cube
+        cube_shm.close()
+        cube_shm.unlink()
+    return [results[predictor_name] for predictor_name in predictor_names]
 
-        # Save results
-        results.append({
+def rank_predictors(object_to_compress, predictor_names, sample_fraction=None):
+    """
+    Ranks the predictors by their estimated compression ratio without encoding anything.
+    The sizes come from the residual histograms (see estimator), either of the whole cube
+    or of a random sample of tiles when sample_fraction is set.
+
+    Parameters:
+    object_to_compress (CompressionObject): The object containing the original matrix.
+    predictor_names (list): The names of the predictor functions to rank.
+    sample_fraction (float): The fraction of the tiles to sample (the whole cube by default).
+
+    Returns:
+    list: The estimated results of every predictor, best compression ratio first.
+    """
+    matrix = object_to_compress.matrix
+    original_size = matrix.size * 4  # 4 bytes for 32-bit integer representation, as in evaluate_predictor
+    ranking = []
+    for predictor_name in predictor_names:
+        predictor_function = getattr(predictor, predictor_name)
+        start_time = time.perf_counter()
+        if sample_fraction is None:
+            estimate = estimator.estimate_predictor(matrix, predictor_function)
+            bounds = (estimate["huffman_bytes"], estimate["huffman_bytes"])
+        else:
+            estimate = estimator.estimate_predictor_sampled(matrix, predictor_function, sample_fraction)
+            bounds = (estimate["upper_bytes"], estimate["lower_bytes"])
+        ranking.append({
             "predictor": predictor_name,
-            "mse": mse,
-            "compression_ratio": compression_ratio,
-            "compression_ratio_rle": compression_ratio_rle,
-            "time_to_predict_and_residual": compression_object.predict_and_residual_time,
-            "time_to_encode": compression_object.encode_time,
-            "time_to_encode_with_rle": compression_object.encode_with_rle_time,
-            "total_time_no_rle": compression_object.predict_and_residual_time + compression_object.encode_time,
-            "total_time_with_rle": compression_object.predict_and_residual_time + compression_object.encode_with_rle_time,
-            "compression_object": str(compression_object)
+            "estimated_compression_ratio": calculate_compression_ratio(original_size, estimate["huffman_bytes"]),
+            "estimated_compression_ratio_bounds": tuple(calculate_compression_ratio(original_size, size) for size in bounds),
+            "estimated_compression_ratio_rle": calculate_compression_ratio(original_size, estimate["rle_bytes"]) if "rle_bytes" in estimate else None,
+            "time_to_estimate": time.perf_counter() - start_time
         })
+    ranking.sort(key=lambda result: result["estimated_compression_ratio"], reverse=True)
+    return ranking
 
-        # Save individual results to a separate file
-        save_results_to_text(f"results_{predictor_name}.txt", [results[-1]])
+def sweep(file_paths, predictor_names, codecs=(entropy_coder.DEFAULT_CODEC,), store_path="metrics.csv", workers=None, lean=True, parameters=""):
+    """
+    Evaluates every predictor with every codec on every scene and records the metrics in a store.
+    The combinations already in the store are skipped, so an interrupted sweep resumes where it stopped
+    when run again with the same store.
+
+    Parameters:
+    file_paths (list): The cube files of the scenes (see upload_picture.load_cube).
+    predictor_names (list): The names of the predictor functions to evaluate.
+    codecs (tuple): The entropy coders to evaluate, "huffman", "rans" or "golomb_rice".
+    store_path (str): The path to the CSV metrics store.
+    workers (int): The number of worker processes (one per predictor by default).
+    lean (bool): Whether the workers release the intermediates of every stage (see evaluate_predictor).
+    parameters (str): A label of any other settings of the run, part of the key in the store.
+
+    Returns:
+    list: The results of the sweep, read back from the store.
+    """
+    for file_path in file_paths:
+        object_to_compress = upload_picture.load_cube(file_path)
+        for codec in codecs:
+            evaluate_predictors(object_to_compress, predictor_names, workers, codec, lean, store_path, parameters)
+        object_to_compress = None
+    return metrics_store.load_results(store_path)
+
+def main(workers=None, estimate=False, sample_fraction=None, codec=entropy_coder.DEFAULT_CODEC, lean=False, store_path=None, trace_path=None,
+         path_to_original_image=r'C:\Users\Amir\Downloads\PaviaU.mat', predictors=None, graphs=True, output_dir=None, **load_options):
+    """
+    Main function to run the compression analysis.
+    The predictors run concurrently, see evaluate_predictors, and encode with the entropy coder codec.
+    With lean set, every worker only keeps the input and the encoded streams of its cube in memory.
+    With store_path set, the metrics are also appended to that metrics store, and the predictors
+    already measured there are not run again.
+    With trace_path set, the stages of the loading and of every worker are written to that
+    Chrome trace JSON file (see instrumentation), on one timeline.
+    The cube is loaded from path_to_original_image with load_options (see upload_picture.load_cube),
+    and every predictor is evaluated unless predictors lists their names.
+    With output_dir set, the container file of every predictor is kept in that directory.
+
+    Returns:
+    list: The results of the evaluated predictors.
+    With estimate set, the predictors are only ranked by their estimated compression ratio
+    (see rank_predictors) and the full pipeline runs for the best one only.
+    """
+    # List of predictors to test
+    predictors = predictors or list(predictor_names.PREDICTORS)
+
+    recorded_trace = instrumentation.start() if trace_path else None
+
+    # Create the initial CompressionObject
+    object_to_compress = upload_picture.load_cube(path_to_original_image, **load_options)
+
+    if estimate:
+        ranking = rank_predictors(object_to_compress, predictors, sample_fraction)
+        for result in ranking:
+            low, high = result["estimated_compression_ratio_bounds"]
+            print(f"{result['predictor']}: estimated compression ratio {result['estimated_compression_ratio']:.3f} ({low:.3f} - {high:.3f})")
+        predictors = [ranking[0]["predictor"]]
+
+    results = evaluate_predictors(object_to_compress, predictors, workers, codec, lean, store_path, trace=trace_path is not None, output_dir=output_dir)
+    if recorded_trace is not None:
+        instrumentation.stop()
+        stages = recorded_trace.stages + [record for result in results for record in result.get("stages") or []]
+        instrumentation.save_chrome_trace(trace_path, stages)
 
     # Generate graphs
-    generate_graphs(results)
+    if graphs:
+        generate_graphs(results)
 
     print("Compression analysis completed. Results saved to files.")
+    return results
 
 if __name__ == "__main__":
     main()
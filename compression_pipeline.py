@@ -1,34 +1,34 @@
 import numpy as np
 import upload_picture
 import predictor
-import residual_image
-import huffman_encoder
-import huffman_decoder
+import entropy_coder
 import reconstruct_original
+import instrumentation
+import synthetic
 import time
 
 def create_object(path_to_original_image, use_random_matrix=True):
     """
-    Creates a CompressionObject from a random matrix or a .mat file.
+    Creates a CompressionObject from a small synthetic scene or a cube file (.mat, .npy or raw).
 
     Parameters:
-    path_to_original_image (str): Path to the .mat file containing the original image.
-    use_random_matrix (bool): Whether to use a random matrix instead of loading from a file.
+    path_to_original_image (str): Path to the cube file containing the original image.
+    use_random_matrix (bool): Whether to use a synthetic scene (see synthetic.py) instead of loading from a file.
   
     Returns:
     CompressionObject: The created CompressionObject.
     """
     if use_random_matrix:
-        # Create a random 3D cube
-        random_cube = np.random.randint(0, 256, (3, 2, 2), dtype=np.int16)  # 4x4x3 cube
+        # Create a small spectrally correlated, spatially smooth 8-bit cube
+        random_cube = synthetic.generate_cube((4, 8, 8), np.uint8, seed=np.random.randint(1 << 31))
         compression_object = upload_picture.CompressionObject(
             matrix=random_cube,
-            name="Random Cube",
+            name="Synthetic Cube",
             shape=random_cube.shape
         )
         return compression_object
     else:
-        return upload_picture.extract_matrix_from_mat(path_to_original_image)
+        return upload_picture.load_cube(path_to_original_image)
 
 
 def main():
@@ -37,6 +37,7 @@ def main():
     """
     path_to_original_image = r'C:\Users\Amir\Downloads\Indian_pines.mat'
     use_random_matrix = False  # Set to True to generate a random matrix or cube, False to load from a .mat file
+    codec = "huffman"  # Entropy coder of the encoded image, "huffman", "rans" or "golomb_rice"
    
     predictors = [
             ("previous_pixel_predictor", predictor.previous_pixel_predictor),
@@ -67,20 +68,15 @@ def main():
                 shape=object_to_compress.shape
             )
 
-            # Apply the predictor
-            compression_object = predictor_function(compression_object)
+            # Apply the predictor and create the residual image, keeping the predicted image for the results file
+            with instrumentation.stage("predict", compression_object.matrix.nbytes):
+                compression_object = predictor.predict_residual(compression_object, predictor_function, keep_prediction=True)
 
-            # Create the residual image
-            if predictor_name == "inter_band_predictor":
-                compression_object = residual_image.create_inter_band_residual(compression_object)
-            else:
-                compression_object = residual_image.create_residual_image(compression_object)
-
-            # Encode the image using Huffman encoding
-            compression_object = huffman_encoder.encode_image(compression_object)
+            # Encode the image using the chosen entropy coder ("huffman", "rans" or "golomb_rice")
+            compression_object = entropy_coder.encode_image(compression_object, codec)
 
             # Decode and reconstruct the image
-            compression_object = huffman_decoder.reconstruct_image(compression_object)
+            compression_object = entropy_coder.reconstruct_image(compression_object)
             compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, predictor_function)
 
             # Write the reconstructed matrix to the file
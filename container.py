@@ -0,0 +1,233 @@
+import json
+import struct
+import numpy as np
+import bitstream
+import entropy_coder
+import predictor
+import reconstruct_original
+import upload_picture
+
+# File layout: magic, version, header size, JSON header, then the sections listed in the header
+MAGIC = b'HSIC'
+VERSION = 1
+SECTIONS = ("untouched_data", "table", "band_index", "sync_index", "payload")
+
+def save(compression_object, file_path):
+    """
+    Saves an encoded CompressionObject to a binary container file.
+
+    The header holds the shape, dtype, predictor name, decompression key and entropy coder
+    together with the size of every section. The sections are the untouched data, the table
+    of the entropy coder (the canonical Huffman table or the rANS frequencies), a per-band
+    index with the bit offset of every residual band, the sync index of the encoded image
+    and the packed payload itself.
+
+    Parameters:
+    compression_object (CompressionObject): The object encoded by entropy_coder.encode_image.
+    file_path (str): The path of the container file to write.
+
+    Returns:
+    int: The size of the written file in bytes.
+    """
+    if compression_object.encoded_image is None:
+        raise ValueError("Encoded image is not set in the CompressionObject.")
+
+    untouched_data = np.ascontiguousarray(compression_object.untouched_data)
+    table = entropy_coder.encoded_image_table(compression_object)
+    sections = {
+        "untouched_data": untouched_data.astype(untouched_data.dtype.newbyteorder('<')).tobytes(),
+        "table": table.to_bytes(),  # The table of whichever entropy coder is recorded in "codec"
+        "band_index": np.asarray(compression_object.encoded_image_band_index).astype('<u8').tobytes(),
+        "sync_index": np.asarray(compression_object.encoded_image_index).astype('<u8').tobytes(),
+        "payload": np.asarray(compression_object.encoded_image, dtype=np.uint8).tobytes()
+    }
+    residual_shape = list(compression_object.shape)
+    shape = list(residual_shape)
+    if compression_object.predictor_name == "inter_band_predictor":
+        shape[0] += 1  # The first band is kept in the untouched data
+    header = {
+        "name": compression_object.name,
+        "shape": shape,
+        "residual_shape": residual_shape,
+        "dtype": table.dtype.str,
+        "codec": table.codec,
+        "predictor_name": compression_object.predictor_name,
+        "decompression_key": compression_object.decompression_key,
+        "band_predictors": compression_object.band_predictors,
+        "untouched_dtype": untouched_data.dtype.str,
+        "untouched_shape": list(untouched_data.shape),
+        "bit_length": int(compression_object.encoded_image_bit_length),
+        "sync_interval": bitstream.SYNC_INTERVAL,
+        "sections": {name: len(sections[name]) for name in SECTIONS}
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    with open(file_path, "wb") as file:
+        file.write(MAGIC + struct.pack('<BI', VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        for name in SECTIONS:
+            file.write(sections[name])
+        return file.tell()
+
+def read_header(file):
+    """
+    Reads the header of an open container file.
+
+    Parameters:
+    file (file): The container file opened in binary mode.
+
+    Returns:
+    dict: The header, with the absolute file offset of every section added under "offsets".
+    """
+    file.seek(0)
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a compressed hyperspectral image container.")
+    version, header_size = struct.unpack('<BI', file.read(5))
+    if version != VERSION:
+        raise ValueError(f"Unsupported container version: {version}")
+    header = json.loads(file.read(header_size).decode('utf-8'))
+    offset = len(MAGIC) + 5 + header_size
+    header["offsets"] = {}
+    for name in SECTIONS:
+        header["offsets"][name] = offset
+        offset += header["sections"][name]
+    return header
+
+def _read_section(file, header, name, start=0, size=None):
+    """
+    Reads size bytes (the whole section by default) from start within a section.
+    """
+    if size is None:
+        size = header["sections"][name] - start
+    file.seek(header["offsets"][name] + start)
+    return file.read(size)
+
+def _read_index(file, header, name, first, stop):
+    """
+    Reads the entries [first, stop) of a np.uint64 index section.
+    """
+    data = _read_section(file, header, name, first * 8, max(stop - first, 0) * 8)
+    return np.frombuffer(data, dtype='<u8').astype(np.uint64)
+
+def read_untouched_data(file, header):
+    """
+    Reads the untouched data section of an open container file.
+
+    Parameters:
+    file (file): The container file opened in binary mode.
+    header (dict): The header returned by read_header.
+
+    Returns:
+    np.array: The untouched data in the native byte order.
+    """
+    untouched_dtype = np.dtype(header["untouched_dtype"])
+    untouched_data = np.frombuffer(_read_section(file, header, "untouched_data"), dtype=untouched_dtype)
+    return untouched_data.astype(untouched_dtype.newbyteorder('=')).reshape(header["untouched_shape"])
+
+def decode_bands(file, header, band_start, band_stop):
+    """
+    Decodes the residual bands [band_start, band_stop) of an open container file,
+    reading only the part of the payload that holds them.
+
+    Parameters:
+    file (file): The container file opened in binary mode.
+    header (dict): The header returned by read_header.
+    band_start (int): The first residual band to decode.
+    band_stop (int): One past the last residual band to decode.
+
+    Returns:
+    np.array: The decoded residual bands.
+    """
+    residual_shape = tuple(header["residual_shape"])
+    band_size = int(np.prod(residual_shape[1:]))
+    residual = np.empty((band_stop - band_start,) + residual_shape[1:], dtype=np.dtype(header["dtype"]))
+    if residual.size == 0:
+        return residual
+
+    first_symbol = band_start * band_size
+    stop_symbol = band_stop * band_size
+    first_bit, stop_bit = _read_index(file, header, "band_index", band_start, band_stop + 1)[[0, -1]]
+
+    interval = header["sync_interval"]
+    codec = header.get("codec", "huffman")
+    if codec != "huffman":
+        # Every band starts a lane of its own, so the lanes of the range are whole
+        band_lanes = entropy_coder.lane_counts(codec, (1,) + residual_shape[1:], interval).size
+        lane_offsets = _read_index(file, header, "sync_index", band_start * band_lanes, band_stop * band_lanes)
+        lane_counts = entropy_coder.lane_counts(codec, residual.shape, interval)
+    else:
+        # Lanes start at the first band and at every sync point inside the range
+        first_sync = -(-first_symbol // interval)
+        stop_sync = -(-stop_symbol // interval)
+        sync_offsets = _read_index(file, header, "sync_index", first_sync, stop_sync)
+        sync_symbols = np.arange(first_sync, stop_sync) * interval
+        if sync_symbols.size and sync_symbols[0] == first_symbol:
+            sync_symbols, sync_offsets = sync_symbols[1:], sync_offsets[1:]
+        lane_symbols = np.concatenate(([first_symbol], sync_symbols))
+        lane_offsets = np.concatenate(([first_bit], sync_offsets))
+        lane_counts = np.diff(np.append(lane_symbols, stop_symbol))
+
+    # Only the bytes holding the bits of the range are read
+    first_byte = int(first_bit) // 8
+    payload = np.frombuffer(_read_section(file, header, "payload", first_byte, (int(stop_bit) + 7) // 8 - first_byte), dtype=np.uint8)
+    table = entropy_coder.table_from_bytes(_read_section(file, header, "table"), codec)
+    entropy_coder.decode_lanes(payload, table, lane_offsets - np.uint64(first_byte * 8), lane_counts, residual.reshape(-1))
+    return residual
+
+def load(file_path, band_start=0, band_stop=None):
+    """
+    Loads a container file and reconstructs the original bands [band_start, band_stop).
+    Only the residual bands needed for that range are read and decoded; with the
+    inter-band predictor that is every band up to band_stop.
+
+    Parameters:
+    file_path (str): The path of the container file.
+    band_start (int): The first band to reconstruct.
+    band_stop (int): One past the last band to reconstruct (all the bands by default).
+
+    Returns:
+    CompressionObject: An object with the decoded residual image, the untouched data and
+                       the reconstructed bands in reconstructed_matrix.
+    """
+    with open(file_path, "rb") as file:
+        header = read_header(file)
+        bands = header["shape"][0]
+        if band_stop is None:
+            band_stop = bands
+        if not 0 <= band_start < band_stop <= bands:
+            raise ValueError(f"Invalid band range [{band_start}, {band_stop}) for {bands} bands.")
+
+        untouched_data = read_untouched_data(file, header)
+
+        predictor_name = header["predictor_name"]
+        band_predictors = header.get("band_predictors")
+        inter_band = predictor_name == "inter_band_predictor"
+        first_band = band_start
+        if inter_band:
+            # Every band depends on all the bands before it
+            residual = decode_bands(file, header, 0, band_stop - 1)
+        elif band_predictors is not None:
+            # Inter-band bands depend on the bands before them, back to an intra-band one
+            while band_predictors[first_band] == "inter_band_predictor":
+                first_band -= 1
+            residual = decode_bands(file, header, first_band, band_stop)
+            offsets = reconstruct_original.adaptive_untouched_offsets(band_predictors, *residual.shape[1:])
+            untouched_data = untouched_data[offsets[first_band]:offsets[band_stop]]
+            band_predictors = band_predictors[first_band:band_stop]
+        else:
+            residual = decode_bands(file, header, band_start, band_stop)
+            untouched_data = untouched_data[band_start:band_stop]
+
+    compression_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=residual.shape)
+    compression_object.predictor_name = predictor_name
+    compression_object.decompression_key = header["decompression_key"]
+    compression_object.band_predictors = band_predictors
+    compression_object.untouched_data = untouched_data
+    compression_object.residual_image = residual
+    compression_object.reconstructed_residual_image = residual
+    compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, getattr(predictor, predictor_name))
+    if inter_band:
+        compression_object.reconstructed_matrix = compression_object.reconstructed_matrix[band_start:band_stop]
+    else:
+        compression_object.reconstructed_matrix = compression_object.reconstructed_matrix[band_start - first_band:]
+    return compression_object
@@ -0,0 +1,231 @@
+import time
+import numpy as np
+import bitstream
+import golomb_rice
+import huffman_decoder
+import huffman_encoder
+import instrumentation
+import rans
+
+# Entropy coders of the residual image by the name recorded with the encoded data:
+# the table class, the encoder, the decoding table builder and the lane decoder
+CODECS = {
+    "huffman": (huffman_encoder.HuffmanTable, huffman_encoder.encode_symbols, huffman_decoder.build_decode_table, huffman_decoder.decode_lanes),
+    "rans": (rans.RansTable, rans.encode_symbols, rans.build_decode_table, rans.decode_lanes),
+    "golomb_rice": (golomb_rice.GolombRiceModel, golomb_rice.encode_symbols, golomb_rice.build_decode_table, golomb_rice.decode_lanes)
+}
+# The CompressionObject attribute holding the table of every entropy coder
+TABLE_ATTRIBUTES = {"huffman": "huffman_table", "rans": "rans_table", "golomb_rice": "golomb_rice_model"}
+DEFAULT_CODEC = "huffman"
+
+def _check_codec(codec):
+    """
+    Fails on an unknown entropy coder name.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown entropy coder: {codec}. Choose one of {', '.join(CODECS)}.")
+
+def table_from_bytes(data, codec=DEFAULT_CODEC):
+    """
+    Rebuilds the table of an entropy coder from its to_bytes serialization.
+
+    Parameters:
+    data (bytes): The serialized table.
+    codec (str): The name of the entropy coder that wrote the table.
+
+    Returns:
+    HuffmanTable, RansTable or GolombRiceModel: The table.
+    """
+    _check_codec(codec)
+    return CODECS[codec][0].from_bytes(data)
+
+def encode_residual(residual, codec=DEFAULT_CODEC, interval=bitstream.SYNC_INTERVAL):
+    """
+    Encodes a residual image with an entropy coder.
+
+    Parameters:
+    residual (np.array): The (bands, rows, cols) residual image.
+    codec (str): The name of the entropy coder.
+    interval (int): The number of symbols between two sync points.
+
+    Returns:
+    tuple: The table, the packed np.uint8 stream, its length in bits, the bit offset of every
+           sync point and the bit offset of every band followed by the total length.
+    """
+    _check_codec(codec)
+    residual = np.asarray(residual)
+    return CODECS[codec][1](residual.reshape(-1), residual.shape, interval)
+
+def lane_counts(codec, shape, interval=bitstream.SYNC_INTERVAL):
+    """
+    Computes the number of symbols between every sync point of a stream and the next one.
+    Huffman streams have a sync point every interval symbols, rANS streams every rans.LANE_INTERVAL
+    symbols restarting at every band, and Golomb-Rice streams have one per band.
+
+    Parameters:
+    codec (str): The name of the entropy coder.
+    shape (tuple): The shape of the encoded residual image.
+    interval (int): The number of symbols between two sync points.
+
+    Returns:
+    np.array: The number of symbols of every lane.
+    """
+    _check_codec(codec)
+    count = int(np.prod(shape))
+    band_size = count // shape[0] if count else 0
+    if codec == "rans":
+        return rans.lane_counts(shape[0], band_size)
+    if codec == "golomb_rice":
+        return np.full(shape[0] if band_size else 0, band_size, dtype=np.int64)
+    counts = np.full(-(-count // interval), interval, dtype=np.int64)
+    if count:
+        counts[-1] = count - (counts.size - 1) * interval
+    return counts
+
+def decode_lanes(data, table, lane_offsets, lane_counts, out):
+    """
+    Decodes independent lanes of a stream with the entropy coder of its table.
+
+    Parameters:
+    data (np.array): The packed np.uint8 stream.
+    table (HuffmanTable, RansTable or GolombRiceModel): The table of the stream.
+    lane_offsets (np.array): The bit offset where every lane starts.
+    lane_counts (np.array): The number of symbols in every lane.
+    out (np.array): Flat array the lanes are written into, one after the other.
+    """
+    _, _, build_decode_table, decode = CODECS[table.codec]
+    with instrumentation.stage("decode", out.nbytes):
+        decode(data, build_decode_table(table), lane_offsets, lane_counts, out)
+
+def decode_residual(data, table, sync_index, residual, interval=bitstream.SYNC_INTERVAL):
+    """
+    Decodes a whole stream written by encode_residual into a preallocated residual image.
+
+    Parameters:
+    data (np.array): The packed np.uint8 stream.
+    table (HuffmanTable, RansTable or GolombRiceModel): The table of the stream.
+    sync_index (np.array): The bit offset of every sync point.
+    residual (np.array): The contiguous residual image to write the symbols into.
+    interval (int): The number of symbols between two sync points.
+    """
+    counts = lane_counts(table.codec, residual.shape, interval)
+    if len(sync_index) != counts.size:
+        raise ValueError("The sync offsets do not match the number of symbols.")
+    decode_lanes(data, table, sync_index, counts, residual.reshape(-1))
+
+def decode_residual_bands(data, table, sync_index, shape, band_start, band_stop, interval=bitstream.SYNC_INTERVAL):
+    """
+    Decodes only the bands [band_start, band_stop) of a stream written by encode_residual.
+    rANS and Golomb-Rice lanes never cross a band, so only the lanes of the range are decoded.
+    Huffman lanes are decoded from the sync point before band_start, which adds less than
+    interval symbols.
+
+    Parameters:
+    data (np.array): The packed np.uint8 stream.
+    table (HuffmanTable, RansTable or GolombRiceModel): The table of the stream.
+    sync_index (np.array): The bit offset of every sync point.
+    shape (tuple): The shape of the whole encoded residual image.
+    band_start (int): The first band to decode.
+    band_stop (int): One past the last band to decode.
+    interval (int): The number of symbols between two sync points.
+
+    Returns:
+    np.array: The decoded residual bands.
+    """
+    shape = tuple(shape)
+    residual = np.empty((band_stop - band_start,) + shape[1:], dtype=table.dtype)
+    if residual.size == 0:
+        return residual
+    sync_index = np.asarray(sync_index, dtype=np.uint64)
+    if table.codec != "huffman":
+        band_lanes = lane_counts(table.codec, (1,) + shape[1:], interval).size
+        offsets = sync_index[band_start * band_lanes:band_stop * band_lanes]
+        decode_lanes(data, table, offsets, lane_counts(table.codec, residual.shape, interval), residual.reshape(-1))
+        return residual
+
+    band_size = residual[0].size
+    first_symbol, stop_symbol = band_start * band_size, band_stop * band_size
+    first_lane, stop_lane = first_symbol // interval, -(-stop_symbol // interval)
+    lane_starts = np.arange(first_lane, stop_lane, dtype=np.int64) * interval
+    counts = np.minimum(lane_starts + interval, stop_symbol) - lane_starts
+    decoded = np.empty(stop_symbol - lane_starts[0], dtype=table.dtype)
+    decode_lanes(data, table, sync_index[first_lane:stop_lane], counts, decoded)
+    residual.reshape(-1)[:] = decoded[first_symbol - lane_starts[0]:]
+    return residual
+
+def encoded_image_table(compression_object):
+    """
+    Returns the table of the encoded image (without RLE) of a CompressionObject.
+    """
+    return getattr(compression_object, TABLE_ATTRIBUTES[compression_object.codec or DEFAULT_CODEC])
+
+def encode_image(compression_object, codec=DEFAULT_CODEC, rle=True):
+    """
+    Encodes a hyperspectral image with the chosen entropy coder, and with Huffman coding
+    and RLE for comparison. The name of the entropy coder is recorded in codec, so that
+    reconstruct_image and container files decode with the same one.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the residual image to encode.
+    codec (str): The entropy coder of the encoded image, "huffman", "rans" or "golomb_rice".
+    rle (bool): Whether to also encode the RLE comparison stream.
+
+    Returns:
+    CompressionObject: The updated CompressionObject with the encoded images.
+    """
+    _check_codec(codec)
+    if codec == "huffman" and rle:
+        return huffman_encoder.encode_image(compression_object)
+
+    image = compression_object.residual_image
+    if image is None:
+        raise ValueError("Residual image is not set in the CompressionObject.")
+
+    start_time = time.perf_counter()
+    table, encoded_image, bit_length, sync_index, band_index = encode_residual(image, codec)
+    compression_object.codec = codec
+    setattr(compression_object, TABLE_ATTRIBUTES[codec], table)
+    compression_object.encoded_image = encoded_image
+    compression_object.encoded_image_bit_length = bit_length
+    compression_object.encoded_image_index = sync_index
+    compression_object.encoded_image_band_index = band_index
+    compression_object.encode_time = time.perf_counter() - start_time
+
+    # The RLE stream stays Huffman coded
+    if rle:
+        compression_object = huffman_encoder.encode_rle(compression_object)
+    compression_object.release("residual_image")
+    return compression_object
+
+def reconstruct_image(compression_object):
+    """
+    Decodes the encoded images of a CompressionObject with the entropy coder recorded in codec,
+    and updates it with the reconstructed residual images.
+    A lean object gets the decoded residual back as its residual image, for the reconstruction,
+    and decodes its RLE stream only on request.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the encoded images.
+
+    Returns:
+    CompressionObject: The updated CompressionObject with the reconstructed residual images.
+    """
+    table = encoded_image_table(compression_object)
+    if compression_object.encoded_image is None or table is None:
+        raise ValueError("Encoded image or its table is not set in the CompressionObject.")
+
+    start_time = time.perf_counter()
+    decoded_data = np.empty(compression_object.shape, dtype=table.dtype)
+    decode_residual(compression_object.encoded_image, table, compression_object.encoded_image_index, decoded_data)
+    compression_object.decode_time = time.perf_counter() - start_time
+    if compression_object.lean:
+        compression_object.residual_image = compression_object.reconstructed_residual_image = decoded_data
+        return compression_object
+
+    compression_object.decoded_data = decoded_data
+    if compression_object.encoded_image_with_rle is not None:
+        compression_object = huffman_decoder.decode_rle(compression_object)
+
+    compression_object.reconstructed_residual_image = compression_object.decoded_data
+    compression_object.reconstructed_rle_residual_image = compression_object.decoded_rle_data
+    return compression_object
@@ -0,0 +1,157 @@
+import numpy as np
+from statistics import NormalDist
+import huffman_encoder
+import predictor
+import upload_picture
+
+# Default number of rows of the strips drawn by the sampled estimate
+SAMPLE_STRIP_ROWS = 8
+
+def huffman_bits(frequencies):
+    """
+    Computes the exact size in bits of the Huffman coded symbols from their frequencies,
+    without building codes or bitstreams.
+
+    Parameters:
+    frequencies (np.array): The frequency of every symbol.
+
+    Returns:
+    int: The number of bits the encoder packs for these symbols.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.int64)
+    return int(np.dot(frequencies, huffman_encoder.huffman_code_lengths(frequencies)))
+
+def entropy_bits(frequencies):
+    """
+    Computes the Shannon entropy bound in bits of symbols with the given frequencies.
+
+    Parameters:
+    frequencies (np.array): The frequency of every symbol.
+
+    Returns:
+    float: The total entropy of the symbols in bits.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    frequencies = frequencies[frequencies > 0]
+    if frequencies.size == 0:
+        return 0.0
+    return float(-np.dot(frequencies, np.log2(frequencies / frequencies.sum())))
+
+def table_bytes(symbols):
+    """
+    Computes the size of a serialized Huffman table (HuffmanTable.to_bytes) over the given symbols.
+    """
+    symbols = np.asarray(symbols)
+    return 1 + len(symbols.dtype.newbyteorder('<').str) + 4 + symbols.size * (symbols.dtype.itemsize + 1)
+
+def estimate_encoded_size(residual):
+    """
+    Computes the sizes huffman_encoder.encode_image would produce for a residual image
+    from its histograms only.
+
+    Parameters:
+    residual (np.array): The residual image.
+
+    Returns:
+    dict: The entropy bound ("entropy_bits"), the packed Huffman stream ("huffman_bits",
+          "huffman_bytes"), its table ("table_bytes") and the packed RLE stream ("rle_bits", "rle_bytes").
+    """
+    flattened_residual = np.asarray(residual).reshape(-1)
+    symbols, frequencies = huffman_encoder.calculate_statistics(flattened_residual)
+    bits = huffman_bits(frequencies)
+
+    # RLE codes the run values and the run lengths with a table each
+    values, counts = huffman_encoder.run_length_encode(flattened_residual)
+    rle_bits = huffman_bits(huffman_encoder.calculate_statistics(values)[1]) + huffman_bits(huffman_encoder.calculate_statistics(counts)[1])
+    return {
+        "entropy_bits": entropy_bits(frequencies),
+        "huffman_bits": bits,
+        "huffman_bytes": (bits + 7) // 8,
+        "table_bytes": table_bytes(symbols),
+        "rle_bits": rle_bits,
+        "rle_bytes": (rle_bits + 7) // 8
+    }
+
+def _predict_residual(matrix, predictor_function):
+    """
+    Runs the fused predictor and returns the residual image, as the compression pipeline does.
+    """
+    compression_object = upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+    return predictor.predict_residual(compression_object, predictor_function).residual_image
+
+def estimate_predictor(matrix, predictor_function):
+    """
+    Estimates the encoded sizes of a cube with a predictor without encoding it.
+
+    Parameters:
+    matrix (np.array): The (bands, rows, cols) cube.
+    predictor_function (function): The predictor to apply.
+
+    Returns:
+    dict: The sizes from estimate_encoded_size.
+    """
+    return estimate_encoded_size(_predict_residual(matrix, predictor_function))
+
+def estimate_predictor_sampled(matrix, predictor_function, sample_fraction=0.1, strip_rows=SAMPLE_STRIP_ROWS, confidence=0.95, seed=None):
+    """
+    Estimates the Huffman coded size of a cube with a predictor from a random sample of its
+    row strips. Every strip runs through all the bands and is predicted together with the row
+    above it, so the neighbor and inter-band predictors give the same residuals as on the whole
+    cube. The first pixel and fixed value predictors use the values of the strip instead.
+
+    The sampled residuals are pooled into one histogram, whose Huffman code lengths stand in for
+    the table of the whole cube. Every sampled strip is costed under that code, and the bits per
+    pixel are extrapolated to the cube with a normal confidence interval over the strips
+    (with the finite population correction).
+
+    Parameters:
+    matrix (np.array): The (bands, rows, cols) cube.
+    predictor_function (function): The predictor to apply.
+    sample_fraction (float): The fraction of the strips to sample.
+    strip_rows (int): The number of rows of a strip.
+    confidence (float): The confidence level of the bounds.
+    seed (int): The seed of the random strip choice.
+
+    Returns:
+    dict: The estimated Huffman stream size in bytes ("huffman_bytes") with its lower and upper
+          bounds ("lower_bytes", "upper_bytes"), the estimated bits per pixel and the number of sampled strips.
+    """
+    bands, rows, cols = matrix.shape
+    strip_starts = range(0, rows, strip_rows)
+    sample_size = min(max(int(round(sample_fraction * len(strip_starts))), 2), len(strip_starts))
+    chosen = np.random.default_rng(seed).choice(len(strip_starts), size=sample_size, replace=False)
+
+    strip_statistics = []
+    for index in chosen:
+        row_start = strip_starts[index]
+        first_row = max(row_start - 1, 0)  # The row above is only used for the prediction
+        strip = np.asarray(matrix[:, first_row:row_start + strip_rows])
+        residual = _predict_residual(strip, predictor_function)[:, row_start - first_row:]
+        strip_statistics.append(huffman_encoder.calculate_statistics(residual.reshape(-1)))
+
+    # Code lengths of the pooled sample, looked up for every strip
+    symbols, frequencies = huffman_encoder.merge_statistics(strip_statistics)
+    lengths = huffman_encoder.huffman_code_lengths(frequencies)
+    order = np.argsort(symbols, kind='stable')
+    strip_bits = np.array([
+        np.dot(lengths[order[np.searchsorted(symbols, strip_symbols, sorter=order)]], strip_frequencies)
+        for strip_symbols, strip_frequencies in strip_statistics
+    ], dtype=np.float64)
+    strip_pixels = np.array([frequencies.sum() for _, frequencies in strip_statistics], dtype=np.float64)
+
+    # Ratio estimate of the bits per pixel and its standard error
+    bits_per_pixel = strip_bits.sum() / strip_pixels.sum()
+    mean_pixels = strip_pixels.mean()
+    deviations = (strip_bits - bits_per_pixel * strip_pixels) / mean_pixels
+    variance = deviations.var(ddof=1) if sample_size > 1 else 0.0
+    standard_error = np.sqrt((1 - sample_size / len(strip_starts)) * variance / sample_size)
+    margin = NormalDist().inv_cdf((1 + confidence) / 2) * standard_error
+
+    total_pixels = (bands - 1 if predictor_function.__name__ == "inter_band_predictor" else bands) * rows * cols
+    return {
+        "huffman_bytes": bits_per_pixel * total_pixels / 8,
+        "lower_bytes": max(bits_per_pixel - margin, 0) * total_pixels / 8,
+        "upper_bytes": (bits_per_pixel + margin) * total_pixels / 8,
+        "bits_per_pixel": bits_per_pixel,
+        "sampled_strips": sample_size
+    }
@@ -0,0 +1,413 @@
+import struct
+import numpy as np
+import bitstream
+import huffman_encoder
+import instrumentation
+
+# Number of magnitude levels of each causal neighbor, the contexts are every pair of levels
+CONTEXT_LEVELS = 8
+CONTEXTS = CONTEXT_LEVELS * CONTEXT_LEVELS
+# Initial accumulated magnitude and count of every context, and the count at which both are halved
+INITIAL_MAGNITUDE = 4
+RESET = 64
+# Quotients from QUOTIENT_LIMIT on are escaped: the unary code of QUOTIENT_LIMIT is followed by the raw value
+QUOTIENT_LIMIT = 32
+# Number of (anti-diagonal, context) statistics the encoder tabulates at a time, bounds the temporary memory
+STEP_TABLE_SIZE = 1 << 20
+# Number of consecutive remainders joined into one code before packing
+REMAINDER_GROUP = 8
+# Number of pixels coded at a time, whole bands
+ENCODE_CHUNK_PIXELS = 1 << 20
+
+# Class to represent the adaptive Golomb-Rice model, which holds no statistics, only the sample type
+# and the band size that the contexts are laid out on
+class GolombRiceModel:
+    # Name of the entropy coder, recorded with the streams coded with this model
+    codec = "golomb_rice"
+
+    def __init__(self, dtype, rows, cols):
+        """
+        Initialize the GolombRiceModel.
+
+        Parameters:
+        dtype (np.dtype): The dtype of the residual values.
+        rows (int): The number of rows of a band.
+        cols (int): The number of columns of a band.
+        """
+        self.dtype = np.dtype(dtype)
+        self.rows = int(rows)
+        self.cols = int(cols)
+
+    def __str__(self):
+        return f"GolombRiceModel({self.dtype}, {self.rows}x{self.cols} bands, {CONTEXTS} contexts)"
+
+    def to_bytes(self):
+        """
+        Serializes the model as its dtype and band size.
+
+        Returns:
+        bytes: The serialized model.
+        """
+        dtype = self.dtype.newbyteorder('<').str.encode('ascii')
+        return struct.pack('<B', len(dtype)) + dtype + struct.pack('<II', self.rows, self.cols)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds a model serialized with to_bytes.
+
+        Parameters:
+        data (bytes): The serialized model.
+
+        Returns:
+        GolombRiceModel: The model.
+        """
+        dtype_length = data[0]
+        dtype = np.dtype(data[1:1 + dtype_length].decode('ascii'))
+        rows, cols = struct.unpack_from('<II', data, 1 + dtype_length)
+        return cls(dtype.newbyteorder('='), rows, cols)
+
+def wavefront_layout(rows, cols):
+    """
+    Orders the pixels of a band by anti-diagonal (row + col), then by row. The left and
+    upper neighbors of every pixel come in earlier anti-diagonals, so a whole anti-diagonal
+    can be coded at once.
+
+    Parameters:
+    rows (int): The number of rows of a band.
+    cols (int): The number of columns of a band.
+
+    Returns:
+    tuple: The flat (row * cols + col) index of every pixel in coding order, the coding position
+           of the left and upper neighbor of every pixel (rows * cols where there is none),
+           and the first coding position of every anti-diagonal followed by rows * cols.
+    """
+    r, c = np.divmod(np.arange(rows * cols), cols)
+    order = np.lexsort((r, r + c))
+    position = np.empty(rows * cols + 1, dtype=np.int64)
+    position[order] = np.arange(rows * cols)
+    position[-1] = rows * cols
+    r, c = r[order], c[order]
+    left = position[np.where(c > 0, order - 1, -1)]
+    up = position[np.where(r > 0, order - cols, -1)]
+    step_starts = np.searchsorted(r + c, np.arange(rows + cols))
+    return order, left, up, step_starts
+
+# Context level of the magnitudes up to the first one of the top level: their bit length,
+# at most CONTEXT_LEVELS - 1
+_LEVEL_LIMIT = 1 << (CONTEXT_LEVELS - 2)
+_LEVELS = np.minimum(np.frexp(np.arange(_LEVEL_LIMIT + 1, dtype=np.float64))[1], CONTEXT_LEVELS - 1).astype(np.uint8)
+
+def _zigzag(values):
+    """
+    Maps signed residuals to non-negative ones as huffman_encoder.zigzag_encode does, in the
+    unsigned integer of the same width.
+    """
+    unsigned = np.dtype(f"u{values.dtype.itemsize}")
+    if np.issubdtype(values.dtype, np.signedinteger):
+        return ((values << 1) ^ (values >> (values.dtype.itemsize * 8 - 1))).view(unsigned)
+    return values.astype(unsigned, copy=False)
+
+def _levels(magnitude):
+    """
+    Quantizes residual magnitudes to their context level, their bit length (at most CONTEXT_LEVELS - 1).
+    """
+    return _LEVELS[np.minimum(magnitude, _LEVEL_LIMIT)]
+
+def _contexts(left_level, up_level):
+    """
+    Combines the levels of the left and upper residuals into a context.
+    """
+    return left_level * np.uint8(CONTEXT_LEVELS) + up_level
+
+def _rice_parameters(magnitudes, counts, context_index, max_parameter):
+    """
+    Picks the Rice parameter of every context, the smallest k with counts << k >= magnitudes.
+    """
+    magnitude = magnitudes.reshape(-1)[context_index]
+    count = counts.reshape(-1)[context_index]
+    parameter = np.frexp(np.maximum(magnitude - 1, 0) // count)[1]
+    return np.minimum(parameter, max_parameter)
+
+def _halve_full_contexts(magnitudes, counts):
+    """
+    Halves the statistics of the contexts that reach RESET.
+    """
+    reset = counts >= RESET
+    magnitudes >>= reset
+    counts >>= reset
+
+def _update_contexts(magnitudes, counts, context_index, values):
+    """
+    Adds the magnitudes of a step to the statistics of their contexts and halves the
+    statistics of the contexts that reach RESET.
+    """
+    magnitudes += np.bincount(context_index.reshape(-1), weights=values.reshape(-1), minlength=magnitudes.size).astype(np.int64).reshape(magnitudes.shape)
+    counts += np.bincount(context_index.reshape(-1), minlength=counts.size).reshape(counts.shape)
+    _halve_full_contexts(magnitudes, counts)
+
+def _encoder_parameters(contexts, magnitude, step_starts, max_parameter):
+    """
+    Picks the Rice parameter of every residual of a (bands, band_size) image in coding order,
+    from the statistics of its context as they were before its anti-diagonal.
+    The encoder knows every residual up front, so the statistics that every anti-diagonal adds
+    are counted at once, and only the small per-context statistics are updated one anti-diagonal
+    at a time.
+    """
+    bands, band_size = contexts.shape
+    steps = step_starts.size - 1
+    parameters = np.empty((bands, band_size), dtype=np.uint8)
+    group = min(bands, max(1, STEP_TABLE_SIZE // (steps * CONTEXTS)))
+    # Index of the (anti-diagonal, band) statistics of every residual of a group of bands
+    step_keys = np.repeat(np.arange(steps) * (group * CONTEXTS), np.diff(step_starts)) + np.arange(group)[:, None] * CONTEXTS
+    for first_band in range(0, bands, group):
+        last_band = min(bands, first_band + group)
+        table_size = steps * group * CONTEXTS
+        key = (step_keys[:last_band - first_band] + contexts[first_band:last_band]).reshape(-1)
+        # The magnitudes and counts that every anti-diagonal adds to every context
+        step_statistics = np.stack((
+            np.bincount(key, weights=magnitude[first_band:last_band].reshape(-1), minlength=table_size).astype(np.int64),
+            np.bincount(key, minlength=table_size)
+        )).reshape(2, steps, group, CONTEXTS)
+
+        # The statistics before every anti-diagonal
+        magnitudes, counts = statistics = np.empty((2, steps, group, CONTEXTS), dtype=np.int64)
+        magnitudes[0] = INITIAL_MAGNITUDE
+        counts[0] = 1
+        reset = np.empty((group, CONTEXTS), dtype=np.int64)
+        for step in range(1, steps):
+            current = np.add(statistics[:, step - 1], step_statistics[:, step - 1], out=statistics[:, step])
+            # The contexts that reach RESET are halved
+            np.greater_equal(current[1], RESET, out=reset, casting='unsafe')
+            np.right_shift(current, reset, out=current)
+        if key.size < magnitudes.size:
+            # Short anti-diagonals leave most statistics unused
+            parameters[first_band:last_band] = _rice_parameters(magnitudes, counts, key, max_parameter).reshape(-1, band_size)
+        else:
+            parameters[first_band:last_band] = _rice_parameters(magnitudes, counts, slice(None), max_parameter).reshape(-1)[key].reshape(-1, band_size)
+    return parameters
+
+def _unary_words(quotients):
+    """
+    Packs the unary codes (q ones and a zero) of the quotients of every band into 64-bit codes.
+
+    Returns:
+    tuple: The codes and lengths of every band, and the number of bits of every band.
+    """
+    bands = quotients.shape[0]
+    code_ends = np.cumsum(quotients + 1, axis=1, dtype=np.int64)
+    band_bits = code_ends[:, -1]
+    # Every band starts on a word of its own, its last word only holds its last bits
+    band_words = (band_bits + 63) // 64
+    word_starts = np.cumsum(band_words) - band_words
+    bits = np.ones(int(band_words.sum()) * 64, dtype=np.uint8)
+    bits[(code_ends - 1 + (word_starts * 64)[:, None]).reshape(-1)] = 0
+    words = np.packbits(bits).view('>u8').astype(np.uint64)
+    lengths = np.full(words.size, 64, dtype=np.int64)
+    last_words = word_starts + band_words - 1
+    lengths[last_words] = band_bits - (band_words - 1) * 64
+    words[last_words] >>= (64 - lengths[last_words]).astype(np.uint64)
+    return [(words[start:start + count], lengths[start:start + count]) for start, count in zip(word_starts, band_words)], band_bits
+
+def _remainder_codes(remainders, remainder_lengths):
+    """
+    Joins every REMAINDER_GROUP remainders of every band into one code where they fit in 64 bits.
+    The groups that do not fit, the ones with escaped values, are kept as they are.
+
+    Returns:
+    tuple: The codes and lengths of all the bands, one band after the other, and the number of codes of every band.
+    """
+    bands, band_size = remainders.shape
+    # Empty remainders pad every band to whole groups
+    padding = -band_size % REMAINDER_GROUP
+    if padding:
+        remainders = np.pad(remainders, ((0, 0), (0, padding)))
+        remainder_lengths = np.pad(remainder_lengths, ((0, 0), (0, padding)))
+    remainders = remainders.reshape(-1, REMAINDER_GROUP)
+    remainder_lengths = remainder_lengths.reshape(-1, REMAINDER_GROUP)
+    codes = remainders[:, 0].astype(np.uint64)
+    lengths = remainder_lengths[:, 0].astype(np.int64)
+    for index in range(1, REMAINDER_GROUP):
+        codes <<= remainder_lengths[:, index].astype(np.uint64)
+        codes |= remainders[:, index]
+        lengths += remainder_lengths[:, index]
+
+    band_codes = np.full(bands, codes.size // bands, dtype=np.int64)
+    too_long = np.flatnonzero(lengths > 64)
+    if too_long.size:
+        repeats = np.ones(codes.size, dtype=np.int64)
+        repeats[too_long] = REMAINDER_GROUP
+        band_codes += np.bincount(too_long // (codes.size // bands), minlength=bands) * (REMAINDER_GROUP - 1)
+        kept = (np.cumsum(repeats) - repeats)[too_long][:, None] + np.arange(REMAINDER_GROUP)
+        codes = np.repeat(codes, repeats)
+        lengths = np.repeat(lengths, repeats)
+        codes[kept] = remainders[too_long]
+        lengths[kept] = remainder_lengths[too_long]
+    return codes, lengths, band_codes
+
+def _encode_bands(data, layout, raw_bits, codes, lengths):
+    """
+    Codes consecutive bands of a residual image, see encode_symbols.
+
+    Parameters:
+    data (np.array): The (bands, rows * cols) residual values.
+    layout (tuple): The wavefront layout of a band (see wavefront_layout).
+    raw_bits (int): The number of bits of a residual value.
+    codes (list): The list the codes of the bands are appended to, in stream order.
+    lengths (list): The list the lengths of the codes are appended to.
+
+    Returns:
+    np.array: The number of bits of every band.
+    """
+    order, left, up, step_starts = layout
+    bands, band_size = data.shape
+    mapped = _zigzag(data[:, order])
+    magnitude = (mapped >> 1) + (mapped & 1)
+    # Pixels without a left or upper neighbor see the level of a zero residual
+    level = np.zeros((bands, band_size + 1), dtype=np.uint8)
+    level[:, :-1] = _levels(magnitude)
+    contexts = _contexts(level[:, left], level[:, up])
+
+    # The Rice parameters follow the statistics as they were before every anti-diagonal
+    parameters = _encoder_parameters(contexts, magnitude, step_starts, raw_bits)
+
+    quotients = mapped >> parameters
+    remainders = mapped - (quotients << parameters)
+    remainder_lengths = parameters
+    escaped = np.flatnonzero(quotients >= QUOTIENT_LIMIT)
+    quotients.reshape(-1)[escaped] = QUOTIENT_LIMIT
+    remainders.reshape(-1)[escaped] = mapped.reshape(-1)[escaped]
+    remainder_lengths.reshape(-1)[escaped] = raw_bits
+
+    # Per band: the unary quotients (q ones and a zero), then the remainders
+    unary_codes, unary_bits = _unary_words(quotients)
+    remainder_codes, remainder_code_lengths, band_codes = _remainder_codes(remainders, remainder_lengths)
+    remainder_starts = np.cumsum(band_codes) - band_codes
+    for band in range(bands):
+        remainder_range = slice(remainder_starts[band], remainder_starts[band] + band_codes[band])
+        codes += [unary_codes[band][0], remainder_codes[remainder_range]]
+        lengths += [unary_codes[band][1], remainder_code_lengths[remainder_range]]
+    return unary_bits + remainder_lengths.sum(axis=1, dtype=np.int64)
+
+def encode_symbols(data, shape, interval=bitstream.SYNC_INTERVAL):
+    """
+    Encodes a residual image with adaptive Golomb-Rice codes in a single pass, without a table.
+
+    Every band is coded one anti-diagonal at a time, all the bands at once. The context of a
+    residual is given by the magnitudes of its left and upper residuals, and every context of
+    every band keeps the running sum of its magnitudes and its count, from which the Rice
+    parameter k of its next residuals follows (as in JPEG-LS). The statistics are updated after
+    every anti-diagonal, so the decoder follows them exactly.
+    A band is stored as the unary quotients of all its residuals followed by their remainders.
+
+    Parameters:
+    data (np.array): Flattened 1D array of residual values.
+    shape (tuple): The (bands, rows, cols) shape of the residual image.
+    interval (int): Unused, every band is a lane of its own.
+
+    Returns:
+    tuple: The model, the packed np.uint8 bitstream, its length in bits, the bit offset
+           of every band and the bit offset of every band followed by the total length.
+    """
+    bands, rows, cols = shape
+    model = GolombRiceModel(data.dtype, rows, cols)
+    raw_bits = data.dtype.itemsize * 8
+    if data.size == 0:
+        return model, np.zeros(0, dtype=np.uint8), 0, np.zeros(bands, dtype=np.uint64), np.zeros(bands + 1, dtype=np.uint64)
+
+    with instrumentation.stage("encode", data.nbytes):
+        layout = wavefront_layout(rows, cols)
+        data = data.reshape(bands, rows * cols)
+        codes, lengths = [], []
+        band_bits = np.empty(bands, dtype=np.int64)
+        # A few bands at a time, so that the temporaries of every step stay small
+        chunk_bands = max(1, ENCODE_CHUNK_PIXELS // (rows * cols))
+        for first_band in range(0, bands, chunk_bands):
+            chunk = slice(first_band, min(bands, first_band + chunk_bands))
+            band_bits[chunk] = _encode_bands(data[chunk], layout, raw_bits, codes, lengths)
+        encoded_image, bit_length = bitstream.pack_codes(np.concatenate(codes), np.concatenate(lengths))
+    band_index = np.concatenate(([0], np.cumsum(band_bits))).astype(np.uint64)
+    return model, encoded_image, bit_length, band_index[:-1], band_index
+
+def build_decode_table(model):
+    """
+    Builds the coding order of the bands of a model.
+
+    Parameters:
+    model (GolombRiceModel): The model.
+
+    Returns:
+    dict: The dtype, the number of pixels of a band and the wavefront layout (see wavefront_layout).
+    """
+    order, left, up, step_starts = wavefront_layout(model.rows, model.cols)
+    return {
+        "dtype": model.dtype,
+        "band_size": model.rows * model.cols,
+        "order": order,
+        "left": left,
+        "up": up,
+        "step_starts": step_starts
+    }
+
+def decode_lanes(data, table, lane_offsets, lane_counts, out):
+    """
+    Decodes consecutive bands coded by encode_symbols into a preallocated array.
+    The unary quotients of every band are found from the positions of their terminating
+    zero bits, then every step decodes the remainders of one anti-diagonal of all the bands.
+
+    Parameters:
+    data (np.array): The packed np.uint8 bitstream.
+    table (dict): The decoding table from build_decode_table.
+    lane_offsets (np.array): The bit offset where every band starts.
+    lane_counts (np.array): The number of pixels of every band.
+    out (np.array): Flat array the bands are written into, one after the other.
+    """
+    band_size = table["band_size"]
+    bands = len(lane_offsets)
+    if np.any(np.asarray(lane_counts) != band_size):
+        raise ValueError("Golomb-Rice lanes must be whole bands.")
+    if bands == 0 or band_size == 0:
+        return
+    raw_bits = table["dtype"].itemsize * 8
+    lane_offsets = np.asarray(lane_offsets, dtype=np.int64)
+    lane_ends = np.append(lane_offsets[1:], np.asarray(data).size * 8)
+
+    quotients = np.empty((bands, band_size), dtype=np.int64)
+    positions = np.empty(bands, dtype=np.uint64)  # The bit position of the next remainder of every band
+    for band in range(bands):
+        first_byte = lane_offsets[band] // 8
+        bits = np.unpackbits(np.asarray(data[first_byte:(lane_ends[band] + 7) // 8], dtype=np.uint8))[lane_offsets[band] - first_byte * 8:]
+        zeros = np.flatnonzero(bits == 0)[:band_size]
+        if zeros.size != band_size:
+            raise ValueError("The Golomb-Rice stream is truncated.")
+        quotients[band] = np.diff(zeros, prepend=-1) - 1
+        positions[band] = lane_offsets[band] + zeros[-1] + 1
+
+    words = bitstream.as_words(data)
+    left, up, step_starts = table["left"], table["up"], table["step_starts"]
+    level = np.zeros((bands, band_size + 1), dtype=np.uint8)
+    residual = np.empty((bands, band_size), dtype=table["dtype"])
+    band_contexts = np.arange(bands)[:, None] * CONTEXTS
+    magnitudes = np.full((bands, CONTEXTS), INITIAL_MAGNITUDE, dtype=np.int64)
+    counts = np.ones((bands, CONTEXTS), dtype=np.int64)
+    for start, stop in zip(step_starts[:-1], step_starts[1:]):
+        context_index = _contexts(level[:, left[start:stop]], level[:, up[start:stop]]) + band_contexts
+        parameters = _rice_parameters(magnitudes, counts, context_index, raw_bits)
+        step_quotients = quotients[:, start:stop]
+        escaped = step_quotients >= QUOTIENT_LIMIT
+        remainder_lengths = np.where(escaped, raw_bits, parameters)
+
+        # The remainders of the step follow each other in every band
+        ends = np.cumsum(remainder_lengths, axis=1).astype(np.uint64) + positions[:, None]
+        peeked = bitstream.peek_bits(words, ends - remainder_lengths.astype(np.uint64), raw_bits)
+        remainders = (peeked >> (raw_bits - remainder_lengths).astype(np.uint64)).astype(np.int64)
+        positions = ends[:, -1]
+        mapped = np.where(escaped, remainders, (step_quotients << parameters) | remainders)
+
+        values = huffman_encoder.zigzag_decode(mapped, table["dtype"])
+        residual[:, start:stop] = values
+        magnitude = np.abs(values.astype(np.int64))
+        level[:, start:stop] = _levels(magnitude)
+        _update_contexts(magnitudes, counts, context_index, magnitude)
+
+    out.reshape(bands, band_size)[:, table["order"]] = residual
@@ -1,87 +1,204 @@
+import time
 import numpy as np
+import bitstream
+import huffman_encoder
+import instrumentation
+
+# Number of peeked bits resolved by a direct table hit, longer codes fall back to a binary search
+DIRECT_TABLE_BITS = 12
+
+def build_decode_table(huffman_table):
+    """
+    Builds a lookup table that resolves a symbol and its code length from the next peeked bits.
+
+    Every code of length L covers the range of peek values that start with it, and canonical
+    codes make these ranges ascend in table order, so the code is found from the last range
+    start that is not greater than the peeked value.
+    The first DIRECT_TABLE_BITS of the peek value index a direct table holding that code,
+    or -1 when the prefix is shared by several longer codes that need the search.
+
+    Parameters:
+    huffman_table (HuffmanTable): The canonical Huffman table.
+
+    Returns:
+    dict: The peek width, the symbols and lengths in range order, the range starts
+          and the direct table of code positions.
+    """
+    lengths = huffman_table.lengths
+    width = int(lengths.max()) if lengths.size else 0  # An empty stream has no codes
+    if width > huffman_encoder.MAX_CODE_LENGTH:
+        raise ValueError(f"Huffman codes longer than {huffman_encoder.MAX_CODE_LENGTH} bits cannot be decoded.")
+    table = {
+        "width": width,
+        "symbols": huffman_table.symbols,
+        "lengths": lengths,
+        "starts": huffman_table.codes << (width - lengths).astype(np.uint64),  # Left justified codes
+        "direct_bits": min(width, DIRECT_TABLE_BITS)
+    }
+    prefix_shift = np.uint64(width - table["direct_bits"])
+    prefixes = np.arange(1 << table["direct_bits"], dtype=np.uint64)
+    direct = np.searchsorted(table["starts"], prefixes << prefix_shift, side='right') - 1
+    # A prefix resolves directly only if the next prefix still starts inside the same code
+    next_code = np.searchsorted(table["starts"], ((prefixes + np.uint64(1)) << prefix_shift) - np.uint64(1), side='right') - 1
+    direct[direct != next_code] = -1
+    table["direct"] = direct
+    return table
+
+def decode_lanes(data, table, lane_offsets, lane_counts, out):
+    """
+    Decodes independent lanes of a packed bitstream into a preallocated array.
+    Every step decodes the next symbol of all the lanes that are not finished yet.
+
+    Parameters:
+    data (np.array): The packed np.uint8 bitstream.
+    table (dict): The decoding table from build_decode_table.
+    lane_offsets (np.array): The bit offset where every lane starts.
+    lane_counts (np.array): The number of symbols in every lane.
+    out (np.array): Flat array the lanes are written into, one after the other.
+    """
+    lane_counts = np.asarray(lane_counts, dtype=np.int64)
+    if lane_counts.sum() == 0:
+        return
+    words = bitstream.as_words(data)
+    width = table["width"]
+    prefix_shift = np.uint64(width - table["direct_bits"])
+
+    # Longest lanes first, so that the unfinished lanes are always a prefix
+    order = np.argsort(-lane_counts, kind='stable')
+    sorted_counts = lane_counts[order]
+    positions = np.asarray(lane_offsets, dtype=np.uint64)[order]
+    longest = int(sorted_counts[0])
+    active = positions.size
+
+    # Step-major buffer, so that every step writes one contiguous row
+    lane_symbols = np.empty((longest, positions.size), dtype=out.dtype)
+    for step in range(longest):
+        while sorted_counts[active - 1] <= step:
+            active -= 1
+        peeked = bitstream.peek_bits(words, positions[:active], width)
+        code_index = table["direct"][peeked >> prefix_shift]
+        long_codes = np.flatnonzero(code_index < 0)
+        if long_codes.size:
+            code_index[long_codes] = np.searchsorted(table["starts"], peeked[long_codes], side='right') - 1
+        lane_symbols[step, :active] = table["symbols"][code_index]
+        positions[:active] += table["lengths"][code_index].astype(np.uint64)
+    scatter_lanes(lane_symbols, lane_counts, order, out)
+
+def scatter_lanes(lane_symbols, lane_counts, order, out):
+    """
+    Writes the symbols decoded step by step into the lanes of a flat array.
+
+    Parameters:
+    lane_symbols (np.array): The (steps, lanes) symbols, with the lanes sorted by order.
+    lane_counts (np.array): The number of symbols in every lane.
+    order (np.array): The lanes in the column order of lane_symbols, longest first.
+    out (np.array): Flat array the lanes are written into, one after the other.
+    """
+    longest = lane_symbols.shape[0]
+    # Runs of consecutive full length lanes are written with one transposed copy
+    lane_firsts = np.cumsum(lane_counts) - lane_counts
+    column = np.empty(order.size, dtype=np.int64)
+    column[order] = np.arange(order.size)
+    full = np.flatnonzero(lane_counts == longest)
+    for run in np.split(full, np.flatnonzero(np.diff(full) != 1) + 1):
+        first = lane_firsts[run[0]]
+        out[first:first + run.size * longest].reshape(run.size, longest)[...] = lane_symbols[:, column[run]].T
+    for lane in np.flatnonzero(lane_counts != longest):
+        out[lane_firsts[lane]:lane_firsts[lane] + lane_counts[lane]] = lane_symbols[:lane_counts[lane], column[lane]]
+
+def decode_symbols(data, table, offsets, count, out, interval=bitstream.SYNC_INTERVAL):
+    """
+    Decodes count symbols from a packed bitstream into a preallocated array.
+    The stream is cut at its sync points into lanes of interval symbols.
+
+    Parameters:
+    data (np.array): The packed np.uint8 bitstream.
+    table (dict): The decoding table from build_decode_table.
+    offsets (np.array): The bit offsets of the sync points (bitstream.sync_offsets).
+    count (int): The number of symbols to decode.
+    out (np.array): Flat array of at least count entries to write the symbols into.
+    interval (int): The number of symbols between two sync points.
+    """
+    if len(offsets) != -(-count // interval):
+        raise ValueError("The sync offsets do not match the number of symbols.")
+    lane_counts = np.full(len(offsets), interval, dtype=np.int64)
+    if count:
+        lane_counts[-1] = count - (len(offsets) - 1) * interval
+    decode_lanes(data, table, offsets, lane_counts, out)
 
 def decode_huffman(compression_object):
     """
-    Decodes a Huffman-encoded binary string back into the original data
+    Decodes a Huffman-encoded bitstream back into the original data
     and updates the CompressionObject with the decoded data.
 
     Parameters:
-    compression_object (CompressionObject): The object containing the encoded image and Huffman dictionary.
+    compression_object (CompressionObject): The object containing the encoded image and Huffman table.
 
     Returns:
     CompressionObject: The updated CompressionObject with the decoded data.
     """
     encoded_data = compression_object.encoded_image
-    huffman_dict = compression_object.huffman_dict
-
-    if encoded_data is None or huffman_dict is None:
-        raise ValueError("Encoded image or Huffman dictionary is not set in the CompressionObject.")
+    huffman_table = compression_object.huffman_table
 
-    # Reverse the Huffman dictionary for decoding
-    reverse_huffman_dict = {v: k for k, v in huffman_dict.items()}
+    if encoded_data is None or huffman_table is None:
+        raise ValueError("Encoded image or Huffman table is not set in the CompressionObject.")
 
-    decoded_data = []
-    current_code = ""
-    for bit in encoded_data:
-        current_code += bit
-        if current_code in reverse_huffman_dict:
-            decoded_data.append(reverse_huffman_dict[current_code])
-            current_code = ""
+    start_time = time.perf_counter()
+    with instrumentation.stage("decode") as stage:
+        table = build_decode_table(huffman_table)
+        decoded_data = np.empty(compression_object.shape, dtype=table["symbols"].dtype)
+        decode_symbols(encoded_data, table, compression_object.encoded_image_index, decoded_data.size, decoded_data.reshape(-1))
+        stage["bytes"] = decoded_data.nbytes
+    compression_object.decode_time = time.perf_counter() - start_time
 
     # Update the CompressionObject with the decoded data
-    compression_object.decoded_data = np.array(decoded_data)
+    compression_object.decoded_data = decoded_data
     return compression_object
 
 def decode_rle(compression_object):
     """
-    Decodes a Huffman-encoded RLE binary string back into the original data
+    Decodes a Huffman-encoded RLE bitstream back into the original data
     and updates the CompressionObject with the decoded data.
 
     Parameters:
-    compression_object (CompressionObject): The object containing the RLE-encoded image and Huffman dictionaries.
+    compression_object (CompressionObject): The object containing the RLE-encoded image and Huffman tables.
 
     Returns:
     CompressionObject: The updated CompressionObject with the decoded data.
     """
-    encoded_data = compression_object.encoded_image_with_rle
-    value_huffman_dict = compression_object.rle_values_huffman_dict
-    count_huffman_dict = compression_object.rle_counts_huffman_dict
-    num_values = compression_object.values_num
-
-    # Reverse the Huffman dictionaries for decoding
-    reverse_value_huffman_dict = {v: k for k, v in value_huffman_dict.items()}
-    reverse_count_huffman_dict = {v: k for k, v in count_huffman_dict.items()}
-
-    # Decode the values
-    decoded_values = []
-    decoded_counts = []
-    current_code = ""
-    values_decoding = True
-
-    for bit in encoded_data:
-        current_code += bit
-        if values_decoding and current_code in reverse_value_huffman_dict:
-            decoded_values.append(reverse_value_huffman_dict[current_code])
-            current_code = ""
-            if len(decoded_values) == num_values:
-                values_decoding = False    
-        if not values_decoding and current_code in reverse_count_huffman_dict:
-            decoded_counts.append(reverse_count_huffman_dict[current_code])
-            current_code = ""
-
-    # Reconstruct the original data from RLE
-    decoded_data = []
-    for value, count in zip(decoded_values, decoded_counts):
-        decoded_data.extend([value] * count)
+    start_time = time.perf_counter()
+    with instrumentation.stage("decode_rle") as stage:
+        encoded_data = compression_object.encoded_image_with_rle
+        value_table = build_decode_table(compression_object.rle_values_huffman_table)
+        count_table = build_decode_table(compression_object.rle_counts_huffman_table)
+        num_values = compression_object.values_num
+
+        # The index holds the sync points of the values followed by those of the counts
+        index = compression_object.encoded_image_with_rle_index
+        value_lanes = -(-num_values // bitstream.SYNC_INTERVAL)
+
+        # Decode the values and the counts
+        decoded_values = np.empty(num_values, dtype=value_table["symbols"].dtype)
+        decoded_counts = np.empty(num_values, dtype=np.int64)
+        decode_symbols(encoded_data, value_table, index[:value_lanes], num_values, decoded_values)
+        decode_symbols(encoded_data, count_table, index[value_lanes:], num_values, decoded_counts)
+
+        # Reconstruct the original data from RLE
+        decoded_data = np.repeat(decoded_values, decoded_counts).reshape(compression_object.shape)
+        stage["bytes"] = decoded_data.nbytes
+
+    compression_object.decode_rle_time = time.perf_counter() - start_time
 
     # Update the CompressionObject with the decoded data
-    compression_object.decoded_rle_data = np.array(decoded_data)
+    compression_object.decoded_rle_data = decoded_data
     return compression_object
 
 def reconstruct_image(compression_object):
     """
     Reconstructs the original 2D or 3D image from the flattened data
     and updates the CompressionObject with the reconstructed image.
+    A lean object gets the decoded residual back as its residual image, for the reconstruction,
+    and decodes its RLE stream only on request.
 
     Parameters:
     compression_object (CompressionObject): The object containing the decoded data and original shape.
@@ -90,6 +207,10 @@ def reconstruct_image(compression_object):
     CompressionObject: The updated CompressionObject with the reconstructed image.
     """
     compression_object = decode_huffman(compression_object)
+    if compression_object.lean:
+        compression_object.residual_image = compression_object.reconstructed_residual_image = compression_object.decoded_data
+        compression_object.release("decoded_data")
+        return compression_object
     compression_object = decode_rle(compression_object)
 
     flattened_data = compression_object.decoded_data
@@ -1,122 +1,459 @@
-from collections import Counter
-import heapq
+import struct
 import time
+import numpy as np
+import bitstream
+import instrumentation
+
+# Largest zigzag value counted with a dense histogram, wider ranges fall back to np.unique
+HISTOGRAM_LIMIT = 1 << 24
+# Number of samples mapped and counted at a time, bounds the temporary memory
+HISTOGRAM_CHUNK_SIZE = 1 << 22
+# Longest Huffman code, the decoder peeks at most this many bits past any bit offset in a 64-bit word
+MAX_CODE_LENGTH = 57
+
+# Class to represent a canonical Huffman code, fully described by its (symbol, code length) pairs
+class HuffmanTable:
+    # Name of the entropy coder, recorded with the streams coded with this table
+    codec = "huffman"
+
+    def __init__(self, symbols, lengths):
+        """
+        Initialize the HuffmanTable and assign the canonical codes.
+
+        Parameters:
+        symbols (np.array): The coded symbols.
+        lengths (np.array): The code length of every symbol.
+        """
+        symbols = np.asarray(symbols)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        order = np.lexsort((symbols, lengths))  # Canonical order: by length, then by symbol
+        self.symbols = symbols[order]
+        self.lengths = lengths[order]
+        self.codes = canonical_codes(self.lengths)
+
+    def __len__(self):
+        return self.symbols.size
+
+    @property
+    def dtype(self):
+        return self.symbols.dtype
+
+    def __str__(self):
+        if not len(self):
+            return "HuffmanTable(0 symbols)"
+        return (
+            f"HuffmanTable({len(self)} symbols, {self.symbols.dtype}, "
+            f"code lengths {self.lengths.min()}-{self.lengths.max()})"
+        )
+
+    def to_bytes(self):
+        """
+        Serializes the table as its symbol dtype, the number of symbols, the symbols and their lengths.
+
+        Returns:
+        bytes: The serialized table.
+        """
+        dtype = self.symbols.dtype.newbyteorder('<')
+        header = struct.pack('<B', len(dtype.str)) + dtype.str.encode('ascii') + struct.pack('<I', len(self))
+        return header + self.symbols.astype(dtype).tobytes() + self.lengths.astype(np.uint8).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds a table serialized with to_bytes.
+
+        Parameters:
+        data (bytes): The serialized table.
+
+        Returns:
+        HuffmanTable: The table with its canonical codes.
+        """
+        dtype_length = data[0]
+        dtype = np.dtype(data[1:1 + dtype_length].decode('ascii'))
+        offset = 1 + dtype_length
+        count, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        symbols = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += count * dtype.itemsize
+        lengths = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+        return cls(symbols.astype(dtype.newbyteorder('=')), lengths)
+
+    def lookup(self, data):
+        """
+        Looks up the code value and code length of every symbol in the data.
+        Integer symbols are found through a table indexed by their zigzag value.
+
+        Parameters:
+        data (np.array): Flattened 1D array of symbols that all appear in the table.
+
+        Returns:
+        tuple: The code values and the code lengths, one per symbol in the data.
+        """
+        index = symbol_positions(self.symbols, data)
+        return self.codes[index], self.lengths[index]
+
+def symbol_positions(symbols, data):
+    """
+    Finds the position of every data value in an array of distinct symbols.
+    Integer symbols are found through a table indexed by their zigzag value.
+
+    Parameters:
+    symbols (np.array): The distinct symbols.
+    data (np.array): Flattened 1D array of values that all appear in the symbols.
+
+    Returns:
+    np.array: The position in symbols of every value in the data.
+    """
+    data = np.asarray(data)
+    if symbols.size and np.issubdtype(symbols.dtype, np.integer):
+        mapped_symbols = zigzag_encode(symbols)
+        if mapped_symbols.max() < HISTOGRAM_LIMIT:
+            position = np.zeros(int(mapped_symbols.max()) + 1, dtype=np.intp)
+            position[mapped_symbols] = np.arange(symbols.size)
+            index = np.empty(data.size, dtype=np.intp)
+            for start in range(0, data.size, HISTOGRAM_CHUNK_SIZE):
+                index[start:start + HISTOGRAM_CHUNK_SIZE] = position[zigzag_encode(data[start:start + HISTOGRAM_CHUNK_SIZE])]
+            return index
+    by_symbol = np.argsort(symbols)
+    return by_symbol[np.searchsorted(symbols, data, sorter=by_symbol)]
+
+# Functions to map signed values to non-negative integers and back
+def zigzag_encode(values):
+    """
+    Maps signed integers to non-negative ones (0, -1, 1, -2, 2, ... to 0, 1, 2, 3, 4, ...).
+    Unsigned integers are returned unchanged.
+
+    Parameters:
+    values (np.array): Integer values.
 
-# Define a Node class to represent each node in the Huffman tree
-class Node:
-    def __init__(self, value, frequency):
-        self.value = value  # The pixel value
-        self.frequency = frequency  # The frequency of the pixel value
-        self.left = None  # Left child
-        self.right = None  # Right child
+    Returns:
+    np.array: The mapped values as np.int64.
+    """
+    values = np.asarray(values)
+    mapped = values.astype(np.int64)
+    if np.issubdtype(values.dtype, np.signedinteger):
+        mapped = (mapped << 1) ^ (mapped >> 63)
+    return mapped
+
+def zigzag_decode(mapped, dtype):
+    """
+    Inverts zigzag_encode for values of the given dtype.
+
+    Parameters:
+    mapped (np.array): Non-negative mapped values.
+    dtype (np.dtype): The dtype of the original values.
+
+    Returns:
+    np.array: The original values in the given dtype.
+    """
+    mapped = np.asarray(mapped, dtype=np.int64)
+    if np.issubdtype(dtype, np.signedinteger):
+        mapped = (mapped >> 1) ^ -(mapped & 1)
+    return mapped.astype(dtype)
 
-    def __lt__(self, other):
-        return self.frequency < other.frequency  # Comparison method for heapq
+def _zigzag_histogram(image, band_count=1):
+    """
+    Counts the zigzag mapped values of every band with one bincount pass per chunk.
+    Returns None when the values are not integers or their range is too wide.
+    """
+    if not np.issubdtype(image.dtype, np.integer) or image.size == 0:
+        return None
+    low, high = int(image.min()), int(image.max())
+    width = int(max(zigzag_encode(np.array([low, high], dtype=image.dtype)))) + 1
+    if width * band_count > HISTOGRAM_LIMIT:
+        return None
+
+    flat = image.reshape(-1)
+    band_size = flat.size // band_count
+    histogram = np.zeros(width * band_count, dtype=np.int64)
+    for start in range(0, flat.size, HISTOGRAM_CHUNK_SIZE):
+        mapped = zigzag_encode(flat[start:start + HISTOGRAM_CHUNK_SIZE])
+        if band_count > 1:
+            # Every band counts into its own slice of the histogram
+            mapped += (np.arange(start, start + mapped.size) // band_size) * width
+        histogram += np.bincount(mapped, minlength=histogram.size)
+    return histogram.reshape(band_count, width)
 
 # Function to calculate the statistics of pixel values in a hyperspectral image
 def calculate_statistics(image):
     """
     Calculates the statistics of pixel values in a hyperspectral image.
+    Integer values are zigzag mapped and counted with a single bincount pass.
+
+    Parameters:
+    image (np.array): Input hyperspectral image.
+
+    Returns:
+    tuple: The distinct pixel values and their frequencies, as two arrays.
+    """
+    image = np.asarray(image)
+    histogram = _zigzag_histogram(image)
+    if histogram is None:
+        return np.unique(image, return_counts=True)
+    present = np.flatnonzero(histogram[0])
+    return zigzag_decode(present, image.dtype), histogram[0, present]
+
+def calculate_band_statistics(image):
+    """
+    Calculates the statistics of pixel values of every band of a (bands, rows, cols) image.
+    Integer values are counted for all bands in one 2-D bincount pass.
 
     Parameters:
     image (np.array): Input hyperspectral image.
 
     Returns:
-    Counter: A Counter object with pixel values and their frequencies.
+    tuple: The distinct pixel values of the whole image and a (bands, values) array
+           with their frequency in every band.
     """
-    # Calculate the frequency of each pixel value
-    pixel_statistics = Counter(image)
-    return pixel_statistics
+    image = np.asarray(image)
+    band_count = image.shape[0]
+    histogram = _zigzag_histogram(image, band_count)
+    if histogram is None:
+        symbols, inverse = np.unique(image, return_inverse=True)
+        inverse = inverse.reshape(band_count, -1) + np.arange(band_count)[:, None] * symbols.size
+        frequencies = np.bincount(inverse.ravel(), minlength=band_count * symbols.size)
+        return symbols, frequencies.reshape(band_count, symbols.size)
+    present = np.flatnonzero(histogram.any(axis=0))
+    return zigzag_decode(present, image.dtype), histogram[:, present]
+
+def merge_statistics(statistics):
+    """
+    Sums the statistics of several parts of an image into the statistics of the whole image,
+    with the values in the same order as calculate_statistics returns them.
+
+    Parameters:
+    statistics (list): The (values, frequencies) tuples of every part.
+
+    Returns:
+    tuple: The distinct pixel values and their frequencies, as two arrays.
+    """
+    symbols = np.unique(np.concatenate([part_symbols for part_symbols, _ in statistics]))
+    if np.issubdtype(symbols.dtype, np.integer):
+        symbols = symbols[np.argsort(zigzag_encode(symbols), kind='stable')]
+    # Position of every value in the zigzag (or sorted) order
+    order = np.argsort(symbols, kind='stable')
+    frequencies = np.zeros(symbols.size, dtype=np.int64)
+    for part_symbols, part_frequencies in statistics:
+        frequencies[order[np.searchsorted(symbols, part_symbols, sorter=order)]] += part_frequencies
+    return symbols, frequencies
 
 # Function to perform Run-Length Encoding (RLE)
 def run_length_encode(image):
     """
     Performs Run-Length Encoding (RLE) on a flattened image.
+    Runs start wherever a value differs from the one before it.
 
     Parameters:
     image (np.array): Flattened 1D array of pixel values.
 
     Returns:
-    list: A list of (value, count) tuples representing the RLE-encoded image.
+    tuple: The value of every run and its length (np.int64), as two arrays.
     """
-    rle_encoded = []
-    current_value = image[0]
-    count = 1
-
-    for i in range(1, len(image)):
-        if image[i] == current_value:
-            count += 1
-        else:
-            rle_encoded.append((current_value, count))
-            current_value = image[i]
-            count = 1
+    image = np.asarray(image).ravel()
+    run_starts = np.flatnonzero(image[1:] != image[:-1]) + 1
+    run_starts = np.concatenate(([0], run_starts)) if image.size else run_starts
+    values = image[run_starts]
+    counts = np.diff(np.append(run_starts, image.size))
+    return values, counts
+
+# Function to compute the Huffman code lengths from symbol frequencies
+def huffman_code_lengths(frequencies, max_length=MAX_CODE_LENGTH):
+    """
+    Computes Huffman code lengths of at most max_length bits.
+    The lengths are optimal unless the longest code is too long, then the frequencies are
+    halved (keeping every symbol at least 1) until it fits. Flatter frequencies give a
+    shallower tree, and equal frequencies give codes of about log2 of the symbol count.
 
-    # Append the last value
-    rle_encoded.append((current_value, count))
-    return rle_encoded
+    Parameters:
+    frequencies (np.array): The frequency of every symbol.
+    max_length (int): The longest allowed code length.
 
-# Function to generate a Huffman tree from pixel statistics
-def generate_huffman_tree(pixel_statistics):
+    Returns:
+    np.array: The code length of every symbol, in the order of the frequencies.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.int64)
+    if frequencies.size > 1 << max_length:
+        raise ValueError(f"{frequencies.size} symbols do not fit in codes of {max_length} bits.")
+    lengths = _optimal_code_lengths(frequencies)
+    while lengths.size and lengths.max() > max_length:
+        frequencies = (frequencies + 1) >> 1
+        lengths = _optimal_code_lengths(frequencies)
+    return lengths
+
+def _optimal_code_lengths(frequencies):
+    """
+    Computes optimal Huffman code lengths with the two-queue method on sorted frequencies.
+    Leaves and merged nodes are kept in arrays, and depths are assigned from the root down,
+    so no tree objects or recursion are needed.
     """
-    Generates a Huffman tree from pixel statistics.
+    leaf_count = frequencies.size
+    if leaf_count == 0:
+        return np.zeros(0, dtype=np.int64)
+    if leaf_count == 1:
+        return np.ones(1, dtype=np.int64)  # A single symbol still needs a one bit code
+
+    order = np.argsort(frequencies, kind='stable')
+    leaf_weights = frequencies[order].tolist()
+    merged_weights = [0] * (leaf_count - 1)
+    # Parents of the leaves and of the merged nodes, as indices into the merged nodes
+    leaf_parents = [0] * leaf_count
+    merged_parents = [0] * (leaf_count - 1)
+    next_leaf = 0
+    next_merged = 0
+    for node in range(leaf_count - 1):
+        weight = 0
+        for _ in range(2):  # Take the two lightest nodes from the front of either queue
+            if next_leaf < leaf_count and (next_merged >= node or leaf_weights[next_leaf] <= merged_weights[next_merged]):
+                leaf_parents[next_leaf] = node
+                weight += leaf_weights[next_leaf]
+                next_leaf += 1
+            else:
+                merged_parents[next_merged] = node
+                weight += merged_weights[next_merged]
+                next_merged += 1
+        merged_weights[node] = weight
+
+    # The last merged node is the root, every other node is one level below its parent
+    merged_depths = [0] * (leaf_count - 1)
+    for node in range(leaf_count - 3, -1, -1):
+        merged_depths[node] = merged_depths[merged_parents[node]] + 1
+    lengths = np.empty(leaf_count, dtype=np.int64)
+    lengths[order] = np.array(merged_depths)[leaf_parents] + 1
+    return lengths
+
+# Function to assign canonical codes from code lengths
+def canonical_codes(lengths):
+    """
+    Assigns canonical Huffman codes to code lengths sorted in canonical order.
+    Codes of the same length are consecutive, and the first code of every length follows
+    the last code of the previous length shifted by the difference in length.
 
     Parameters:
-    pixel_statistics (Counter): A Counter object with pixel values and their frequencies.
+    lengths (np.array): The code lengths, in non-decreasing order.
 
     Returns:
-    Node: The root node of the Huffman tree.
+    np.array: The np.uint64 code values.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if lengths.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    max_length = int(lengths[-1])
+    if max_length > 64:
+        raise ValueError("Huffman codes longer than 64 bits are not supported.")
+    length_counts = np.bincount(lengths, minlength=max_length + 1)
+    first_codes = [0] * (max_length + 1)
+    code = 0
+    for length in range(1, max_length + 1):
+        code = (code + int(length_counts[length - 1])) << 1
+        first_codes[length] = code
+    first_codes = np.array(first_codes, dtype=np.uint64)
+    first_index = np.concatenate(([0], np.cumsum(length_counts)))  # Position of the first code of every length
+    rank = np.arange(lengths.size) - first_index[lengths]
+    return first_codes[lengths] + rank.astype(np.uint64)
+
+# Function to generate a canonical Huffman table from pixel statistics
+def generate_huffman_table(pixel_statistics):
     """
-    # Create a heap of nodes from the pixel statistics
-    heap = []
-    for value, frequency in pixel_statistics.items():
-        heap.append(Node(value, frequency))
-    heapq.heapify(heap)  # Convert the list into a heap
+    Generates a canonical Huffman table from pixel statistics.
 
-    # Handle the case where there is only one unique value
-    if len(heap) == 1:
-        # Add a dummy node with frequency 0 to create a valid tree
-        dummy_node = Node(None, 0)
-        heapq.heappush(heap, dummy_node)
+    Parameters:
+    pixel_statistics (tuple): The pixel values and their frequencies, as returned by calculate_statistics.
+
+    Returns:
+    HuffmanTable: The canonical Huffman table.
+    """
+    symbols, frequencies = pixel_statistics
+    present = np.asarray(frequencies) > 0
+    symbols = np.asarray(symbols)[present]
+    return HuffmanTable(symbols, huffman_code_lengths(np.asarray(frequencies)[present]))
 
-    # Merge nodes until there is only one node left (the root of the Huffman tree)
-    while len(heap) > 1:
-        node1 = heapq.heappop(heap)  # Pop the node with the smallest frequency
-        node2 = heapq.heappop(heap)  # Pop the next smallest node
-        merged = Node(None, node1.frequency + node2.frequency)  # Create a new merged node
-        merged.left = node1  # Set the left child
-        merged.right = node2  # Set the right child
-        heapq.heappush(heap, merged)  # Push the merged node back into the heap
+def encode_symbols(data, shape, interval=bitstream.SYNC_INTERVAL):
+    """
+    Huffman encodes a flattened residual image into a packed bitstream with its own table.
 
-    return heap[0]  # Return the root node of the Huffman tree
+    Parameters:
+    data (np.array): Flattened 1D array of pixel values.
+    shape (tuple): The (bands, rows, cols) shape of the residual image.
+    interval (int): The number of symbols between two sync points.
 
-# Function to generate a Huffman dictionary from a Huffman tree
-def generate_huffman_dict(node, binary_string='', huffman_dict=None):
+    Returns:
+    tuple: The Huffman table, the packed np.uint8 bitstream, its length in bits, the bit offset
+           of every sync point and the bit offset of every band followed by the total length.
     """
-    Generates a Huffman dictionary from a Huffman tree.
+    with instrumentation.stage("histogram", data.nbytes):
+        statistics = calculate_statistics(data)
+    with instrumentation.stage("table"):
+        huffman_table = generate_huffman_table(statistics)
+    with instrumentation.stage("encode", data.nbytes):
+        codes, lengths = huffman_table.lookup(data)
+        encoded_image, bit_length = bitstream.pack_codes(codes, lengths)
+        sync_index = bitstream.sync_offsets(lengths, interval)
+    band_size = max(int(np.prod(shape[1:])), 1)
+    band_index = np.append(bitstream.sync_offsets(lengths, band_size), np.uint64(bit_length))
+    return huffman_table, encoded_image, bit_length, sync_index, band_index
+
+def encode_rle(compression_object):
+    """
+    Encodes a hyperspectral image using Huffman coding with RLE.
+    The values and the counts of the runs are coded with a table each, and packed into
+    one bitstream with an index of sync points every bitstream.SYNC_INTERVAL symbols.
 
     Parameters:
-    node (Node): The root node of the Huffman tree.
-    binary_string (str): The binary string representing the Huffman code.
-    huffman_dict (dict): The Huffman dictionary.
+    compression_object (CompressionObject): The object containing the residual image to encode.
 
     Returns:
-    dict: The Huffman dictionary with pixel values and their Huffman codes.
+    CompressionObject: The updated CompressionObject with the RLE Huffman attributes.
     """
-    if huffman_dict is None:
-        huffman_dict = {}  # Initialize a new dictionary if none is provided
+    image = compression_object.residual_image
 
-    if node is not None:
-        if node.value is not None:
-            # Assign "0" if the binary string is empty (single-node tree)
-            huffman_dict[node.value] = binary_string or "0"
-        generate_huffman_dict(node.left, binary_string + '0', huffman_dict)  # Traverse left
-        generate_huffman_dict(node.right, binary_string + '1', huffman_dict)  # Traverse right
+    if image is None:
+        raise ValueError("Residual image is not set in the CompressionObject.")
+
+    flattened_image = image.flatten()
+    start_time = time.perf_counter()
+    with instrumentation.stage("encode_rle", image.nbytes):
+        values, counts = run_length_encode(flattened_image)
+
+        # Generate Huffman tables for values and counts
+        value_statistics = calculate_statistics(values)
+        value_huffman_table = generate_huffman_table(value_statistics)
+
+        count_statistics = calculate_statistics(counts)
+        count_huffman_table = generate_huffman_table(count_statistics)
+
+        # Encode the RLE data, all the values followed by all the counts
+        values_num = values.size
+        value_codes, value_lengths = value_huffman_table.lookup(values)
+        count_codes, count_lengths = count_huffman_table.lookup(counts)
+        encoded_image_with_rle, encoded_image_with_rle_bit_length = bitstream.pack_codes(
+            np.concatenate((value_codes, count_codes)),
+            np.concatenate((value_lengths, count_lengths))
+        )
+        # Sync points of the values followed by those of the counts, which start after the last value
+        encoded_image_with_rle_index = np.concatenate((
+            bitstream.sync_offsets(value_lengths),
+            bitstream.sync_offsets(count_lengths) + np.uint64(value_lengths.sum())
+        ))
+    end_time = time.perf_counter()
+    compression_object.encode_with_rle_time = end_time - start_time
 
-    return huffman_dict
+
+    # Update the CompressionObject for RLE encoding
+    compression_object.rle_values_huffman_table = value_huffman_table
+    compression_object.rle_counts_huffman_table = count_huffman_table
+    compression_object.encoded_image_with_rle = encoded_image_with_rle
+    compression_object.encoded_image_with_rle_bit_length = encoded_image_with_rle_bit_length
+    compression_object.encoded_image_with_rle_index = encoded_image_with_rle_index
+    compression_object.values_num = values_num
+
+    return compression_object
 
 def encode_image(compression_object):
     """
     Encodes a hyperspectral image using Huffman coding both with and without RLE.
+    The encoded images are packed np.uint8 bitstreams with their lengths in bits stored alongside,
+    and an index of sync points every bitstream.SYNC_INTERVAL symbols for parallel decoding.
+    See entropy_coder.encode_image to code the image without RLE with another entropy coder.
 
     Parameters:
     compression_object (CompressionObject): The object containing the residual image to encode.
@@ -129,60 +466,21 @@ def encode_image(compression_object):
     if image is None:
         raise ValueError("Residual image is not set in the CompressionObject.")
 
-    start_time = time.time()
+    start_time = time.perf_counter()
     # Standard Huffman coding without RLE
-    pixel_statistics = calculate_statistics(image.flatten())
-    huffman_tree = generate_huffman_tree(pixel_statistics)
-    huffman_dict = generate_huffman_dict(huffman_tree)
-    flattened_image = image.flatten()
-    encoded_image = ''.join(huffman_dict[pixel] for pixel in flattened_image)
+    huffman_table, encoded_image, encoded_image_bit_length, encoded_image_index, encoded_image_band_index = encode_symbols(image.flatten(), image.shape)
 
     # Update the CompressionObject for non-RLE encoding
-    compression_object.huffman_dict = huffman_dict
+    compression_object.codec = huffman_table.codec
+    compression_object.huffman_table = huffman_table
     compression_object.encoded_image = encoded_image
-    end_time = time.time()
+    compression_object.encoded_image_bit_length = encoded_image_bit_length
+    compression_object.encoded_image_index = encoded_image_index
+    compression_object.encoded_image_band_index = encoded_image_band_index
+    end_time = time.perf_counter()
     compression_object.encode_time = end_time - start_time
 
-
-    # Huffman coding with RLE
-    flattened_image = image.flatten()
-    start_time = time.time()
-    rle_encoded = run_length_encode(flattened_image)
-
-    # Separate values and counts for Huffman coding
-    values = [pair[0] for pair in rle_encoded]
-    counts = [pair[1] for pair in rle_encoded]
-
-    # Generate Huffman dictionaries for values and counts
-    #value_statistics = Counter(values)
-    value_statistics = calculate_statistics(values)
-    value_huffman_tree = generate_huffman_tree(value_statistics)
-    value_huffman_dict = generate_huffman_dict(value_huffman_tree)
-
-    #count_statistics = Counter(counts)
-    count_statistics = calculate_statistics(counts)
-    count_huffman_tree = generate_huffman_tree(count_statistics)
-    count_huffman_dict = generate_huffman_dict(count_huffman_tree)
-    
-    # Encode the RLE data
-    values_num = 0
-    encoded_values = ''
-    for value in values:
-        encoded_values += value_huffman_dict[value]
-        values_num += 1
-    encoded_counts = ''
-    for count in counts:
-        encoded_counts += count_huffman_dict[count]
-
-    encoded_image_with_rle = encoded_values + encoded_counts
-    end_time = time.time()
-    compression_object.encode_with_rle_time = end_time - start_time
-
-
-    # Update the CompressionObject for RLE encoding
-    compression_object.rle_values_huffman_dict = value_huffman_dict
-    compression_object.rle_counts_huffman_dict = count_huffman_dict
-    compression_object.encoded_image_with_rle = encoded_image_with_rle
-    compression_object.values_num = values_num
-
-    return compression_object
\ No newline at end of file
+    # Huffman coding with RLE, after which a lean object no longer needs the residual image
+    compression_object = encode_rle(compression_object)
+    compression_object.release("residual_image")
+    return compression_object
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# The trace being recorded in this process, stages are only measured while one is active
+_active_trace = None
+
+# Class to represent the stages recorded between start and stop
+class Trace:
+    def __init__(self, trace_memory=True):
+        """
+        Initialize an empty Trace.
+
+        Parameters:
+        trace_memory (bool): Whether to record the peak allocation of every stage with tracemalloc.
+        """
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._open_stages = []
+
+    def summary(self):
+        """
+        Aggregates the recorded stages by name. Nested stages are also counted in the stages around them.
+
+        Returns:
+        dict: For every stage name, in the order first recorded: the number of calls ("calls"),
+              the total time in seconds ("seconds"), the bytes processed ("bytes"), the throughput
+              in MB/s ("throughput") and the largest peak allocation in bytes ("peak_bytes").
+        """
+        return summarize(self.stages)
+
+    def save(self, file_path):
+        """
+        Writes the stages as a Chrome trace (see save_chrome_trace).
+        """
+        save_chrome_trace(file_path, self.stages)
+
+def start(trace_memory=True):
+    """
+    Starts recording the stages of this process into a new Trace.
+    Recording the peak allocations starts tracemalloc, which slows down small Python allocations.
+
+    Parameters:
+    trace_memory (bool): Whether to record the peak allocation of every stage.
+
+    Returns:
+    Trace: The trace the stages are recorded into.
+    """
+    global _active_trace
+    _active_trace = Trace(trace_memory)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return _active_trace
+
+def stop():
+    """
+    Stops recording stages.
+
+    Returns:
+    Trace: The recorded trace, or None if none was started.
+    """
+    global _active_trace
+    trace, _active_trace = _active_trace, None
+    if trace is not None and trace.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return trace
+
+def is_active():
+    """
+    Returns whether a trace is being recorded in this process.
+    """
+    return _active_trace is not None
+
+@contextmanager
+def stage(name, nbytes=None):
+    """
+    Measures the code of a with block as a pipeline stage of the active trace: its perf_counter
+    time, its throughput and its peak allocation above the memory in use when it started.
+    Without an active trace nothing is measured.
+
+    Parameters:
+    name (str): The name of the stage, e.g. "predict", "encode" or "decode".
+    nbytes (int): The number of bytes the stage processes, for its throughput.
+
+    Yields:
+    dict: The record of the stage. Its "bytes" can be set inside the block when they are only known there.
+    """
+    trace = _active_trace
+    record = {"name": name, "bytes": nbytes}
+    if trace is None:
+        yield record
+        return
+
+    parent = trace._open_stages[-1] if trace._open_stages else None
+    if trace.trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent["_peak"] = max(parent["_peak"], peak)  # The peak of the parent so far, before it is reset
+        tracemalloc.reset_peak()
+        record["_start_memory"], record["_peak"] = current, current
+    record.update(pid=os.getpid(), tid=threading.get_ident(), depth=len(trace._open_stages))
+    trace._open_stages.append(record)
+    start_time = time.perf_counter()
+    try:
+        yield record
+    finally:
+        end_time = time.perf_counter()
+        trace._open_stages.pop()
+        record["start"] = start_time
+        record["duration"] = end_time - start_time
+        record["throughput"] = record["bytes"] / 1e6 / record["duration"] if record["bytes"] and record["duration"] > 0 else None
+        record["peak_bytes"] = None
+        if trace.trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], record.pop("_peak"))
+            record["peak_bytes"] = peak - record.pop("_start_memory")
+            if parent is not None:
+                parent["_peak"] = max(parent["_peak"], peak)
+        trace.stages.append(record)
+
+def summarize(stages):
+    """
+    Aggregates stage records (see Trace.summary) by name.
+
+    Parameters:
+    stages (list): The stage records, possibly from several processes.
+
+    Returns:
+    dict: The calls, seconds, bytes, throughput and peak allocation of every stage name.
+    """
+    summary = {}
+    for record in stages:
+        entry = summary.setdefault(record["name"], {"calls": 0, "seconds": 0.0, "bytes": 0, "throughput": None, "peak_bytes": None})
+        entry["calls"] += 1
+        entry["seconds"] += record["duration"]
+        entry["bytes"] += record["bytes"] or 0
+        if record["peak_bytes"] is not None:
+            entry["peak_bytes"] = max(entry["peak_bytes"] or 0, record["peak_bytes"])
+    for entry in summary.values():
+        if entry["bytes"] and entry["seconds"] > 0:
+            entry["throughput"] = entry["bytes"] / 1e6 / entry["seconds"]
+    return summary
+
+def chrome_trace(stages):
+    """
+    Converts stage records into the Chrome trace event format (chrome://tracing, Perfetto).
+    perf_counter is a system-wide clock, so the stages of several worker processes share one timeline.
+
+    Parameters:
+    stages (list): The stage records, possibly from several processes.
+
+    Returns:
+    dict: The trace, with one complete ("X") event per stage.
+    """
+    events = []
+    for record in sorted(stages, key=lambda record: record["start"]):
+        events.append({
+            "name": record["name"],
+            "cat": "stage",
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["duration"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": {"bytes": record["bytes"], "throughput_mb_s": record["throughput"], "peak_bytes": record["peak_bytes"]}
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def save_chrome_trace(file_path, stages):
+    """
+    Writes stage records as a Chrome trace JSON file.
+
+    Parameters:
+    file_path (str): The path to the JSON file.
+    stages (list): The stage records, possibly from several processes.
+    """
+    with open(file_path, "w") as file:
+        json.dump(chrome_trace(stages), file)
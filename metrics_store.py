@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import time
+
+# The fields that identify a measurement, a combination is only measured once per store
+KEY_FIELDS = ("scene", "predictor", "codec", "parameters")
+# The measured fields, sizes in bytes and times in seconds
+METRIC_FIELDS = (
+    "mse",
+    "original_size",
+    "compressed_size",
+    "compressed_size_rle",
+    "container_size",
+    "compression_ratio",
+    "compression_ratio_rle",
+    "compression_ratio_container",
+    "time_to_predict_and_residual",
+    "time_to_encode",
+    "time_to_encode_with_rle",
+    "total_time_no_rle",
+    "total_time_with_rle",
+    "time_to_decode",
+    "time_to_decode_rle",
+    "time_to_reconstruct"
+)
+# The per-stage summary of a traced measurement (see instrumentation.summarize), stored as JSON
+SUMMARY_FIELD = "stage_summary"
+FIELDS = KEY_FIELDS + METRIC_FIELDS + (SUMMARY_FIELD, "timestamp")
+
+def result_key(result):
+    """
+    Returns the (scene, predictor, codec, parameters) key of a result.
+    """
+    return tuple(str(result.get(field) or "") for field in KEY_FIELDS)
+
+def _parse_row(row):
+    """
+    Converts the metric fields of a CSV row back to numbers. Returns None for an incomplete row,
+    such as the last row of a run that was interrupted while writing it.
+    The fields a store was created without, such as the decode times of older stores, are None.
+    """
+    # csv.DictReader fills the columns missing from a row with None
+    if None in row.values() or any(row.get(field) is None for field in KEY_FIELDS + ("timestamp",)):
+        return None
+    try:
+        parsed = {field: row[field] for field in KEY_FIELDS}
+        for field in METRIC_FIELDS:
+            parsed[field] = float(row[field]) if row.get(field) else None
+        parsed[SUMMARY_FIELD] = json.loads(row[SUMMARY_FIELD]) if row.get(SUMMARY_FIELD) else None
+        parsed["timestamp"] = float(row["timestamp"])
+    except ValueError:
+        return None
+    return parsed
+
+def load_results(store_path, **filters):
+    """
+    Reads the results of a metrics store. Later measurements of the same key replace earlier ones.
+
+    Parameters:
+    store_path (str): The path to the CSV metrics store.
+    filters: Key fields and the value to keep (e.g. scene="PaviaU", codec="rans").
+
+    Returns:
+    list: The results as dicts of the FIELDS, in the order they were first measured.
+    """
+    if not os.path.exists(store_path):
+        return []
+    results = {}
+    with open(store_path, newline="") as file:
+        for row in csv.DictReader(file):
+            result = _parse_row(row)
+            if result is None:
+                continue
+            if all(result[field] == str(value) for field, value in filters.items()):
+                results[result_key(result)] = result
+    return list(results.values())
+
+def measured_keys(store_path):
+    """
+    Returns the set of (scene, predictor, codec, parameters) keys already in a metrics store.
+    """
+    return {result_key(result) for result in load_results(store_path)}
+
+def append_results(store_path, results):
+    """
+    Appends results to a metrics store, creating it with a header row if needed.
+    Every row is flushed as soon as it is written, so an interrupted run keeps the rows it finished.
+    The rows keep the columns of the header the store was created with.
+
+    Parameters:
+    store_path (str): The path to the CSV metrics store.
+    results (list): Dicts holding the KEY_FIELDS, METRIC_FIELDS and SUMMARY_FIELD, any other entry is ignored.
+    """
+    write_header = not os.path.exists(store_path) or os.path.getsize(store_path) == 0
+    # A row cut short by an interruption is ended, so that it is skipped instead of merged with the next one
+    ended = write_header
+    fieldnames = FIELDS
+    if not write_header:
+        with open(store_path, newline="") as file:
+            fieldnames = next(csv.reader(file))
+        with open(store_path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            ended = file.read(1) == b"\n"
+    with open(store_path, "a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
+        if write_header:
+            writer.writeheader()
+        elif not ended:
+            file.write("\r\n")
+        for result in results:
+            row = {field: result.get(field) for field in FIELDS}
+            row.update(zip(KEY_FIELDS, result_key(result)))
+            if row[SUMMARY_FIELD] is not None:
+                row[SUMMARY_FIELD] = json.dumps(row[SUMMARY_FIELD])
+            row["timestamp"] = result.get("timestamp") or time.time()
+            writer.writerow(row)
+            file.flush()
@@ -0,0 +1,298 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import bitstream
+import container
+import huffman_encoder
+import predictor
+import reconstruct_original
+import residual_image
+import upload_picture
+
+# Number of band groups per worker, more groups balance the load better
+GROUPS_PER_WORKER = 4
+
+def create_shared_array(shape, dtype):
+    """
+    Allocates a shared memory block holding an array of the given shape and dtype.
+
+    Parameters:
+    shape (tuple): The shape of the array.
+    dtype (np.dtype): The dtype of the array.
+
+    Returns:
+    tuple: The SharedMemory block (close and unlink it when done), the array in it,
+           and the spec that attach_shared_array takes in the workers.
+    """
+    dtype = np.dtype(dtype)
+    size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array, (shm.name, tuple(shape), dtype.str)
+
+def attach_shared_array(spec, read_only=False):
+    """
+    Attaches to a shared memory block created by create_shared_array.
+    The block must stay referenced for as long as the array is used.
+
+    Parameters:
+    spec (tuple): The spec returned by create_shared_array.
+    read_only (bool): Whether to mark the array as read-only.
+
+    Returns:
+    tuple: The SharedMemory block (close it when done) and the array in it.
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    array.flags.writeable = not read_only
+    return shm, array
+
+def band_groups(bands, workers, band_group=None):
+    """
+    Splits the bands into contiguous groups of band_group bands.
+
+    Parameters:
+    bands (int): The number of bands.
+    workers (int): The number of workers.
+    band_group (int): The number of bands per group (GROUPS_PER_WORKER groups per worker by default).
+
+    Returns:
+    list: The (start, stop) band range of every group.
+    """
+    if band_group is None:
+        band_group = -(-bands // (workers * GROUPS_PER_WORKER))
+    band_group = max(int(band_group), 1)
+    return [(start, min(start + band_group, bands)) for start in range(0, bands, band_group)]
+
+def _predict_group(cube_spec, residual_spec, predictor_name, start, stop):
+    """
+    Worker: predicts the residual bands [start, stop) into the shared residual image
+    and returns the untouched data, the decompression key, the residual statistics and
+    the band predictors (chosen for the group with the adaptive predictor).
+    """
+    cube_shm, cube = attach_shared_array(cube_spec, read_only=True)
+    residual_shm, residual = attach_shared_array(residual_spec)
+    try:
+        inter_band = predictor_name == "inter_band_predictor"
+        # Residual band r of the inter-band predictor is band r + 1 predicted from band r
+        matrix = cube[start:stop + 1] if inter_band else cube[start:stop]
+        compression_object = upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+        # The residual is written straight into the shared residual image
+        compression_object = predictor.predict_residual(compression_object, getattr(predictor, predictor_name), out=residual[start:stop])
+        statistics = huffman_encoder.calculate_statistics(residual[start:stop].reshape(-1))
+        return compression_object.untouched_data, compression_object.decompression_key, statistics, compression_object.band_predictors
+    finally:
+        del cube, residual
+        cube_shm.close()
+        residual_shm.close()
+
+def _encode_group(residual_spec, table_bytes, start, stop, first_bit):
+    """
+    Worker: encodes the residual bands [start, stop) as if they started at bit first_bit
+    of the whole stream. Returns the packed bytes (starting at byte first_bit // 8),
+    the sync offsets and the band offsets inside the group.
+    """
+    residual_shm, residual = attach_shared_array(residual_spec)
+    try:
+        huffman_table = huffman_encoder.HuffmanTable.from_bytes(table_bytes)
+        band_size = int(np.prod(residual.shape[1:]))
+        codes, lengths = huffman_table.lookup(residual[start:stop].reshape(-1))
+    finally:
+        del residual
+        residual_shm.close()
+
+    data, _ = bitstream.pack_codes(codes, lengths, first_bit % 8)
+    code_starts = (np.cumsum(lengths) - lengths + first_bit).astype(np.uint64)
+    # The sync points of the whole stream are every SYNC_INTERVAL symbols from the first band
+    first_sync = -(start * band_size) % bitstream.SYNC_INTERVAL
+    return data, code_starts[first_sync::bitstream.SYNC_INTERVAL], code_starts[::band_size]
+
+def compress(compression_object, predictor_function, workers=None, band_group=None):
+    """
+    Predicts and Huffman encodes a cube in parallel, one group of bands per task.
+    The cube is copied once into shared memory, which every worker reads without pickling.
+
+    The first phase predicts every band group into a shared residual image and gathers its
+    statistics, from which a single Huffman table is built. The second phase encodes every
+    band group at its bit offset in the stream, which is known from the statistics, so the
+    packed groups are joined by ORing the one byte they share. The result is the same as
+    running the predictor, residual_image and huffman_encoder.encode_image (without RLE).
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original matrix.
+    predictor_function (function): The predictor to apply.
+    workers (int): The number of worker processes (all the CPUs by default).
+    band_group (int): The number of bands per task.
+
+    Returns:
+    CompressionObject: The updated CompressionObject with the residual image and the encoded image.
+    """
+    workers = workers or os.cpu_count()
+    predictor_name = predictor_function.__name__
+    inter_band = predictor_name == "inter_band_predictor"
+    matrix = compression_object.matrix
+    bands, rows, cols = matrix.shape
+    residual_shape = (bands - 1 if inter_band else bands, rows, cols)
+    groups = band_groups(residual_shape[0], workers, band_group)
+
+    cube_shm, cube, cube_spec = create_shared_array(matrix.shape, matrix.dtype)
+    residual_shm, residual, residual_spec = create_shared_array(residual_shape, residual_image.residual_dtype(matrix.dtype))
+    try:
+        cube[...] = matrix
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            start_time = time.perf_counter()
+            futures = [executor.submit(_predict_group, cube_spec, residual_spec, predictor_name, start, stop) for start, stop in groups]
+            results = [future.result() for future in futures]
+            compression_object.predict_and_residual_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            # A single table from the summed statistics of all the groups
+            # A one-band inter-band cube has no groups, its empty residual gives an empty table
+            statistics = [group_statistics for _, _, group_statistics, _ in results] or [huffman_encoder.calculate_statistics(residual)]
+            huffman_table = huffman_encoder.generate_huffman_table(huffman_encoder.merge_statistics(statistics))
+            # The length of every group in bits follows from its statistics
+            group_bits = [int(np.dot(huffman_table.lookup(symbols)[1], frequencies)) for symbols, frequencies in statistics]
+            first_bits = np.concatenate(([0], np.cumsum(group_bits, dtype=np.int64)))
+            bit_length = int(first_bits[-1])
+
+            table_bytes = huffman_table.to_bytes()
+            futures = [
+                executor.submit(_encode_group, residual_spec, table_bytes, start, stop, int(first_bit))
+                for (start, stop), first_bit in zip(groups, first_bits)
+            ]
+            encoded_image = np.zeros((bit_length + 7) // 8, dtype=np.uint8)
+            sync_index, band_index = [], []
+            for future, first_bit in zip(futures, first_bits):
+                data, group_sync, group_bands = future.result()
+                # The first byte may hold the last bits of the previous group
+                first_byte = int(first_bit) // 8
+                if data.size:
+                    encoded_image[first_byte] |= data[0]
+                    encoded_image[first_byte + 1:first_byte + data.size] = data[1:]
+                sync_index.append(group_sync)
+                band_index.append(group_bands)
+            compression_object.encode_time = time.perf_counter() - start_time
+
+        if inter_band:
+            untouched_data = results[0][0] if results else np.array(matrix[0])
+        else:
+            untouched_data = np.concatenate([untouched for untouched, _, _, _ in results])
+        compression_object.residual_image = residual.copy()
+    finally:
+        del cube, residual
+        cube_shm.close()
+        cube_shm.unlink()
+        residual_shm.close()
+        residual_shm.unlink()
+
+    compression_object.predictor_name = predictor_name
+    compression_object.untouched_data = untouched_data
+    if predictor_name == "adaptive_predictor":
+        # Every group chose the predictors of its bands, its first band is never inter-band
+        compression_object.band_predictors = [name for _, _, _, group_predictors in results for name in group_predictors]
+    compression_object.decompression_key = results[0][1] if results else None
+    compression_object.shape = residual_shape
+    compression_object.codec = huffman_table.codec
+    compression_object.huffman_table = huffman_table
+    compression_object.encoded_image = encoded_image
+    compression_object.encoded_image_bit_length = bit_length
+    compression_object.encoded_image_index = np.concatenate(sync_index + [np.zeros(0, dtype=np.uint64)])
+    compression_object.encoded_image_band_index = np.concatenate(band_index + [np.array([bit_length], dtype=np.uint64)])
+    return compression_object
+
+def _decode_group(file_path, output_spec, start, stop):
+    """
+    Worker: decodes the residual bands [start, stop) of a container file and writes the
+    reconstructed bands into the shared output. With the inter-band predictor only the
+    running sum inside the group is written; decompress adds the bands before the group.
+    """
+    output_shm, output = attach_shared_array(output_spec)
+    try:
+        with open(file_path, "rb") as file:
+            header = container.read_header(file)
+            predictor_name = header["predictor_name"]
+            if predictor_name == "adaptive_predictor":
+                # Inter-band bands need the bands before them, back to an intra-band one
+                output[start:stop] = container.load(file_path, start, stop).reconstructed_matrix
+                return
+            untouched_data = container.read_untouched_data(file, header)
+            residual = container.decode_bands(file, header, start, stop)
+
+        if predictor_name == "inter_band_predictor":
+            np.cumsum(residual, axis=0, dtype=output.dtype, out=output[start + 1:stop + 1])
+            return
+
+        compression_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=residual.shape)
+        compression_object.decompression_key = header["decompression_key"]
+        compression_object.untouched_data = untouched_data[start:stop]
+        compression_object.residual_image = residual
+        compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, getattr(predictor, predictor_name))
+        output[start:stop] = compression_object.reconstructed_matrix
+    finally:
+        del output
+        output_shm.close()
+
+def _add_to_group(output_spec, start, stop, carry):
+    """
+    Worker: adds the sum of the bands before an inter-band group to every band of the group.
+    """
+    output_shm, output = attach_shared_array(output_spec)
+    try:
+        np.add(output[start + 1:stop + 1], carry, out=output[start + 1:stop + 1], casting="unsafe")
+    finally:
+        del output
+        output_shm.close()
+
+def decompress(file_path, workers=None, band_group=None):
+    """
+    Decodes and reconstructs a container file in parallel, one group of bands per task.
+    Every worker reads only its part of the payload and writes its bands into a shared output.
+    With the inter-band predictor every group is first summed on its own, then the sum of
+    the bands before it is added in a second pass.
+
+    Parameters:
+    file_path (str): The path of the container file written by container.save.
+    workers (int): The number of worker processes (all the CPUs by default).
+    band_group (int): The number of bands per task.
+
+    Returns:
+    CompressionObject: An object with the untouched data and the reconstructed matrix.
+    """
+    workers = workers or os.cpu_count()
+    with open(file_path, "rb") as file:
+        header = container.read_header(file)
+        untouched_data = container.read_untouched_data(file, header)
+    inter_band = header["predictor_name"] == "inter_band_predictor"
+    groups = band_groups(header["residual_shape"][0], workers, band_group)
+
+    dtype = reconstruct_original.original_dtype(header["untouched_dtype"], header["dtype"])
+    output_shm, output, output_spec = create_shared_array(tuple(header["shape"]), dtype)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(_decode_group, file_path, output_spec, start, stop) for start, stop in groups]:
+                future.result()
+            if inter_band:
+                output[0] = untouched_data
+                # The bands before a group sum to the first band plus the last band of every earlier group
+                carries = [output[0].copy()]
+                for start, stop in groups[:-1]:
+                    carries.append((carries[-1] + output[stop]).astype(output.dtype))
+                futures = [executor.submit(_add_to_group, output_spec, start, stop, carry) for (start, stop), carry in zip(groups, carries)]
+                for future in futures:
+                    future.result()
+        reconstructed_matrix = output.copy()
+    finally:
+        del output
+        output_shm.close()
+        output_shm.unlink()
+
+    compression_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=tuple(header["residual_shape"]))
+    compression_object.predictor_name = header["predictor_name"]
+    compression_object.decompression_key = header["decompression_key"]
+    compression_object.band_predictors = header.get("band_predictors")
+    compression_object.untouched_data = untouched_data
+    compression_object.reconstructed_matrix = reconstructed_matrix
+    return compression_object
@@ -1,4 +1,109 @@
 import numpy as np
+import huffman_encoder
+import instrumentation
+import residual_image
+import upload_picture
+
+
+def _mean(neighbors):
+    """
+    Element-wise mean of a list of equally shaped neighbor arrays.
+    Mirrors np.mean over a per-pixel list, including its accumulator dtype.
+    """
+    return np.mean(np.stack(neighbors), axis=0)
+
+
+def _median_of_three(a, b, c):
+    """
+    Element-wise median of three equally shaped arrays.
+    """
+    return np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+
+
+def _previous_pixel_band(band):
+    """
+    Predicts a single (rows, cols) band with the previous pixel in each row.
+    """
+    predicted = np.zeros_like(band)
+    predicted[:, 1:] = band[:, :-1]  # Previous pixel in the row
+    return predicted
+
+
+def _median_edge_band(band):
+    """
+    Predicts a single (rows, cols) band with the median of the above, left and above-left pixels.
+    The first row and column only have one causal neighbor, which is used as is.
+    """
+    predicted = np.empty_like(band)
+    predicted[0, 0] = band[0, 0]  # First pixel is stored untouched
+    predicted[0, 1:] = band[0, :-1]  # Only the pixel to the left
+    predicted[1:, 0] = band[:-1, 0]  # Only the pixel above
+    above = band[:-1, 1:]
+    left = band[1:, :-1]
+    above_left = band[:-1, :-1]
+    predicted[1:, 1:] = _median_of_three(above, left, above_left)
+    return predicted
+
+
+def _wide_neighbor_band(band):
+    """
+    Predicts a single (rows, cols) band with the mean of the above, left, above-left
+    and above-right pixels that exist for each position.
+    """
+    rows, cols = band.shape
+    predicted = np.empty_like(band)
+    predicted[0, 0] = band[0, 0]  # No neighbors, the pixel itself is used
+    predicted[0, 1:] = band[0, :-1]  # Only the pixel to the left
+    if rows == 1:
+        return predicted
+
+    if cols == 1:
+        predicted[1:, 0] = band[:-1, 0]  # Only the pixel above
+        return predicted
+
+    # First column: above and above-right
+    predicted[1:, 0] = _mean([band[:-1, 0], band[:-1, 1]])
+    # Inner columns: above, left, above-left and above-right
+    predicted[1:, 1:-1] = _mean([band[:-1, 1:-1], band[1:, :-2], band[:-1, :-2], band[:-1, 2:]])
+    # Last column: above, left and above-left
+    predicted[1:, -1] = _mean([band[:-1, -1], band[1:, -2], band[:-1, -2]])
+    return predicted
+
+
+def _narrow_neighbor_band(band):
+    """
+    Predicts a single (rows, cols) band with the mean of twice the above pixel,
+    the above-left and the above-right pixels that exist for each position.
+    """
+    rows, cols = band.shape
+    predicted = np.empty_like(band)
+    predicted[0, :] = band[0, :]  # No neighbors on the first row
+    if rows == 1:
+        return predicted
+
+    double_above = 2 * band[:-1, :].astype(np.int64)  # Pixel above multiplied by 2
+    if cols == 1:
+        predicted[1:, 0] = _mean([double_above[:, 0]])
+        return predicted
+
+    # First column: above and above-right
+    predicted[1:, 0] = _mean([double_above[:, 0], band[:-1, 1]])
+    # Inner columns: above, above-left and above-right
+    predicted[1:, 1:-1] = _mean([double_above[:, 1:-1], band[:-1, :-2], band[:-1, 2:]])
+    # Last column: above and above-left
+    predicted[1:, -1] = _mean([double_above[:, -1], band[:-1, -2]])
+    return predicted
+
+
+def _column_oriented_band(band):
+    """
+    Predicts a single (rows, cols) band with four times the pixel above.
+    The product wraps in the band dtype, which leaves the modular residual unchanged.
+    """
+    predicted = np.zeros_like(band)
+    predicted[1:, :] = 4 * band[:-1, :]  # Pixel above multiplied by 4
+    return predicted
+
 
 def previous_pixel_predictor(compression_object):
     """
@@ -11,9 +116,7 @@ def previous_pixel_predictor(compression_object):
 
     for b in range(bands):
         untouched_data[b, :] = image[b, :, 0]  # First column is untouched
-        for r in range(rows):
-            for c in range(1, cols):
-                predicted[b, r, c] = image[b, r, c - 1]  # Previous pixel in the row
+        predicted[b] = _previous_pixel_band(image[b])
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -52,10 +155,10 @@ def fixed_value_predictor(compression_object, fixed_value=None):
         fixed_value = np.mean(image, axis=(1, 2))  # Compute the mean for each band
 
     predicted = np.zeros((bands, rows, cols), dtype=image.dtype)
-    untouched_data = fixed_value  # Store the fixed value for each band
+    untouched_data = np.asarray(fixed_value).astype(image.dtype)  # Store the fixed value for each band, as it is used in the prediction
 
     for b in range(bands):
-        predicted[b, :, :] = fixed_value[b]  # Predict all pixels in the band using the fixed value
+        predicted[b, :, :] = untouched_data[b]  # Predict all pixels in the band using the fixed value
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -75,24 +178,7 @@ def median_edge_detector(compression_object):
 
     for b in range(bands):
         untouched_data[b] = image[b, 0, 0]  # Store the first pixel
-        predicted[b, 0, 0] = untouched_data[b]  # Initialize the first pixel in the predicted image
-
-        for r in range(rows):
-            for c in range(cols):
-                if r == 0 and c == 0:
-                    continue
-                neighbors = []
-                if r > 0:
-                    neighbors.append(image[b, r - 1, c])  # Pixel above
-                if c > 0:
-                    neighbors.append(image[b, r, c - 1])  # Pixel to the left
-                if r > 0 and c > 0:
-                    neighbors.append(image[b, r - 1, c - 1])  # Pixel diagonally above-left
-
-                if neighbors:
-                    predicted[b, r, c] = np.median(neighbors)
-                else:
-                    predicted[b, r, c] = image[b, r, c]
+        predicted[b] = _median_edge_band(image[b])
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -112,24 +198,7 @@ def wide_neighbor_oriented(compression_object):
 
     for b in range(bands):
         untouched_data[b] = image[b, 0, 0]  # Store the first pixel
-        predicted[b, 0, 0] = untouched_data[b]  # Initialize the first pixel in the predicted image
-
-        for r in range(rows):
-            for c in range(cols):
-                neighbors = []
-                if r > 0:
-                    neighbors.append(image[b, r - 1, c])  # Pixel above
-                if c > 0:
-                    neighbors.append(image[b, r, c - 1])  # Pixel to the left
-                if r > 0 and c > 0:
-                    neighbors.append(image[b, r - 1, c - 1])  # Pixel diagonally above-left
-                if r > 0 and c < cols - 1:
-                    neighbors.append(image[b, r - 1, c + 1])  # Pixel above to the right
-
-                if neighbors:
-                    predicted[b, r, c] = np.mean(neighbors)
-                else:
-                    predicted[b, r, c] = image[b, r, c]
+        predicted[b] = _wide_neighbor_band(image[b])
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -149,20 +218,7 @@ def narrow_neighbor_oriented(compression_object):
 
     for b in range(bands):
         untouched_data[b, :] = image[b, 0, :]  # Store the first row
-        for r in range(rows):
-            for c in range(cols):
-                neighbors = []
-                if r > 0:
-                    neighbors.append(2 * int(image[b, r - 1, c]))  # Pixel above multiplied by 2
-                    if c > 0:
-                        neighbors.append(image[b, r - 1, c - 1])  # Pixel diagonally above-left
-                if r > 0 and c < cols - 1:
-                    neighbors.append(image[b, r - 1, c + 1])  # Pixel above and to the right
-
-                if neighbors:
-                    predicted[b, r, c] = np.mean(neighbors)
-                else:
-                    predicted[b, r, c] = image[b, r, c]
+        predicted[b] = _narrow_neighbor_band(image[b])
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -177,20 +233,12 @@ def column_oriented(compression_object):
     """
     image = compression_object.matrix
     bands, rows, cols = image.shape  # Adjusted to match (bands, rows, cols)
-    predicted = np.zeros((bands, rows, cols), dtype=np.int32)  # Use int32 to avoid overflow
+    predicted = np.zeros((bands, rows, cols), dtype=image.dtype)
     untouched_data = np.zeros((bands, cols), dtype=image.dtype)  # Store the first row for each band
 
     for b in range(bands):
         untouched_data[b, :] = image[b, 0, :]  # Store the first row
-        for r in range(1, rows):
-            for c in range(cols):
-                neighbors = []
-                neighbors.append(4 * int(image[b, r - 1, c]))  # Pixel above multiplied by 4
-
-                if neighbors:
-                    predicted[b, r, c] = int(np.mean(neighbors))  # Explicitly cast to int
-                else:
-                    predicted[b, r, c] = image[b, r, c]
+        predicted[b] = _column_oriented_band(image[b])
 
     compression_object.predicted_image = predicted
     compression_object.untouched_data = untouched_data
@@ -229,3 +277,212 @@ def inter_band_predictor(compression_object):
     compression_object.predictor_name = "inter_band_predictor"
     return compression_object
 
+
+# Predictors the adaptive predictor chooses from, with the shape of the untouched data they keep
+# for a band of (rows, cols) pixels
+ADAPTIVE_CANDIDATES = {
+    "previous_pixel_predictor": (previous_pixel_predictor, lambda rows, cols: (rows,)),
+    "first_pixel_predictor": (first_pixel_predictor, lambda rows, cols: ()),
+    "fixed_value_predictor": (fixed_value_predictor, lambda rows, cols: ()),
+    "median_edge_detector": (median_edge_detector, lambda rows, cols: ()),
+    "wide_neighbor_oriented": (wide_neighbor_oriented, lambda rows, cols: ()),
+    "narrow_neighbor_oriented": (narrow_neighbor_oriented, lambda rows, cols: (cols,)),
+    "column_oriented": (column_oriented, lambda rows, cols: (cols,)),
+    "inter_band_predictor": (inter_band_predictor, None)  # Nothing untouched, the band before is used
+}
+
+
+def band_predictor_costs(image, candidates=None):
+    """
+    Estimates the coded size in bits of every band of a (bands, rows, cols) image with every
+    candidate predictor: the residual entropy plus the untouched data the predictor keeps.
+    The first band has no band before it, so it is only estimated with the intra-band candidates.
+
+    Parameters:
+    image (np.array): The (bands, rows, cols) image.
+    candidates (list): The names of the predictors to try (all of ADAPTIVE_CANDIDATES by default).
+
+    Returns:
+    tuple: The candidate names and a (candidates, bands) array with the estimated sizes.
+    """
+    import estimator  # Imported here, as estimator imports this module
+
+    candidates = list(ADAPTIVE_CANDIDATES) if candidates is None else list(candidates)
+    unknown = [name for name in candidates if name not in ADAPTIVE_CANDIDATES]
+    if unknown:
+        raise ValueError(f"Unknown adaptive candidates: {unknown}")
+    if all(ADAPTIVE_CANDIDATES[name][1] is None for name in candidates):
+        raise ValueError(f"The adaptive candidates {candidates} have no intra-band predictor for the first band.")
+    bands, rows, cols = image.shape
+    costs = np.full((len(candidates), bands), np.inf)
+    # Every candidate writes its residual into the same buffer
+    residual = np.empty(image.shape, dtype=residual_image.residual_dtype(image.dtype))
+    for index, name in enumerate(candidates):
+        predictor_function, untouched_shape = ADAPTIVE_CANDIDATES[name]
+        compression_object = upload_picture.CompressionObject(matrix=image, name=None, shape=image.shape)
+        if untouched_shape is None:
+            # The first band has no band before it
+            if bands > 1:
+                predict_residual(compression_object, predictor_function, out=residual[1:])
+                _, frequencies = huffman_encoder.calculate_band_statistics(residual[1:])
+                costs[index, 1:] = [estimator.entropy_bits(band_frequencies) for band_frequencies in frequencies]
+        else:
+            predict_residual(compression_object, predictor_function, out=residual)
+            untouched_bits = int(np.prod(untouched_shape(rows, cols))) * image.dtype.itemsize * 8
+            _, frequencies = huffman_encoder.calculate_band_statistics(residual)
+            costs[index] = [estimator.entropy_bits(band_frequencies) + untouched_bits for band_frequencies in frequencies]
+    return candidates, costs
+
+
+def adaptive_predictor(compression_object, candidates=None):
+    """
+    Chooses the predictor of every band in a 3D matrix by estimating the coded size of its
+    residual with every candidate predictor (see band_predictor_costs), then predicts every
+    band with its cheapest predictor.
+    The chosen predictor names are stored in band_predictors, and the untouched data of all
+    the bands is stored one after the other in a flat array.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original 3D matrix.
+    candidates (list): The names of the predictors to choose from (all of ADAPTIVE_CANDIDATES by default).
+
+    Returns:
+    CompressionObject: The updated CompressionObject with the predicted image, untouched data and band predictors.
+    """
+    image = compression_object.matrix
+    bands, rows, cols = image.shape  # Adjusted to match (bands, rows, cols)
+    candidates, costs = band_predictor_costs(image, candidates)
+    band_predictors = [candidates[index] for index in np.argmin(costs, axis=0)]
+
+    predicted = np.zeros((bands, rows, cols), dtype=image.dtype)
+    untouched_data = []
+    for b, name in enumerate(band_predictors):
+        predictor_function, untouched_shape = ADAPTIVE_CANDIDATES[name]
+        if untouched_shape is None:
+            predicted[b] = image[b - 1]  # Use the previous band as the prediction
+            continue
+        band_object = predictor_function(upload_picture.CompressionObject(matrix=image[b:b + 1], name=None, shape=(1, rows, cols)))
+        predicted[b] = band_object.predicted_image[0]
+        untouched_data.append(np.asarray(band_object.untouched_data, dtype=image.dtype).reshape(-1))
+
+    compression_object.predicted_image = predicted
+    compression_object.untouched_data = np.concatenate(untouched_data) if untouched_data else np.zeros(0, dtype=image.dtype)
+    compression_object.band_predictors = band_predictors
+    compression_object.decompression_key = "Untouched data of the predictor chosen for each band"
+    compression_object.predictor_name = "adaptive_predictor"
+    return compression_object
+
+
+def _first_pixel_band(band):
+    """
+    Predicts a single (rows, cols) band with its first pixel.
+    """
+    return band[0, 0]
+
+
+def _fixed_value_band(band):
+    """
+    Predicts a single (rows, cols) band with its mean, truncated to the band dtype.
+    """
+    return np.asarray(np.mean(band)).astype(band.dtype)
+
+
+# Fused kernels: for every predictor, the prediction of a single band (a full band or a value
+# broadcast over it), the untouched data of the band given the band and its prediction, and the
+# decompression key
+FUSED_KERNELS = {
+    "previous_pixel_predictor": (_previous_pixel_band, lambda band, predicted: band[:, 0], "First column of each band"),
+    "first_pixel_predictor": (_first_pixel_band, lambda band, predicted: band[0, 0], "First pixel of each band"),
+    "fixed_value_predictor": (_fixed_value_band, lambda band, predicted: predicted, "Fixed value for each band"),
+    "median_edge_detector": (_median_edge_band, lambda band, predicted: band[0, 0], "First pixel of each band"),
+    "wide_neighbor_oriented": (_wide_neighbor_band, lambda band, predicted: band[0, 0], "First pixel of each band"),
+    "narrow_neighbor_oriented": (_narrow_neighbor_band, lambda band, predicted: band[0, :], "Top row of each band"),
+    "column_oriented": (_column_oriented_band, lambda band, predicted: band[0, :], "Top row of each band")
+}
+
+
+def _fused_band(name, band, out):
+    """
+    Predicts a single band with a fused kernel and writes its modular residual into out.
+
+    Returns:
+    np.array: The untouched data of the band.
+    """
+    band_predictor, band_untouched, _ = FUSED_KERNELS[name]
+    predicted = band_predictor(band)
+    untouched_data = np.array(band_untouched(band, predicted), dtype=band.dtype)
+    np.subtract(band, predicted, out=out, casting="unsafe")
+    return untouched_data
+
+
+def predict_residual(compression_object, predictor_function, out=None, keep_prediction=False, candidates=None):
+    """
+    Predicts a 3D matrix and computes its residual image in a single pass over the bands,
+    without the full predicted_image: every band is predicted and subtracted on its own, so only
+    band sized temporaries are allocated. The residual is the one the predictor followed by
+    residual_image.create_residual_image (or create_inter_band_residual) produces.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original 3D matrix.
+    predictor_function (function): The predictor to apply.
+    out (np.array): The array to write the residual into, of the residual shape and
+                    residual_image.residual_dtype (a new one by default). It must not overlap the matrix.
+    keep_prediction (bool): Whether to run the predictor itself and keep predicted_image, for diagnostics.
+    candidates (list): The names of the predictors the adaptive predictor chooses from.
+
+    Returns:
+    CompressionObject: The updated CompressionObject with the residual image, untouched data and decompression key.
+    """
+    image = compression_object.matrix
+    bands, rows, cols = image.shape
+    name = predictor_function.__name__
+    inter_band = name == "inter_band_predictor"
+    residual_shape = (bands - 1 if inter_band else bands, rows, cols)
+    if out is None:
+        out = np.empty(residual_shape, dtype=residual_image.residual_dtype(image.dtype))
+    elif out.shape != residual_shape:
+        raise ValueError(f"The residual buffer has shape {out.shape}, expected {residual_shape}.")
+
+    if keep_prediction:
+        compression_object = predictor_function(compression_object)
+        with instrumentation.stage("residual", image.nbytes):
+            if inter_band:
+                residual_image.modular_residual(image[1:], compression_object.predicted_image[1:], out=out)
+            else:
+                residual_image.modular_residual(image, compression_object.predicted_image, out=out)
+        compression_object.residual_image = out
+        compression_object.shape = out.shape
+        return compression_object
+
+    band_predictors = None
+    with instrumentation.stage("residual", image.nbytes):
+        if inter_band:
+            # Every band is predicted from the band before it
+            untouched_data = np.array(image[0])
+            for b in range(1, bands):
+                np.subtract(image[b], image[b - 1], out=out[b - 1], casting="unsafe")
+            decompression_key = "First band"
+        elif name == "adaptive_predictor":
+            candidate_names, costs = band_predictor_costs(image, candidates)
+            band_predictors = [candidate_names[index] for index in np.argmin(costs, axis=0)]
+            untouched_data = []
+            for b, band_predictor in enumerate(band_predictors):
+                if band_predictor == "inter_band_predictor":
+                    np.subtract(image[b], image[b - 1], out=out[b], casting="unsafe")  # Use the previous band as the prediction
+                else:
+                    untouched_data.append(_fused_band(band_predictor, image[b], out[b]).reshape(-1))
+            untouched_data = np.concatenate(untouched_data) if untouched_data else np.zeros(0, dtype=image.dtype)
+            decompression_key = "Untouched data of the predictor chosen for each band"
+        elif name in FUSED_KERNELS:
+            untouched_data = np.array([_fused_band(name, image[b], out[b]) for b in range(bands)], dtype=image.dtype)
+            decompression_key = FUSED_KERNELS[name][2]
+        else:
+            raise ValueError(f"No fused kernel found for predictor: {name}")
+
+    compression_object.residual_image = out
+    compression_object.untouched_data = untouched_data
+    compression_object.band_predictors = band_predictors
+    compression_object.decompression_key = decompression_key
+    compression_object.predictor_name = name
+    compression_object.shape = out.shape
+    return compression_object
@@ -0,0 +1,13 @@
+# The names of the predictors of the predictor module, in the order they are compared.
+# Only the standard library is used here, so that the command line can list them without loading numpy
+PREDICTORS = [
+    "previous_pixel_predictor",
+    "first_pixel_predictor",
+    "fixed_value_predictor",
+    "wide_neighbor_oriented",
+    "column_oriented",
+    "median_edge_detector",
+    "narrow_neighbor_oriented",
+    "inter_band_predictor",
+    "adaptive_predictor"
+]
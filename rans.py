@@ -0,0 +1,319 @@
+import struct
+import numpy as np
+import bitstream
+import huffman_decoder
+import huffman_encoder
+import instrumentation
+
+# Symbol frequencies are quantized to sum to 1 << PROB_BITS
+PROB_BITS = 16
+# Every lane keeps a state in [STATE_LOW, STATE_LOW << WORD_BITS), moving WORD_BITS bits at a time to and from its stream
+WORD_BITS = 16
+STATE_LOW = 1 << 16
+# Symbols in every lane: each lane stores its 32-bit final state, so short lanes waste space,
+# while too few lanes leave the interleaved steps with little to vectorize
+LANE_INTERVAL = 1 << 14
+
+# Class to represent a static rANS model, the quantized frequency of every symbol
+class RansTable:
+    # Name of the entropy coder, recorded with the streams coded with this table
+    codec = "rans"
+
+    def __init__(self, symbols, frequencies):
+        """
+        Initialize the RansTable and the cumulative frequencies.
+
+        Parameters:
+        symbols (np.array): The coded symbols.
+        frequencies (np.array): The quantized frequency of every symbol, summing to 1 << PROB_BITS.
+        """
+        self.symbols = np.asarray(symbols)
+        self.frequencies = np.asarray(frequencies, dtype=np.int64)
+        if self.symbols.size and (self.frequencies.min() < 1 or self.frequencies.sum() != 1 << PROB_BITS):
+            raise ValueError(f"rANS frequencies must be positive and sum to {1 << PROB_BITS}.")
+        self.starts = np.cumsum(self.frequencies) - self.frequencies
+
+    def __len__(self):
+        return self.symbols.size
+
+    @property
+    def dtype(self):
+        return self.symbols.dtype
+
+    def __str__(self):
+        return f"RansTable({len(self)} symbols, {self.symbols.dtype}, {PROB_BITS} bit precision)"
+
+    def to_bytes(self):
+        """
+        Serializes the table as its symbol dtype, the number of symbols, the symbols and their frequencies.
+        Frequencies are stored minus one, so that they fit in 16 bits.
+
+        Returns:
+        bytes: The serialized table.
+        """
+        dtype = self.symbols.dtype.newbyteorder('<')
+        header = struct.pack('<B', len(dtype.str)) + dtype.str.encode('ascii') + struct.pack('<I', len(self))
+        return header + self.symbols.astype(dtype).tobytes() + (self.frequencies - 1).astype('<u2').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds a table serialized with to_bytes.
+
+        Parameters:
+        data (bytes): The serialized table.
+
+        Returns:
+        RansTable: The table.
+        """
+        dtype_length = data[0]
+        dtype = np.dtype(data[1:1 + dtype_length].decode('ascii'))
+        offset = 1 + dtype_length
+        count, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        symbols = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += count * dtype.itemsize
+        frequencies = np.frombuffer(data, dtype='<u2', count=count, offset=offset).astype(np.int64) + 1
+        return cls(symbols.astype(dtype.newbyteorder('=')), frequencies)
+
+    def lookup(self, data):
+        """
+        Looks up the position in the table of every symbol in the data.
+
+        Parameters:
+        data (np.array): Flattened 1D array of symbols that all appear in the table.
+
+        Returns:
+        np.array: The index of every symbol in the table.
+        """
+        return huffman_encoder.symbol_positions(self.symbols, data)
+
+def quantize_frequencies(frequencies):
+    """
+    Scales symbol frequencies to sum to 1 << PROB_BITS, keeping every frequency at least 1.
+    Rounding errors are taken from (or given to) the most frequent symbols, where they cost the least.
+
+    Parameters:
+    frequencies (np.array): The frequency of every symbol.
+
+    Returns:
+    np.array: The quantized frequencies.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.int64)
+    total = 1 << PROB_BITS
+    if frequencies.size == 0:
+        return frequencies
+    if frequencies.size > total:
+        raise ValueError(f"rANS supports at most {total} distinct symbols.")
+    quantized = np.maximum((frequencies * total + frequencies.sum() // 2) // frequencies.sum(), 1)
+    excess = int(quantized.sum()) - total
+    order = np.argsort(-quantized, kind='stable')
+    if excess < 0:
+        quantized[order[0]] -= excess
+    elif excess > 0:
+        spare = quantized[order] - 1
+        quantized[order] -= np.minimum(spare, np.maximum(excess - (np.cumsum(spare) - spare), 0))
+    return quantized
+
+def generate_rans_table(pixel_statistics):
+    """
+    Generates a rANS table from pixel statistics.
+
+    Parameters:
+    pixel_statistics (tuple): The pixel values and their frequencies, as returned by huffman_encoder.calculate_statistics.
+
+    Returns:
+    RansTable: The rANS table.
+    """
+    symbols, frequencies = pixel_statistics
+    present = np.asarray(frequencies) > 0
+    return RansTable(np.asarray(symbols)[present], quantize_frequencies(np.asarray(frequencies)[present]))
+
+def lane_counts(bands, band_size, interval=LANE_INTERVAL):
+    """
+    Cuts every band into lanes of interval symbols (the last lane of a band may be shorter),
+    so that every band starts a lane of its own.
+
+    Parameters:
+    bands (int): The number of bands.
+    band_size (int): The number of symbols in a band.
+    interval (int): The number of symbols in a lane.
+
+    Returns:
+    np.array: The number of symbols in every lane.
+    """
+    if bands == 0 or band_size == 0:
+        return np.zeros(0, dtype=np.int64)
+    band_lanes = np.full(-(-band_size // interval), interval, dtype=np.int64)
+    band_lanes[-1] = band_size - (band_lanes.size - 1) * interval
+    return np.tile(band_lanes, bands)
+
+def _gather_lanes(values, lane_counts, order):
+    """
+    Inverts huffman_decoder.scatter_lanes: arranges the lanes of a flat array into a
+    (steps, lanes) array, with the lanes sorted by order.
+    """
+    longest = int(lane_counts[order[0]])
+    lane_values = np.zeros((longest, order.size), dtype=values.dtype)
+    lane_firsts = np.cumsum(lane_counts) - lane_counts
+    column = np.empty(order.size, dtype=np.int64)
+    column[order] = np.arange(order.size)
+    full = np.flatnonzero(lane_counts == longest)
+    for run in np.split(full, np.flatnonzero(np.diff(full) != 1) + 1):
+        first = lane_firsts[run[0]]
+        lane_values[:, column[run]] = values[first:first + run.size * longest].reshape(run.size, longest).T
+    for lane in np.flatnonzero(lane_counts != longest):
+        lane_values[:lane_counts[lane], column[lane]] = values[lane_firsts[lane]:lane_firsts[lane] + lane_counts[lane]]
+    return lane_values
+
+def encode_lanes(index, rans_table, lane_counts):
+    """
+    Encodes consecutive lanes of symbols, every lane with its own rANS state.
+    The lanes are interleaved: every step encodes one symbol of all the lanes at once,
+    from the last symbol to the first, as rANS decodes in the reverse order of encoding.
+    Every lane stream holds its final state in two words, followed by the words it
+    renormalized out, in the order the decoder reads them.
+
+    Parameters:
+    index (np.array): The position in the table of every symbol (RansTable.lookup).
+    rans_table (RansTable): The rANS table.
+    lane_counts (np.array): The number of symbols in every lane.
+
+    Returns:
+    tuple: The packed np.uint8 stream of 16-bit little-endian words and the bit offset of every lane.
+    """
+    lane_counts = np.asarray(lane_counts, dtype=np.int64)
+    if lane_counts.sum() == 0:
+        return np.zeros(0, dtype=np.uint8), np.zeros(lane_counts.size, dtype=np.uint64)
+    frequencies = rans_table.frequencies.astype(np.uint64)
+    starts = rans_table.starts.astype(np.uint64)
+    # A state encodes without overflowing once it is below frequency << spill_shift
+    spill_shift = np.uint64(WORD_BITS + 16 - PROB_BITS)
+
+    # Longest lanes first, so that the lanes still encoding are always a prefix
+    order = np.argsort(-lane_counts, kind='stable')
+    sorted_counts = lane_counts[order]
+    lane_index = _gather_lanes(np.asarray(index, dtype=np.int32), lane_counts, order)
+    longest = lane_index.shape[0]
+
+    states = np.full(order.size, STATE_LOW, dtype=np.uint64)
+    words = np.empty((longest, order.size), dtype=np.uint16)
+    spilled = np.zeros((longest, order.size), dtype=bool)
+    active = 0
+    for step in range(longest - 1, -1, -1):
+        while active < order.size and sorted_counts[active] > step:
+            active += 1
+        state = states[:active]
+        code_index = lane_index[step, :active]
+        frequency = frequencies[code_index]
+        # Renormalize: move the low word out of the states that would overflow
+        spill = state >= frequency << spill_shift
+        words[step, :active] = state.astype(np.uint16)
+        spilled[step, :active] = spill
+        state = np.where(spill, state >> np.uint64(WORD_BITS), state)
+        quotient, remainder = np.divmod(state, frequency)
+        states[:active] = (quotient << np.uint64(PROB_BITS)) + remainder + starts[code_index]
+
+    # Back to the lane order, the spilled words of every lane by ascending step
+    column = np.empty(order.size, dtype=np.int64)
+    column[order] = np.arange(order.size)
+    spilled = spilled[:, column].T
+    states = states[column]
+    lane_words = spilled.sum(axis=1) + 2
+    lane_starts = np.cumsum(lane_words) - lane_words
+    stream = np.empty(int(lane_words.sum()), dtype=np.uint16)
+    body = np.ones(stream.size, dtype=bool)
+    body[lane_starts] = False
+    body[lane_starts + 1] = False
+    stream[lane_starts] = (states >> np.uint64(WORD_BITS)).astype(np.uint16)
+    stream[lane_starts + 1] = states.astype(np.uint16)
+    stream[body] = words[:, column].T[spilled]
+    return stream.astype('<u2').view(np.uint8), (lane_starts * WORD_BITS).astype(np.uint64)
+
+def encode_symbols(data, shape, interval=bitstream.SYNC_INTERVAL):
+    """
+    rANS encodes a flattened residual image with its own table, in lanes of LANE_INTERVAL
+    symbols that restart at every band.
+
+    Parameters:
+    data (np.array): Flattened 1D array of pixel values.
+    shape (tuple): The (bands, rows, cols) shape of the residual image.
+    interval (int): Unused, the lanes do not depend on the sync interval of Huffman streams.
+
+    Returns:
+    tuple: The rANS table, the packed np.uint8 stream, its length in bits, the bit offset
+           of every lane and the bit offset of every band followed by the total length.
+    """
+    band_size = max(int(np.prod(shape[1:])), 1)
+    with instrumentation.stage("histogram", data.nbytes):
+        statistics = huffman_encoder.calculate_statistics(data)
+    with instrumentation.stage("table"):
+        rans_table = generate_rans_table(statistics)
+    with instrumentation.stage("encode", data.nbytes):
+        encoded_image, sync_index = encode_lanes(rans_table.lookup(data), rans_table, lane_counts(data.size // band_size, band_size))
+    bit_length = encoded_image.size * 8
+    band_index = np.append(sync_index[::-(-band_size // LANE_INTERVAL)], np.uint64(bit_length))
+    return rans_table, encoded_image, bit_length, sync_index, band_index
+
+def build_decode_table(rans_table):
+    """
+    Builds the table that resolves a symbol from the low PROB_BITS bits of a state.
+
+    Parameters:
+    rans_table (RansTable): The rANS table.
+
+    Returns:
+    dict: The symbols, their frequencies and cumulative frequencies,
+          and the symbol position of every slot.
+    """
+    return {
+        "symbols": rans_table.symbols,
+        "frequencies": rans_table.frequencies.astype(np.uint64),
+        "starts": rans_table.starts.astype(np.uint64),
+        "slots": np.repeat(np.arange(len(rans_table)), rans_table.frequencies)
+    }
+
+def decode_lanes(data, table, lane_offsets, lane_counts, out):
+    """
+    Decodes independent rANS lanes into a preallocated array.
+    Every step decodes the next symbol of all the lanes that are not finished yet.
+
+    Parameters:
+    data (np.array): The packed np.uint8 stream.
+    table (dict): The decoding table from build_decode_table.
+    lane_offsets (np.array): The bit offset where every lane starts.
+    lane_counts (np.array): The number of symbols in every lane.
+    out (np.array): Flat array the lanes are written into, one after the other.
+    """
+    lane_counts = np.asarray(lane_counts, dtype=np.int64)
+    if lane_counts.sum() == 0:
+        return
+    words = np.asarray(data, dtype=np.uint8).view('<u2').astype(np.uint64)
+    slot_mask = np.uint64((1 << PROB_BITS) - 1)
+
+    # Longest lanes first, so that the unfinished lanes are always a prefix
+    order = np.argsort(-lane_counts, kind='stable')
+    sorted_counts = lane_counts[order]
+    positions = (np.asarray(lane_offsets, dtype=np.uint64)[order] // np.uint64(WORD_BITS)).astype(np.int64)
+    states = (words[positions] << np.uint64(WORD_BITS)) | words[positions + 1]
+    positions += 2
+    longest = int(sorted_counts[0])
+    active = order.size
+
+    # Step-major buffer, so that every step writes one contiguous row
+    lane_symbols = np.empty((longest, order.size), dtype=out.dtype)
+    for step in range(longest):
+        while sorted_counts[active - 1] <= step:
+            active -= 1
+        state = states[:active]
+        slot = state & slot_mask
+        code_index = table["slots"][slot]
+        state = table["frequencies"][code_index] * (state >> np.uint64(PROB_BITS)) + slot - table["starts"][code_index]
+        # Renormalize: read the next word into the states that fell below STATE_LOW
+        refill = np.flatnonzero(state < STATE_LOW)
+        if refill.size:
+            state[refill] = (state[refill] << np.uint64(WORD_BITS)) | words[positions[refill]]
+            positions[refill] += 1
+        states[:active] = state
+        lane_symbols[step, :active] = table["symbols"][code_index]
+    huffman_decoder.scatter_lanes(lane_symbols, lane_counts, order, out)
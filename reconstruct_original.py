@@ -1,4 +1,68 @@
+import time
 import numpy as np
+import predictor
+import instrumentation
+
+def original_dtype(untouched_dtype, residual_dtype):
+    """
+    Returns the dtype of the original samples, which every predictor keeps in its untouched data.
+    Untouched data that is not integer (fixed values stored before they were rounded) falls back
+    to the residual dtype.
+
+    Parameters:
+    untouched_dtype (np.dtype): The dtype of the untouched data.
+    residual_dtype (np.dtype): The dtype of the residual image.
+
+    Returns:
+    np.dtype: The dtype to reconstruct into.
+    """
+    untouched_dtype = np.dtype(untouched_dtype)
+    return untouched_dtype if untouched_dtype.kind in "iu" else np.dtype(residual_dtype)
+
+def _original_dtype(compression_object):
+    """
+    Returns the dtype to reconstruct a CompressionObject into (see original_dtype).
+    """
+    return original_dtype(np.asarray(compression_object.untouched_data).dtype, compression_object.residual_image.dtype)
+
+def _add_prediction(residual, predicted_value, dtype):
+    """
+    Adds a (possibly fractional) prediction to the residual values modulo the width of dtype,
+    the inverse of residual_image.modular_residual. A fractional prediction is truncated first,
+    the same way assigning it into the predicted image does.
+    """
+    return (residual.astype(np.int64) + np.trunc(predicted_value).astype(np.int64)).astype(dtype)
+
+def _reconstruct_first_row_and_column(original, residual):
+    """
+    Restores the first row (left neighbor only) and the first column (above neighbor only)
+    of every band in place. The first pixel of each band must already be set.
+    """
+    bands, rows, cols = original.shape
+    for c in range(1, cols):
+        original[:, 0, c] = _add_prediction(residual[:, 0, c], original[:, 0, c - 1], original.dtype)
+    for r in range(1, rows):
+        original[:, r, 0] = _add_prediction(residual[:, r, 0], original[:, r - 1, 0], original.dtype)
+
+def _wavefront_indices(rows, cols, first_row, first_col, row_weight):
+    """
+    Yields the flat (row * cols + col) indices of each wavefront of the region starting at
+    (first_row, first_col). A wavefront holds the pixels with equal row_weight * row + col,
+    so every pixel only depends on pixels from earlier wavefronts.
+    """
+    if first_row >= rows or first_col >= cols:
+        return
+    first_step = row_weight * first_row + first_col
+    last_step = row_weight * (rows - 1) + cols - 1
+    for step in range(first_step, last_step + 1):
+        # Rows whose column (step - row_weight * row) lies inside [first_col, cols - 1]
+        low = max(first_row, -((cols - 1 - step) // row_weight))
+        high = min(rows - 1, (step - first_col) // row_weight)
+        if low > high:
+            continue
+        r = np.arange(low, high + 1)
+        c = step - row_weight * r
+        yield r * cols + c
 
 def reconstruct_previous_pixel(compression_object):
     """
@@ -8,12 +72,11 @@ def reconstruct_previous_pixel(compression_object):
     residual = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, :, 0] = untouched_data[b, :]  # Restore the first column for each band
-        for r in range(rows):
-            for c in range(1, cols):
-                original[b, r, c] = residual[b, r, c] + original[b, r, c - 1]
+    original = np.empty((bands, rows, cols), dtype=_original_dtype(compression_object))
+    original[:, :, 0] = untouched_data  # Restore the first column for each band
+    original[:, :, 1:] = residual[:, :, 1:]
+    # Every pixel is the running sum of the residuals to its left, modulo the width of the samples
+    np.cumsum(original, axis=2, dtype=original.dtype, out=original)
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -23,11 +86,8 @@ def reconstruct_first_pixel(compression_object):
     Updates the CompressionObject with the reconstructed matrix.
     """
     residual = compression_object.residual_image
-    untouched_data = compression_object.untouched_data
-    bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, :, :] = residual[b, :, :] + untouched_data[b]  # Add the first pixel value for each band
+    untouched_data = np.asarray(compression_object.untouched_data)
+    original = _add_prediction(residual, untouched_data[:, None, None], _original_dtype(compression_object))  # Add the first pixel value for each band
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -37,11 +97,8 @@ def reconstruct_fixed_value(compression_object):
     Updates the CompressionObject with the reconstructed matrix.
     """
     residual = compression_object.residual_image
-    untouched_data = compression_object.untouched_data
-    bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, :, :] = residual[b, :, :] + untouched_data[b]  # Add the fixed value for each band
+    untouched_data = np.asarray(compression_object.untouched_data)
+    original = _add_prediction(residual, untouched_data[:, None, None], _original_dtype(compression_object))  # Add the fixed value for each band
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -49,29 +106,43 @@ def reconstruct_wide_neighbor_oriented(compression_object):
     """
     Reconstructs the original image using the wide neighbor-oriented predictor.
     Updates the CompressionObject with the reconstructed matrix.
+
+    The first row only depends on the pixel to the left and is restored column by column.
+    The remaining pixels depend on their left and above-right neighbors, so they are restored
+    one (2 * row + col) wavefront at a time across all bands.
     """
     residual = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, 0, 0] = untouched_data[b]  # Restore the first pixel for each band
-        for r in range(rows):
-            for c in range(cols):
-                if r == 0 and c == 0:
-                    continue
-                neighbors = []
-                if r > 0:
-                    neighbors.append(original[b, r - 1, c])  # Pixel above
-                if c > 0:
-                    neighbors.append(original[b, r, c - 1])  # Pixel to the left
-                if r > 0 and c > 0:
-                    neighbors.append(original[b, r - 1, c - 1])  # Pixel diagonally above-left
-                if r > 0 and c < cols - 1:
-                    neighbors.append(original[b, r - 1, c + 1])  # Pixel above to the right
-                predicted_value = np.mean(neighbors) if neighbors else 0
-                original[b, r, c] = residual[b, r, c] + predicted_value
-    compression_object.reconstructed_matrix = original
+    dtype = _original_dtype(compression_object)
+    # Zero padded on the top, left and right so that missing neighbors add nothing to the sum
+    padded = np.zeros((bands, rows + 1, cols + 2), dtype=dtype)
+    original = padded[:, 1:, 1:-1]
+    original[:, 0, 0] = untouched_data  # Restore the first pixel for each band
+    for c in range(1, cols):
+        original[:, 0, c] = _add_prediction(residual[:, 0, c], original[:, 0, c - 1], dtype)
+
+    # Number of neighbors that exist for each pixel (above, left, above-left, above-right)
+    r = np.arange(rows)[:, None]
+    c = np.arange(cols)[None, :]
+    neighbor_count = ((r > 0).astype(np.int64) + (c > 0) + ((r > 0) & (c > 0)) + ((r > 0) & (c < cols - 1))).ravel()
+
+    flat_padded = padded.reshape(bands, -1)
+    flat_residual = residual.reshape(bands, -1)
+    width = cols + 2
+    for indices in _wavefront_indices(rows, cols, 1, 0, 2):
+        # Position of the above-left neighbor in the padded image
+        corner = (indices // cols) * width + indices % cols
+        neighbor_sum = (
+            flat_padded[:, corner + 1].astype(np.int64)  # Pixel above
+            + flat_padded[:, corner + width]  # Pixel to the left
+            + flat_padded[:, corner]  # Pixel diagonally above-left
+            + flat_padded[:, corner + 2]  # Pixel above to the right
+        )
+        predicted_value = neighbor_sum / neighbor_count[indices]
+        flat_padded[:, corner + width + 1] = _add_prediction(flat_residual[:, indices], predicted_value, dtype)
+
+    compression_object.reconstructed_matrix = original.copy()
     return compression_object
 
 def reconstruct_column_oriented(compression_object):
@@ -82,13 +153,11 @@ def reconstruct_column_oriented(compression_object):
     residual = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, 0, :] = untouched_data[b, :]  # Restore the first row for each band
-        for r in range(1, rows):
-            for c in range(cols):
-                predicted_value = 4 * original[b, r - 1, c]  # Pixel above multiplied by 4
-                original[b, r, c] = residual[b, r, c] + predicted_value
+    dtype = _original_dtype(compression_object)
+    original = np.empty((bands, rows, cols), dtype=dtype)
+    original[:, 0, :] = untouched_data  # Restore the first row for each band
+    for r in range(1, rows):
+        original[:, r, :] = _add_prediction(residual[:, r, :], 4 * original[:, r - 1, :].astype(np.int64), dtype)  # Pixel above multiplied by 4
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -97,26 +166,26 @@ def reconstruct_median_edge_detector(compression_object):
     """
     Reconstructs the original image using the median edge detector predictor.
     Updates the CompressionObject with the reconstructed matrix.
+
+    The first row and column have a single causal neighbor and are restored first.
+    The remaining pixels are restored one anti-diagonal (row + col) at a time across all bands.
     """
     residual = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, 0, 0] = untouched_data[b]  # Restore the first pixel for each band
-        for r in range(rows):
-            for c in range(cols):
-                if r == 0 and c == 0:
-                    continue
-                neighbors = []
-                if r > 0:
-                    neighbors.append(original[b, r - 1, c])  # Pixel above
-                if c > 0:
-                    neighbors.append(original[b, r, c - 1])  # Pixel to the left
-                if r > 0 and c > 0:
-                    neighbors.append(original[b, r - 1, c - 1])  # Pixel diagonally above-left
-                predicted_value = np.median(neighbors) if neighbors else 0
-                original[b, r, c] = residual[b, r, c] + predicted_value
+    original = np.empty((bands, rows, cols), dtype=_original_dtype(compression_object))
+    original[:, 0, 0] = untouched_data  # Restore the first pixel for each band
+    _reconstruct_first_row_and_column(original, residual)
+
+    flat_original = original.reshape(bands, -1)
+    flat_residual = residual.reshape(bands, -1)
+    for indices in _wavefront_indices(rows, cols, 1, 1, 1):
+        above = flat_original[:, indices - cols]  # Pixel above
+        left = flat_original[:, indices - 1]  # Pixel to the left
+        above_left = flat_original[:, indices - cols - 1]  # Pixel diagonally above-left
+        median = np.maximum(np.minimum(above, left), np.minimum(np.maximum(above, left), above_left))
+        flat_original[:, indices] = _add_prediction(flat_residual[:, indices], median, original.dtype)
+
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -124,24 +193,28 @@ def reconstruct_narrow_neighbor_oriented(compression_object):
     """
     Reconstructs the original image using the narrow neighbor-oriented predictor.
     Updates the CompressionObject with the reconstructed matrix.
+
+    Every pixel only depends on the row above, so a whole row is restored at a time.
     """
     residual = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual.shape
-    original = np.zeros((bands, rows, cols), dtype=residual.dtype)
-    for b in range(bands):
-        original[b, 0, :] = untouched_data[b, :]  # Restore the first row for each band
-        for r in range(1, rows):
-            for c in range(cols):
-                neighbors = []
-                if r > 0:
-                    neighbors.append(2 * original[b, r - 1, c])  # Pixel above multiplied by 2
-                    if c > 0:
-                        neighbors.append(original[b, r - 1, c - 1])  # Pixel diagonally above-left
-                if r > 0 and c < cols - 1:
-                    neighbors.append(original[b, r - 1, c + 1])  # Pixel above and to the right
-                predicted_value = np.mean(neighbors) if neighbors else 0
-                original[b, r, c] = residual[b, r, c] + predicted_value
+    original = np.empty((bands, rows, cols), dtype=_original_dtype(compression_object))
+    original[:, 0, :] = untouched_data  # Restore the first row for each band
+    for r in range(1, rows):
+        above = original[:, r - 1, :].astype(np.int64)
+        double_above = 2 * above  # Pixel above multiplied by 2
+        predicted_value = np.empty((bands, cols), dtype=np.float64)
+        if cols == 1:
+            predicted_value[:, 0] = double_above[:, 0]
+        else:
+            # First column: above and above-right
+            predicted_value[:, 0] = np.mean(np.stack([double_above[:, 0], above[:, 1]]), axis=0)
+            # Inner columns: above, above-left and above-right
+            predicted_value[:, 1:-1] = np.mean(np.stack([double_above[:, 1:-1], above[:, :-2], above[:, 2:]]), axis=0)
+            # Last column: above and above-left
+            predicted_value[:, -1] = np.mean(np.stack([double_above[:, -1], above[:, -2]]), axis=0)
+        original[:, r, :] = _add_prediction(residual[:, r, :], predicted_value, original.dtype)
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -159,10 +232,64 @@ def reconstruct_inter_band_predictor(compression_object):
     residual_stack = compression_object.residual_image
     untouched_data = compression_object.untouched_data
     bands, rows, cols = residual_stack.shape  # Ensure the shape order is bands, rows, cols
-    original = np.zeros((bands + 1, rows, cols), dtype=residual_stack.dtype)
+    original = np.empty((bands + 1, rows, cols), dtype=original_dtype(np.asarray(untouched_data).dtype, residual_stack.dtype))
     original[0, :, :] = untouched_data  # Restore the first band
-    for b in range(1, bands + 1):
-        original[b, :, :] = residual_stack[b - 1, :, :] + original[b - 1, :, :]
+    original[1:, :, :] = residual_stack
+    # Every band is the running sum of the residuals of the bands before it, modulo the width of the samples
+    np.cumsum(original, axis=0, dtype=original.dtype, out=original)
+    compression_object.reconstructed_matrix = original
+    return compression_object
+
+def adaptive_untouched_offsets(band_predictors, rows, cols):
+    """
+    Computes where the untouched data of every band starts in the flat untouched data
+    of the adaptive predictor.
+
+    Parameters:
+    band_predictors (list): The predictor name of every band.
+    rows (int): The number of rows of a band.
+    cols (int): The number of columns of a band.
+
+    Returns:
+    np.array: The start offset of every band, followed by the total size.
+    """
+    sizes = [
+        0 if untouched_shape is None else int(np.prod(untouched_shape(rows, cols)))
+        for untouched_shape in (predictor.ADAPTIVE_CANDIDATES[name][1] for name in band_predictors)
+    ]
+    return np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+
+def reconstruct_adaptive(compression_object):
+    """
+    Reconstructs the original image using the adaptive predictor.
+    Updates the CompressionObject with the reconstructed matrix.
+
+    The bands of every intra-band predictor are reconstructed together with that predictor's
+    reconstructor. The inter-band bands are then restored in order from the band before them.
+    """
+    residual = compression_object.residual_image
+    untouched_data = np.asarray(compression_object.untouched_data)
+    band_predictors = list(compression_object.band_predictors)
+    bands, rows, cols = residual.shape
+    offsets = adaptive_untouched_offsets(band_predictors, rows, cols)
+    original = np.empty((bands, rows, cols), dtype=original_dtype(untouched_data.dtype, residual.dtype))
+
+    for name in set(band_predictors):
+        predictor_function, untouched_shape = predictor.ADAPTIVE_CANDIDATES[name]
+        if untouched_shape is None:
+            continue
+        band_indices = [b for b, band_predictor in enumerate(band_predictors) if band_predictor == name]
+        group_object = type(compression_object)(matrix=None, name=compression_object.name, shape=(len(band_indices), rows, cols))
+        group_object.residual_image = residual[band_indices]
+        group_object.untouched_data = np.stack([
+            untouched_data[offsets[b]:offsets[b + 1]].reshape(untouched_shape(rows, cols)) for b in band_indices
+        ])
+        original[band_indices] = reconstruct_with_predictor(group_object, predictor_function).reconstructed_matrix
+
+    for b, name in enumerate(band_predictors):
+        if predictor.ADAPTIVE_CANDIDATES[name][1] is None:
+            original[b] = _add_prediction(residual[b], original[b - 1], original.dtype)  # Previous band plus the residual
+
     compression_object.reconstructed_matrix = original
     return compression_object
 
@@ -185,12 +312,19 @@ def reconstruct_with_predictor(compression_object, predictor_function):
         "column_oriented": reconstruct_column_oriented,
         "median_edge_detector": reconstruct_median_edge_detector,
         "narrow_neighbor_oriented": reconstruct_narrow_neighbor_oriented,
-        "inter_band_predictor": reconstruct_inter_band_predictor
+        "inter_band_predictor": reconstruct_inter_band_predictor,
+        "adaptive_predictor": reconstruct_adaptive
     }
 
     predictor_name = predictor_function.__name__
     if predictor_name in predictor_to_reconstructor:
-        return predictor_to_reconstructor[predictor_name](compression_object)
+        start_time = time.perf_counter()
+        with instrumentation.stage("reconstruct") as stage:
+            compression_object = predictor_to_reconstructor[predictor_name](compression_object)
+            stage["bytes"] = compression_object.reconstructed_matrix.nbytes
+        compression_object.reconstruct_time = time.perf_counter() - start_time
+        # The residual is consumed once the matrix is reconstructed
+        compression_object.release("residual_image", "reconstructed_residual_image")
+        return compression_object
     else:
         raise ValueError(f"No reconstructor found for predictor: {predictor_name}")
-
@@ -1,9 +1,54 @@
 import numpy as np
+import instrumentation
+
+# Number of bands subtracted at a time, which bounds the temporaries of a mixed-dtype subtraction
+CHUNK_BANDS = 16
+
+def residual_dtype(dtype):
+    """
+    Returns the dtype of the residual of samples of the given dtype: the signed integer of the
+    same width (np.int8 for np.uint8, np.int16 for np.uint16 and np.int16). The residual is taken
+    modulo 2 ** bits, which is lossless because the reconstruction adds it back modulo 2 ** bits.
+    Other dtypes keep the np.int16 residual.
+
+    Parameters:
+    dtype (np.dtype): The dtype of the original samples.
+
+    Returns:
+    np.dtype: The residual dtype.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu":
+        return np.dtype(f"i{dtype.itemsize}")
+    return np.dtype(np.int16)
+
+def modular_residual(original, predicted, out=None, chunk_bands=CHUNK_BANDS):
+    """
+    Subtracts a (bands, rows, cols) prediction from the original samples, chunk_bands bands
+    at a time and without whole-cube temporaries, wrapping the difference into residual_dtype.
+
+    Parameters:
+    original (np.array): The original samples.
+    predicted (np.array): The prediction, of any integer dtype (such as the np.int32 of column_oriented).
+    out (np.array): The array to write the residual into (a new one by default).
+    chunk_bands (int): The number of bands subtracted at a time.
+
+    Returns:
+    np.array: The residual.
+    """
+    if out is None:
+        out = np.empty(original.shape, dtype=residual_dtype(original.dtype))
+    for start in range(0, original.shape[0], chunk_bands):
+        stop = start + chunk_bands
+        # The difference wraps in the wider of the two dtypes and the cast keeps its low bits
+        np.subtract(original[start:stop], predicted[start:stop], out=out[start:stop], casting="unsafe")
+    return out
 
 def create_residual_image(compression_object):
     """
     Creates a residual image by subtracting the predicted image from the original image
     and updates the CompressionObject with the residual image.
+    The residual is modular, in the narrowest lossless dtype (see residual_dtype).
 
     Parameters:
     compression_object (CompressionObject): The object containing the original image, predicted image,
@@ -12,15 +57,13 @@ def create_residual_image(compression_object):
     Returns:
     CompressionObject: The updated CompressionObject with the residual image attribute populated.
     """
-    # Extract necessary attributes from the CompressionObject
-    original = compression_object.matrix.astype(np.int16)  # Convert to signed integer type
-    predicted = compression_object.predicted_image.astype(np.int16)  # Convert to signed integer type
-
-    # Create the residual image
-    residual = original - predicted
+    with instrumentation.stage("residual", compression_object.matrix.nbytes):
+        # Create the residual image
+        residual = modular_residual(compression_object.matrix, compression_object.predicted_image)
 
     # Update the CompressionObject with the residual image
     compression_object.residual_image = residual
+    compression_object.release("predicted_image")
 
     return compression_object
 
@@ -29,6 +72,7 @@ def create_inter_band_residual(compression_object):
     Creates a residual image for a 3D matrix (cube) using the inter-band predictor.
     Excludes the first band, as it is stored in the untouched data attribute.
     Updates the CompressionObject with the residual image.
+    The residual is modular, in the narrowest lossless dtype (see residual_dtype).
 
     Parameters:
     compression_object (CompressionObject): The object containing the original cube and predicted cube.
@@ -36,15 +80,13 @@ def create_inter_band_residual(compression_object):
     Returns:
     CompressionObject: The updated CompressionObject with the residual image attribute populated.
     """
-    # Extract necessary attributes from the CompressionObject
-    original_cube = compression_object.matrix.astype(np.int16)  # Convert to signed integer type
-    predicted_cube = compression_object.predicted_image.astype(np.int16)  # Convert to signed integer type
-
-    # Create the residual cube (excluding the first band)
-    residual_cube = original_cube[1:, :, :] - predicted_cube[1:, :, :]
+    with instrumentation.stage("residual", compression_object.matrix.nbytes):
+        # Create the residual cube (excluding the first band)
+        residual_cube = modular_residual(compression_object.matrix[1:], compression_object.predicted_image[1:])
 
     # Update the CompressionObject with the residual cube
     compression_object.residual_image = residual_cube
+    compression_object.release("predicted_image")
 
     # Adjust the shape to reflect the removal of the first band
     compression_object.shape = residual_cube.shape
@@ -0,0 +1,273 @@
+import json
+import struct
+import numpy as np
+import entropy_coder
+import predictor
+import reconstruct_original
+import upload_picture
+
+# Stream layout: magic, version, header size, JSON header, then one chunk per group of bands
+MAGIC = b'HSIS'
+VERSION = 1
+
+# Number of symbols between two sync points of a chunk. Chunks are small, so lanes are kept
+# short to still decode many of them at a time
+STREAM_SYNC_INTERVAL = 256
+
+# Chunk header: untouched data size, table size, sync point count, payload size, payload length in bits
+CHUNK_HEADER = struct.Struct('<IIIQQ')
+
+def _predict_bands(matrix, start, stop, predictor_function):
+    """
+    Predicts the bands [start, stop) and returns their CompressionObject with the residual image.
+    The inter-band predictor gets the band before them as well, except for the first chunk.
+    """
+    inter_band = predictor_function.__name__ == "inter_band_predictor"
+    bands = matrix[max(start - 1, 0):stop] if inter_band else matrix[start:stop]
+    compression_object = upload_picture.CompressionObject(matrix=np.asarray(bands), name=None, shape=bands.shape)
+    return predictor.predict_residual(compression_object, predictor_function)
+
+def encode_chunk(untouched_data, residual, codec=entropy_coder.DEFAULT_CODEC):
+    """
+    Entropy codes the residual of one chunk with its own table and packs it with the untouched data.
+
+    Parameters:
+    untouched_data (np.array): The untouched data of the chunk, or None.
+    residual (np.array): The residual of the chunk.
+    codec (str): The entropy coder, "huffman", "rans" or "golomb_rice".
+
+    Returns:
+    bytes: The chunk.
+    """
+    table_bytes = b''
+    sync_index = np.zeros(0, dtype=np.uint64)
+    payload = np.zeros(0, dtype=np.uint8)
+    bit_length = 0
+    if residual.size:
+        table, payload, bit_length, sync_index, _ = entropy_coder.encode_residual(residual, codec, STREAM_SYNC_INTERVAL)
+        if bit_length >= 1 << 32:
+            raise ValueError("A chunk is too large, use fewer bands per chunk.")
+        table_bytes = table.to_bytes()
+
+    untouched_bytes = b''
+    if untouched_data is not None:
+        untouched_data = np.ascontiguousarray(untouched_data)
+        untouched_bytes = untouched_data.astype(untouched_data.dtype.newbyteorder('<')).tobytes()
+    return b''.join((
+        CHUNK_HEADER.pack(len(untouched_bytes), len(table_bytes), sync_index.size, payload.size, bit_length),
+        untouched_bytes,
+        table_bytes,
+        sync_index.astype('<u4').tobytes(),
+        payload.tobytes()
+    ))
+
+def compress_bands(compression_object, predictor_function, bands_per_chunk=1, codec=entropy_coder.DEFAULT_CODEC):
+    """
+    Compresses a cube a few bands at a time, yielding the compressed stream piece by piece.
+    Every chunk of bands is predicted, entropy coded with its own table and released before
+    the next one is read, so only one chunk (and the band before it with the inter-band
+    predictor) is held in memory. With the adaptive predictor the predictors are chosen for
+    every chunk on its own, and every chunk starts with their indices in band_predictor_names.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original matrix,
+                                            which may be a memory-mapped view (see upload_picture.load_cube).
+    predictor_function (function): The predictor to apply.
+    bands_per_chunk (int): The number of bands in every chunk.
+    codec (str): The entropy coder, "huffman", "rans" or "golomb_rice".
+
+    Yields:
+    bytes: The stream header followed by every chunk.
+    """
+    matrix = compression_object.matrix
+    bands, rows, cols = matrix.shape
+    inter_band = predictor_function.__name__ == "inter_band_predictor"
+    adaptive = predictor_function.__name__ == "adaptive_predictor"
+    candidates = list(predictor.ADAPTIVE_CANDIDATES)
+
+    for start in range(0, bands, bands_per_chunk):
+        stop = min(start + bands_per_chunk, bands)
+        chunk_object = _predict_bands(matrix, start, stop, predictor_function)
+        # The inter-band predictor only has untouched data in the first chunk
+        untouched_data = chunk_object.untouched_data if start == 0 or not inter_band else None
+        if start == 0:
+            header = {
+                "name": compression_object.name,
+                "shape": [bands, rows, cols],
+                "dtype": chunk_object.residual_image.dtype.str,
+                "predictor_name": chunk_object.predictor_name,
+                "decompression_key": chunk_object.decompression_key,
+                "untouched_dtype": np.asarray(untouched_data).dtype.str,
+                # The untouched data of a single band
+                "untouched_shape": list(np.shape(untouched_data)[0 if inter_band else 1:]),
+                "bands_per_chunk": bands_per_chunk,
+                "codec": codec,
+                "sync_interval": STREAM_SYNC_INTERVAL
+            }
+            if adaptive:
+                header["band_predictor_names"] = candidates
+            header_bytes = json.dumps(header).encode('utf-8')
+            yield MAGIC + struct.pack('<BI', VERSION, len(header_bytes)) + header_bytes
+        if adaptive:
+            yield bytes(candidates.index(name) for name in chunk_object.band_predictors)
+        yield encode_chunk(untouched_data, chunk_object.residual_image, codec)
+        del chunk_object, untouched_data
+
+def compress_to_file(compression_object, predictor_function, file_path, bands_per_chunk=1, codec=entropy_coder.DEFAULT_CODEC):
+    """
+    Compresses a cube chunk by chunk into a stream file (see compress_bands).
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original matrix.
+    predictor_function (function): The predictor to apply.
+    file_path (str): The path of the stream file to write.
+    bands_per_chunk (int): The number of bands in every chunk.
+    codec (str): The entropy coder, "huffman", "rans" or "golomb_rice".
+
+    Returns:
+    int: The size of the written file in bytes.
+    """
+    with open(file_path, "wb") as file:
+        for piece in compress_bands(compression_object, predictor_function, bands_per_chunk, codec):
+            file.write(piece)
+        return file.tell()
+
+def read_stream_header(file):
+    """
+    Reads the header of an open stream file and leaves the file at the first chunk.
+
+    Parameters:
+    file (file): The stream file opened in binary mode.
+
+    Returns:
+    dict: The header.
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a compressed hyperspectral image stream.")
+    version, header_size = struct.unpack('<BI', file.read(5))
+    if version != VERSION:
+        raise ValueError(f"Unsupported stream version: {version}")
+    return json.loads(file.read(header_size).decode('utf-8'))
+
+def _read_exactly(file, size):
+    """
+    Reads size bytes from the file, failing on a truncated stream.
+    """
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("The stream is truncated.")
+    return data
+
+def read_chunk(file, residual_shape, dtype, untouched_dtype, sync_interval=STREAM_SYNC_INTERVAL, codec=entropy_coder.DEFAULT_CODEC,
+               band_start=0, band_stop=None):
+    """
+    Reads a chunk written by encode_chunk from the current position of an open file
+    and decodes its residual, or only the residual bands [band_start, band_stop).
+
+    Parameters:
+    file (file): The file opened in binary mode.
+    residual_shape (tuple): The shape of the residual of the chunk.
+    dtype (np.dtype): The dtype of the residual.
+    untouched_dtype (np.dtype): The dtype of the untouched data.
+    sync_interval (int): The number of symbols between two sync points.
+    codec (str): The entropy coder the chunk was written with.
+    band_start (int): The first residual band to decode.
+    band_stop (int): One past the last residual band to decode (all the bands by default).
+
+    Returns:
+    tuple: The flat untouched data (of all the bands) and the decoded residual bands.
+    """
+    untouched_size, table_size, sync_count, payload_size, bit_length = CHUNK_HEADER.unpack(_read_exactly(file, CHUNK_HEADER.size))
+    untouched_data = np.frombuffer(_read_exactly(file, untouched_size), dtype=untouched_dtype)
+    untouched_data = untouched_data.astype(untouched_dtype.newbyteorder('='))
+    table_bytes = _read_exactly(file, table_size)
+    sync_index = np.frombuffer(_read_exactly(file, sync_count * 4), dtype='<u4').astype(np.uint64)
+    payload = np.frombuffer(_read_exactly(file, payload_size), dtype=np.uint8)
+
+    band_stop = residual_shape[0] if band_stop is None else band_stop
+    if band_start == 0 and band_stop == residual_shape[0]:
+        residual = np.empty(residual_shape, dtype=dtype)
+        if residual.size:
+            entropy_coder.decode_residual(payload, entropy_coder.table_from_bytes(table_bytes, codec), sync_index, residual, sync_interval)
+    elif band_start < band_stop and table_size:
+        table = entropy_coder.table_from_bytes(table_bytes, codec)
+        residual = entropy_coder.decode_residual_bands(payload, table, sync_index, residual_shape, band_start, band_stop, sync_interval)
+    else:
+        residual = np.empty((max(band_stop - band_start, 0),) + tuple(residual_shape[1:]), dtype=dtype)
+    return untouched_data, residual
+
+def decompress_bands(file):
+    """
+    Decompresses an open stream file one chunk at a time.
+    Only the current chunk (and the band before it with the inter-band predictor) is held in memory.
+
+    Parameters:
+    file (file): The stream file opened in binary mode.
+
+    Yields:
+    The header, followed by a (start band, reconstructed bands) tuple for every chunk.
+    """
+    header = read_stream_header(file)
+    yield header
+    bands, rows, cols = header["shape"]
+    dtype = np.dtype(header["dtype"])
+    untouched_dtype = np.dtype(header["untouched_dtype"])
+    predictor_name = header["predictor_name"]
+    predictor_function = getattr(predictor, predictor_name)
+    inter_band = predictor_name == "inter_band_predictor"
+    band_predictor_names = header.get("band_predictor_names")
+
+    previous_band = None
+    for start in range(0, bands, header["bands_per_chunk"]):
+        stop = min(start + header["bands_per_chunk"], bands)
+        residual_shape = (stop - start - (inter_band and start == 0), rows, cols)
+        band_predictors = None
+        if band_predictor_names is not None:
+            band_predictors = [band_predictor_names[index] for index in _read_exactly(file, stop - start)]
+        untouched_data, residual = read_chunk(file, residual_shape, dtype, untouched_dtype, header["sync_interval"], header.get("codec", "huffman"))
+
+        if inter_band:
+            # Every band is the band before it plus its residual, modulo the width of the samples
+            original_dtype = reconstruct_original.original_dtype(untouched_dtype, dtype)
+            reconstructed = np.empty((stop - start, rows, cols), dtype=original_dtype)
+            if start == 0:
+                previous_band = untouched_data.reshape(rows, cols).astype(original_dtype)
+                reconstructed[0] = previous_band
+            predicted_bands = reconstructed[reconstructed.shape[0] - residual.shape[0]:]
+            np.cumsum(residual, axis=0, dtype=original_dtype, out=predicted_bands)
+            predicted_bands += previous_band
+            previous_band = reconstructed[-1].copy()
+            yield start, reconstructed
+            continue
+
+        chunk_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=residual.shape)
+        chunk_object.decompression_key = header["decompression_key"]
+        if band_predictors is not None:
+            chunk_object.band_predictors = band_predictors
+            chunk_object.untouched_data = untouched_data
+        else:
+            chunk_object.untouched_data = untouched_data.reshape([stop - start] + header["untouched_shape"])
+        chunk_object.residual_image = residual
+        chunk_object = reconstruct_original.reconstruct_with_predictor(chunk_object, predictor_function)
+        yield start, chunk_object.reconstructed_matrix
+
+def decompress_to_memmap(file_path, output_path):
+    """
+    Decompresses a stream file band by band into a memory-mapped (bands, rows, cols) array on disk.
+
+    Parameters:
+    file_path (str): The path of the stream file written by compress_to_file.
+    output_path (str): The path of the raw BSQ file to write the reconstructed cube into.
+
+    Returns:
+    np.memmap: The reconstructed cube, backed by output_path.
+    """
+    with open(file_path, "rb") as file:
+        bands = decompress_bands(file)
+        header = next(bands)
+        dtype = reconstruct_original.original_dtype(header["untouched_dtype"], header["dtype"])
+        output = np.memmap(output_path, dtype=dtype, mode="w+", shape=tuple(header["shape"]))
+        for start, values in bands:
+            output[start:start + len(values)] = values
+    output.flush()
+    return output
@@ -0,0 +1,142 @@
+import numpy as np
+import upload_picture
+
+# Default number of rows generated at a time, which bounds the memory used for any cube size
+STRIP_ROWS = 256
+
+def endmember_spectra(bands, endmembers, rng):
+    """
+    Draws smooth material spectra, each a sum of a few broad Gaussian absorption and reflection features.
+
+    Parameters:
+    bands (int): The number of bands.
+    endmembers (int): The number of materials.
+    rng (np.random.Generator): The random generator.
+
+    Returns:
+    np.array: The (endmembers, bands) reflectances, between 0.05 and 1.
+    """
+    wavelengths = np.linspace(0, 1, bands)
+    spectra = np.empty((endmembers, bands))
+    for k in range(endmembers):
+        centers = rng.uniform(-0.2, 1.2, 4)
+        widths = rng.uniform(0.05, 0.4, 4)
+        weights = rng.uniform(-0.5, 1, 4)
+        spectrum = rng.uniform(0.2, 0.6) + (weights[:, None] * np.exp(-0.5 * ((wavelengths - centers[:, None]) / widths[:, None]) ** 2)).sum(axis=0)
+        spectra[k] = spectrum
+    spectra -= spectra.min(axis=1, keepdims=True)
+    spectra /= np.maximum(spectra.max(axis=1, keepdims=True), 1e-9)
+    return 0.05 + 0.95 * spectra
+
+def _upsample(grid, rows, cols, row_start, row_stop, sharp):
+    """
+    Upsamples a coarse grid covering the whole band to the rows [row_start, row_stop),
+    bilinearly or, when sharp, to the nearest grid point (which gives sharp region edges).
+    """
+    grid_rows, grid_cols = grid.shape
+    y = np.arange(row_start, row_stop) * (grid_rows - 1) / max(rows - 1, 1)
+    x = np.arange(cols) * (grid_cols - 1) / max(cols - 1, 1)
+    if sharp:
+        return grid[np.rint(y).astype(np.intp)[:, None], np.rint(x).astype(np.intp)[None, :]]
+    y0 = np.minimum(y.astype(np.intp), grid_rows - 2) if grid_rows > 1 else np.zeros(y.size, dtype=np.intp)
+    x0 = np.minimum(x.astype(np.intp), grid_cols - 2) if grid_cols > 1 else np.zeros(x.size, dtype=np.intp)
+    y1, x1 = np.minimum(y0 + 1, grid_rows - 1), np.minimum(x0 + 1, grid_cols - 1)
+    fy, fx = (y - y0)[:, None], (x - x0)[None, :]
+    top = grid[y0][:, x0] * (1 - fx) + grid[y0][:, x1] * fx
+    bottom = grid[y1][:, x0] * (1 - fx) + grid[y1][:, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+def fill_scene(out, noise=2.0, edges=0.3, endmembers=5, feature_size=32, bit_depth=None, seed=0, strip_rows=STRIP_ROWS):
+    """
+    Fills a (bands, rows, cols) array, in memory or memory mapped, with a synthetic scene.
+
+    Every pixel is a mix of endmember spectra, so the bands are strongly correlated. The abundance
+    of every material is a smooth field with features of about feature_size pixels, blended with
+    piecewise constant regions (weight edges) whose borders are sharp edges. The scene is scaled
+    to the bit depth and Gaussian noise is added. The cube is written strip_rows rows at a time,
+    so any size is generated in bounded memory. The scene only depends on the arguments, including strip_rows.
+
+    Parameters:
+    out (np.array): The (bands, rows, cols) unsigned integer array to fill.
+    noise (float): The standard deviation of the noise in digital numbers.
+    edges (float): The weight of the sharp-edged regions in the abundances, between 0 and 1.
+    endmembers (int): The number of materials.
+    feature_size (int): The size in pixels of the spatial features.
+    bit_depth (int): The number of significant bits of the samples (all the bits of the dtype by default).
+    seed (int): The seed of the scene.
+    strip_rows (int): The number of rows generated at a time.
+    """
+    bands, rows, cols = out.shape
+    dtype = np.dtype(out.dtype)
+    if dtype.kind != 'u':
+        raise ValueError(f"Synthetic scenes are unsigned integer cubes, got {dtype}.")
+    max_value = (1 << (bit_depth or dtype.itemsize * 8)) - 1
+    rng = np.random.default_rng(seed)
+    spectra = endmember_spectra(bands, endmembers, rng)
+    grid_shape = (rows // feature_size + 2, cols // feature_size + 2)
+    smooth_grids = rng.random((endmembers,) + grid_shape)
+    region_grids = rng.random((endmembers,) + grid_shape) ** 4  # Mostly one dominant material per region
+    brightness_grid = rng.uniform(0.4, 1.0, grid_shape)
+
+    for strip, row_start in enumerate(range(0, rows, strip_rows)):
+        row_stop = min(row_start + strip_rows, rows)
+        abundances = np.stack([
+            (1 - edges) * _upsample(smooth_grids[k], rows, cols, row_start, row_stop, False)
+            + edges * _upsample(region_grids[k], rows, cols, row_start, row_stop, True)
+            for k in range(endmembers)
+        ])
+        abundances /= np.maximum(abundances.sum(axis=0), 1e-9)
+        abundances *= _upsample(brightness_grid, rows, cols, row_start, row_stop, False)
+        strip_rng = np.random.default_rng((seed, strip))
+        for b in range(bands):
+            band = np.tensordot(spectra[:, b], abundances, axes=1) * max_value
+            if noise:
+                band += strip_rng.normal(0, noise, band.shape)
+            out[b, row_start:row_stop] = np.clip(np.rint(band), 0, max_value)
+
+def generate_cube(shape, dtype=np.uint16, **kwargs):
+    """
+    Generates a synthetic scene in memory (see fill_scene).
+
+    Parameters:
+    shape (tuple): The (bands, rows, cols) shape of the cube.
+    dtype (np.dtype): The sample type, np.uint8 or np.uint16.
+    kwargs: Passed on to fill_scene.
+
+    Returns:
+    np.array: The cube.
+    """
+    cube = np.empty(shape, dtype=dtype)
+    fill_scene(cube, **kwargs)
+    return cube
+
+def generate_scene(file_path, shape, dtype=np.uint16, **kwargs):
+    """
+    Generates a synthetic scene straight into a .npy file, band sequential, without holding the cube
+    in memory, and memory maps it back (see upload_picture.extract_matrix_from_npy).
+
+    Parameters:
+    file_path (str): The path to the .npy file.
+    shape (tuple): The (bands, rows, cols) shape of the cube.
+    dtype (np.dtype): The sample type, np.uint8 or np.uint16.
+    kwargs: Passed on to fill_scene.
+
+    Returns:
+    CompressionObject: An instance of the CompressionObject class over the memory-mapped cube.
+    """
+    cube = np.lib.format.open_memmap(file_path, mode="w+", dtype=np.dtype(dtype), shape=tuple(shape))
+    fill_scene(cube, **kwargs)
+    cube.flush()
+    del cube
+    return upload_picture.extract_matrix_from_npy(file_path, interleave="bsq")
+
+# Main function
+def main():
+    """
+    Main function to generate a PaviaU sized test scene.
+    """
+    compression_object = generate_scene("synthetic_scene.npy", (103, 610, 340))
+    print(compression_object.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def adaptive_matrix():
+    """
+    A cube on which the adaptive predictor picks spatial predictors for some bands and the
+    inter-band predictor for others: smooth ramps, a texture and near copies of the texture.
+    """
+    rng = np.random.default_rng(14)
+    rows, cols = 21, 19
+    ramp = (np.arange(rows)[:, None] * 7 + np.arange(cols) * 3).astype(np.int16)
+    texture = rng.integers(0, 1000, (rows, cols)).astype(np.int16)
+    return np.stack([
+        ramp, texture, texture + rng.integers(0, 3, (rows, cols)), texture + rng.integers(0, 3, (rows, cols)), ramp + 5, texture
+    ]).astype(np.int16)
@@ -0,0 +1,37 @@
+import numpy as np
+import benchmark
+
+
+def test_benchmark_cube_is_reproducible():
+    cube = benchmark.benchmark_cube((3, 10, 12), seed=4)
+    assert cube.dtype == np.uint16 and cube.max() <= 4095
+    np.testing.assert_array_equal(cube, benchmark.benchmark_cube((3, 10, 12), seed=4))
+
+
+def test_run_and_compare_with_the_baseline(tmp_path, monkeypatch):
+    monkeypatch.setitem(benchmark.SIZES, "tiny", (3, 16, 16))
+    results = benchmark.run_benchmark(("tiny",), ["median_edge_detector", "inter_band_predictor"], ("huffman", "rans"), repeats=1)
+
+    assert sorted(results) == [f"tiny/{name}/{codec}" for name in ("inter_band_predictor", "median_edge_detector") for codec in ("huffman", "rans")]
+    assert {"predict", "encode", "decode"} <= set(results["tiny/median_edge_detector/huffman"])
+    baseline_path = str(tmp_path / "baseline.json")
+    benchmark.save_baseline(results, baseline_path)
+    assert benchmark.compare(results, benchmark.load_baseline(baseline_path)) == []
+    assert "tiny/median_edge_detector/rans" in benchmark.format_results(results)
+
+
+def test_compare_reports_regressions():
+    baseline = {"tiny/a/huffman": {
+        "encode": {"seconds": 1.0, "throughput": None, "peak_bytes": 10 << 20},
+        "noise": {"seconds": 0.001, "throughput": None, "peak_bytes": 1000}
+    }}
+    results = {"tiny/a/huffman": {
+        "encode": {"seconds": 1.5, "throughput": None, "peak_bytes": 20 << 20},
+        "noise": {"seconds": 0.01, "throughput": None, "peak_bytes": 100000}
+    }, "tiny/b/huffman": {"encode": {"seconds": 9.0, "throughput": None, "peak_bytes": None}}}
+
+    assert benchmark.compare(results, baseline) == [
+        ("tiny/a/huffman", "encode", "seconds", 1.0, 1.5),
+        ("tiny/a/huffman", "encode", "peak_bytes", 10 << 20, 20 << 20)
+    ]
+    assert benchmark.compare(results, baseline, tolerance=1.0) == []
@@ -0,0 +1,28 @@
+import numpy as np
+import bitstream
+
+
+def test_pack_codes():
+    data, bit_length = bitstream.pack_codes(np.array([0b1, 0b01, 0b111, 0b0000]), np.array([1, 2, 3, 4]))
+    assert bit_length == 10
+    np.testing.assert_array_equal(data, np.array([0b10111100, 0b00000000], dtype=np.uint8))
+
+
+def test_pack_and_unpack_long_codes():
+    rng = np.random.default_rng(3)
+    lengths = np.append(rng.integers(1, 64, 3000), 64)
+    codes = rng.integers(0, 1 << 63, lengths.size, dtype=np.uint64) >> (np.uint64(63) - lengths.astype(np.uint64))
+    codes[-1] = np.uint64(0xF0F0F0F0F0F0F0F0)
+    data, bit_length = bitstream.pack_codes(codes, lengths)
+    assert bit_length == lengths.sum()
+    assert data.size == (bit_length + 7) // 8
+
+    bits = bitstream.unpack_bits(data, bit_length)
+    expected = "".join(format(int(code), f"0{length}b") for code, length in zip(codes, lengths))
+    assert "".join(map(str, bits)) == expected
+
+
+def test_pack_nothing():
+    data, bit_length = bitstream.pack_codes(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
+    assert bit_length == 0
+    assert data.size == 0
@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+import cli
+
+
+@pytest.mark.parametrize("extension", [".hsic", ".hsis", ".hsit"])
+def test_generate_compress_decompress_round_trip(tmp_path, extension):
+    scene = str(tmp_path / "scene.npy")
+    compressed = str(tmp_path / f"scene{extension}")
+    output = str(tmp_path / "output.npy")
+    assert cli.main(["generate", scene, "--shape", "6,40,30", "--bit-depth", "12"]) == 0
+    assert cli.main(["compress", scene, compressed, "--tile-size", "16"]) == 0
+    assert cli.main(["decompress", compressed, output]) == 0
+
+    original = np.load(scene)
+    reconstructed = np.load(output)
+    assert original.shape == (6, 40, 30)
+    assert reconstructed.dtype == original.dtype
+    np.testing.assert_array_equal(reconstructed, original)
+
+
+def test_decompress_band_range(tmp_path):
+    scene = str(tmp_path / "scene.npy")
+    compressed = str(tmp_path / "scene.hsic")
+    output = str(tmp_path / "bands.raw")
+    cli.main(["generate", scene, "--shape", "6,20,10", "--dtype", "uint8"])
+    cli.main(["compress", scene, compressed, "--codec", "rans"])
+    cli.main(["decompress", compressed, output, "--bands", "2:5"])
+
+    original = np.load(scene)
+    np.testing.assert_array_equal(np.fromfile(output, dtype=original.dtype).reshape(3, 20, 10), original[2:5])
+
+
+def test_help_does_not_import_numpy():
+    import subprocess
+    import sys
+    code = "import sys, cli\ntry:\n    cli.main(['--help'])\nexcept SystemExit:\n    pass\nprint('numpy' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(cli.__file__), capture_output=True, text=True, check=True).stdout
+    assert output.strip().endswith("False")
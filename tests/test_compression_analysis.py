@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import compression_analysis
+import upload_picture
+
+PREDICTORS = ["median_edge_detector", "inter_band_predictor", "previous_pixel_predictor"]
+
+
+def test_evaluate_predictors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    matrix = np.random.default_rng(11).integers(0, 2000, (3, 16, 16)).astype(np.int16)
+    object_to_compress = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+    results = compression_analysis.evaluate_predictors(object_to_compress, PREDICTORS, workers=2)
+    assert [result["predictor"] for result in results] == PREDICTORS
+    assert all(result["mse"] == 0 for result in results)
+    assert all(result["compression_ratio"] > 1 for result in results)
+    for predictor_name in PREDICTORS:
+        assert (tmp_path / f"results_{predictor_name}.txt").exists()
+    assert not list(tmp_path.glob("*.hsic"))
+
+
+def test_evaluate_predictor_keeps_the_container_in_output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    matrix = np.random.default_rng(12).integers(0, 2000, (3, 16, 16)).astype(np.int16)
+    object_to_compress = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+    output_dir = tmp_path / "containers"
+    output_dir.mkdir()
+
+    result = compression_analysis.evaluate_predictor(object_to_compress, "median_edge_detector", compression_analysis.predictor.median_edge_detector,
+                                                     output_dir=str(output_dir))
+    assert (output_dir / "compressed_median_edge_detector.hsic").stat().st_size == result["container_size"]
+
+
+def test_evaluate_predictor_records_the_decode_stages():
+    matrix = np.random.default_rng(14).integers(0, 2000, (3, 16, 16)).astype(np.int16)
+    object_to_compress = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+    result = compression_analysis.evaluate_predictor(object_to_compress, "median_edge_detector", compression_analysis.predictor.median_edge_detector,
+                                                     trace=True)
+    assert all(result[field] > 0 for field in ("time_to_decode", "time_to_decode_rle", "time_to_reconstruct"))
+    assert {"decode", "decode_rle", "reconstruct"} <= set(result["stage_summary"])
+    assert not compression_analysis.instrumentation.is_active()
+
+    # A failed run stops its trace too
+    with pytest.raises(ValueError):
+        compression_analysis.evaluate_predictor(object_to_compress, "median_edge_detector", compression_analysis.predictor.median_edge_detector,
+                                                codec="lzw", trace=True)
+    assert not compression_analysis.instrumentation.is_active()
+
+
+def test_rank_predictors():
+    rng = np.random.default_rng(15)
+    scene = np.add.outer(np.arange(4) * 40, np.add.outer(np.arange(64) * 3, np.arange(24) * 2))
+    matrix = (scene + rng.integers(0, 12, scene.shape)).astype(np.int16)
+    object_to_rank = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+    ranking = compression_analysis.rank_predictors(object_to_rank, PREDICTORS)
+    ratios = [result["estimated_compression_ratio"] for result in ranking]
+
+    assert sorted(result["predictor"] for result in ranking) == sorted(PREDICTORS)
+    assert ratios == sorted(ratios, reverse=True)
+    sampled = compression_analysis.rank_predictors(object_to_rank, PREDICTORS, sample_fraction=0.5)
+    assert all(low <= high for low, high in (result["estimated_compression_ratio_bounds"] for result in sampled))
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import container
+import entropy_coder
+import predictor
+import upload_picture
+
+PREDICTORS = ["previous_pixel_predictor", "fixed_value_predictor", "median_edge_detector", "inter_band_predictor"]
+
+
+def save_cube(file_path, matrix, predictor_name, codec="huffman"):
+    compression_object = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+    compression_object = predictor.predict_residual(compression_object, getattr(predictor, predictor_name))
+    compression_object = entropy_coder.encode_image(compression_object, codec)
+    return container.save(compression_object, file_path)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return np.random.default_rng(8).integers(0, 2000, (7, 10, 12)).astype(np.int16)
+
+
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_round_trip(tmp_path, matrix, predictor_name):
+    file_path = str(tmp_path / "cube.hsic")
+    size = save_cube(file_path, matrix, predictor_name)
+
+    assert size == (tmp_path / "cube.hsic").stat().st_size
+    compression_object = container.load(file_path)
+    assert compression_object.predictor_name == predictor_name
+    np.testing.assert_array_equal(compression_object.reconstructed_matrix, matrix)
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_load_band_range(tmp_path, matrix, predictor_name, codec):
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, matrix, predictor_name, codec)
+
+    for band_start, band_stop in [(0, 1), (2, 5), (6, 7)]:
+        reconstructed = container.load(file_path, band_start, band_stop).reconstructed_matrix
+        np.testing.assert_array_equal(reconstructed, matrix[band_start:band_stop])
+
+
+def test_load_rejects_empty_band_range(tmp_path, matrix):
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, matrix, "median_edge_detector")
+
+    with pytest.raises(ValueError):
+        container.load(file_path, 2, 2)
+    with pytest.raises(ValueError):
+        container.load(file_path, 0, 8)
+
+
+def test_rejects_other_files(tmp_path):
+    file_path = tmp_path / "other.hsic"
+    file_path.write_bytes(b"not a container")
+    with pytest.raises(ValueError):
+        container.load(str(file_path))
+
+
+def test_adaptive_band_range(tmp_path, adaptive_matrix):
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, adaptive_matrix, "adaptive_predictor")
+
+    assert container.load(file_path).band_predictors == predictor.adaptive_predictor(
+        upload_picture.CompressionObject(matrix=adaptive_matrix, name=None, shape=adaptive_matrix.shape)
+    ).band_predictors
+    for band_start, band_stop in [(0, 6), (3, 4), (2, 5)]:
+        reconstructed = container.load(file_path, band_start, band_stop).reconstructed_matrix
+        np.testing.assert_array_equal(reconstructed, adaptive_matrix[band_start:band_stop])
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+def test_header_records_the_codec(tmp_path, matrix, codec):
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, matrix, "median_edge_detector", codec)
+
+    with open(file_path, "rb") as file:
+        header = container.read_header(file)
+    assert header["codec"] == codec
+    assert list(header["sections"]) == list(container.SECTIONS)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16])
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+@pytest.mark.parametrize("predictor_name", PREDICTORS + ["column_oriented", "adaptive_predictor"])
+def test_full_range_round_trip(tmp_path, predictor_name, codec, dtype):
+    info = np.iinfo(dtype)
+    matrix = np.random.default_rng(24).integers(info.min, info.max, (4, 9, 11), endpoint=True).astype(dtype)
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, matrix, predictor_name, codec)
+
+    reconstructed = container.load(file_path).reconstructed_matrix
+    assert reconstructed.dtype == matrix.dtype
+    np.testing.assert_array_equal(reconstructed, matrix)
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+def test_single_band_inter_band(tmp_path, codec):
+    matrix = np.random.default_rng(6).integers(0, 4096, (1, 8, 9)).astype(np.uint16)
+    file_path = str(tmp_path / "cube.hsic")
+    save_cube(file_path, matrix, "inter_band_predictor", codec)
+
+    np.testing.assert_array_equal(container.load(file_path).reconstructed_matrix, matrix)
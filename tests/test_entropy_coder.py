@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import entropy_coder
+import predictor
+import residual_image
+import upload_picture
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+def test_decode_residual_bands(codec):
+    residual = (np.random.default_rng(17).geometric(0.1, (5, 30, 41)) - 8).astype(np.int16)
+    table, encoded, _, sync_index, _ = entropy_coder.encode_residual(residual, codec)
+
+    for band_start, band_stop in [(0, 1), (1, 4), (4, 5), (2, 2)]:
+        decoded = entropy_coder.decode_residual_bands(encoded, table, sync_index, residual.shape, band_start, band_stop)
+        np.testing.assert_array_equal(decoded, residual[band_start:band_stop])
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+def test_encode_image(codec):
+    matrix = np.random.default_rng(18).integers(0, 2000, (4, 12, 16)).astype(np.int16)
+    compression_object = upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+    compression_object = residual_image.create_residual_image(predictor.median_edge_detector(compression_object))
+    residual = compression_object.residual_image.copy()
+    compression_object = entropy_coder.reconstruct_image(entropy_coder.encode_image(compression_object, codec))
+
+    assert compression_object.codec == codec
+    np.testing.assert_array_equal(compression_object.decoded_data, residual)
+    np.testing.assert_array_equal(compression_object.decoded_rle_data, residual)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        entropy_coder.encode_residual(np.zeros((1, 2, 2), dtype=np.int16), "lz4")
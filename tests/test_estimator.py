@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import estimator
+import huffman_encoder
+import predictor
+import residual_image
+import upload_picture
+
+PREDICTORS = ["previous_pixel_predictor", "median_edge_detector", "column_oriented", "inter_band_predictor"]
+
+
+def new_object(matrix):
+    return upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # A smooth scene with noise, so that the predictors differ
+    rng = np.random.default_rng(15)
+    bands, rows, cols = 5, 64, 24
+    scene = np.add.outer(np.arange(bands) * 40, np.add.outer(np.arange(rows) * 3, np.arange(cols) * 2))
+    return (scene + rng.integers(0, 12, scene.shape)).astype(np.int16)
+
+
+def test_entropy_bits():
+    assert estimator.entropy_bits([]) == 0.0
+    assert estimator.entropy_bits([5, 0]) == 0.0
+    assert estimator.entropy_bits([2, 2, 4]) == pytest.approx(12.0)
+
+
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_estimate_matches_the_encoder(matrix, predictor_name):
+    compression_object = getattr(predictor, predictor_name)(new_object(matrix))
+    if predictor_name == "inter_band_predictor":
+        compression_object = residual_image.create_inter_band_residual(compression_object)
+    else:
+        compression_object = residual_image.create_residual_image(compression_object)
+    compression_object = huffman_encoder.encode_image(compression_object)
+
+    estimate = estimator.estimate_predictor(matrix, getattr(predictor, predictor_name))
+    assert estimate["huffman_bits"] == compression_object.encoded_image_bit_length
+    assert estimate["huffman_bytes"] == compression_object.encoded_image.size
+    assert estimate["table_bytes"] == len(compression_object.huffman_table.to_bytes())
+    assert estimate["rle_bits"] == compression_object.encoded_image_with_rle_bit_length
+    assert estimate["entropy_bits"] <= estimate["huffman_bits"]
+
+
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_sampled_estimate(matrix, predictor_name):
+    predictor_function = getattr(predictor, predictor_name)
+    exact = estimator.estimate_predictor(matrix, predictor_function)["huffman_bytes"]
+
+    # Sampling every strip costs every pixel under the table of the whole cube
+    estimate = estimator.estimate_predictor_sampled(matrix, predictor_function, sample_fraction=1.0)
+    assert estimate["sampled_strips"] == 8
+    assert estimate["huffman_bytes"] == pytest.approx(exact, rel=1e-3, abs=1)
+    assert estimate["lower_bytes"] == pytest.approx(estimate["upper_bytes"])
+
+    estimate = estimator.estimate_predictor_sampled(matrix, predictor_function, sample_fraction=0.5, seed=1)
+    assert estimate["sampled_strips"] == 4
+    assert estimate["lower_bytes"] <= estimate["huffman_bytes"] <= estimate["upper_bytes"]
+    assert estimate["huffman_bytes"] == pytest.approx(exact, rel=0.1)
+
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import entropy_coder
+import golomb_rice
+
+
+def test_model_to_bytes():
+    model = golomb_rice.GolombRiceModel(np.int16, 7, 9)
+    restored = entropy_coder.table_from_bytes(model.to_bytes(), "golomb_rice")
+    assert (restored.dtype, restored.rows, restored.cols) == (np.dtype(np.int16), 7, 9)
+
+
+@pytest.mark.parametrize("rows, cols", [(4, 6), (1, 5), (5, 1)])
+def test_wavefront_layout(rows, cols):
+    order, left, up, step_starts = golomb_rice.wavefront_layout(rows, cols)
+    r, c = np.divmod(order, cols)
+
+    assert sorted(order) == list(range(rows * cols))
+    assert np.all(np.diff(r + c) >= 0)
+    assert step_starts[0] == 0 and step_starts[-1] == rows * cols
+    # The neighbors are coded in an earlier anti-diagonal
+    positions = np.arange(rows * cols)
+    step = np.searchsorted(step_starts, positions, side='right')
+    for neighbor in (left, up):
+        present = neighbor < rows * cols
+        assert np.all(step[neighbor[present]] < step[present])
+    assert np.all((left == rows * cols) == (c == 0))
+    assert np.all((up == rows * cols) == (r == 0))
+
+
+@pytest.mark.parametrize("shape", [(3, 21, 19), (1, 1, 1), (2, 1, 40), (2, 33, 1)])
+def test_round_trip(shape):
+    rng = np.random.default_rng(19)
+    residual = (rng.geometric(0.05, shape) * rng.choice([-1, 1], shape)).astype(np.int16)
+    # Values far from their neighbors are escaped
+    residual.reshape(-1)[::17] = rng.integers(-1 << 15, 1 << 15, residual.reshape(-1)[::17].size)
+    model, encoded, bit_length, sync_index, band_index = entropy_coder.encode_residual(residual, "golomb_rice")
+
+    assert (encoded.size, band_index[-1]) == ((bit_length + 7) // 8, bit_length)
+    assert sync_index.size == shape[0]
+    decoded = np.empty_like(residual)
+    entropy_coder.decode_residual(encoded, model, sync_index, decoded)
+    np.testing.assert_array_equal(decoded, residual)
+
+
+def test_encoding_in_chunks(monkeypatch):
+    rng = np.random.default_rng(21)
+    residual = (rng.geometric(0.1, (7, 13, 11)) * rng.choice([-1, 1], (7, 13, 11))).astype(np.int16)
+    residual.reshape(-1)[::29] = rng.integers(-1 << 15, 1 << 15, residual.reshape(-1)[::29].size)
+    expected = golomb_rice.encode_symbols(residual.reshape(-1), residual.shape)
+
+    # Five bands at a time, with the statistics of two bands tabulated at a time
+    monkeypatch.setattr(golomb_rice, "ENCODE_CHUNK_PIXELS", 5 * 13 * 11)
+    monkeypatch.setattr(golomb_rice, "STEP_TABLE_SIZE", 2 * 23 * golomb_rice.CONTEXTS)
+    encoded = golomb_rice.encode_symbols(residual.reshape(-1), residual.shape)
+    np.testing.assert_array_equal(encoded[1], expected[1])
+    np.testing.assert_array_equal(encoded[4], expected[4])
+    decoded = np.empty(residual.size, dtype=np.int16)
+    golomb_rice.decode_lanes(encoded[1], golomb_rice.build_decode_table(encoded[0]), encoded[3], np.full(7, 13 * 11), decoded)
+    np.testing.assert_array_equal(decoded, residual.reshape(-1))
+
+
+def test_adapts_to_the_magnitudes():
+    rng = np.random.default_rng(20)
+    small = rng.integers(-2, 3, (1, 64, 64)).astype(np.int16)
+    large = rng.integers(-2000, 2001, (1, 64, 64)).astype(np.int16)
+    small_bits = entropy_coder.encode_residual(small, "golomb_rice")[2]
+    large_bits = entropy_coder.encode_residual(large, "golomb_rice")[2]
+
+    assert small_bits < 3 * small.size
+    assert large_bits < 13 * large.size
+
+
+def test_lanes_must_be_whole_bands():
+    residual = np.zeros((2, 4, 4), dtype=np.int16)
+    model, encoded, _, sync_index, _ = entropy_coder.encode_residual(residual, "golomb_rice")
+    with pytest.raises(ValueError):
+        golomb_rice.decode_lanes(encoded, golomb_rice.build_decode_table(model), sync_index, [8, 8], np.empty(16, dtype=np.int16))
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+import huffman_decoder
+import huffman_encoder
+import upload_picture
+
+
+def encoded_object(residual):
+    compression_object = upload_picture.CompressionObject(matrix=None, name=None, shape=residual.shape)
+    compression_object.residual_image = residual
+    return huffman_encoder.encode_image(compression_object)
+
+
+def fibonacci(count):
+    frequencies = [1, 1]
+    while len(frequencies) < count:
+        frequencies.append(frequencies[-1] + frequencies[-2])
+    return np.array(frequencies, dtype=np.int64)
+
+
+def test_round_trip():
+    residual = (np.random.default_rng(4).geometric(0.3, (2, 12, 10)) - 3).astype(np.int16)
+    residual[1, 3:7] = 0  # Some runs for the RLE stream
+    compression_object = huffman_decoder.reconstruct_image(encoded_object(residual))
+
+    np.testing.assert_array_equal(compression_object.reconstructed_residual_image, residual)
+    np.testing.assert_array_equal(compression_object.reconstructed_rle_residual_image, residual)
+
+
+def test_round_trip_over_many_lanes():
+    residual = (np.random.default_rng(6).geometric(0.05, (3, 40, 50)) - 10).astype(np.int16)
+    compression_object = huffman_decoder.reconstruct_image(encoded_object(residual))
+
+    assert len(compression_object.encoded_image_index) > 1
+    np.testing.assert_array_equal(compression_object.reconstructed_residual_image, residual)
+    np.testing.assert_array_equal(compression_object.reconstructed_rle_residual_image, residual)
+
+
+def test_encoded_image_is_packed():
+    residual = (np.random.default_rng(5).geometric(0.3, (2, 12, 10)) - 3).astype(np.int16)
+    compression_object = encoded_object(residual)
+
+    assert compression_object.encoded_image.dtype == np.uint8
+    assert compression_object.encoded_image.size == (compression_object.encoded_image_bit_length + 7) // 8
+    _, lengths = compression_object.huffman_table.lookup(residual.flatten())
+    assert compression_object.encoded_image_bit_length == lengths.sum()
+
+
+def test_code_lengths_are_optimal():
+    frequencies = np.array([5, 9, 12, 13, 16, 45])
+    lengths = huffman_encoder.huffman_code_lengths(frequencies)
+    assert int(np.dot(lengths, frequencies)) == 224
+    assert np.sum(2.0 ** -lengths) == 1.0
+
+
+def test_canonical_table_round_trip():
+    huffman_table = huffman_encoder.HuffmanTable(np.array([-3, 7, 0, 2], dtype=np.int16), np.array([3, 2, 1, 3]))
+    assert huffman_table.codes.tolist() == [0b0, 0b10, 0b110, 0b111]
+    assert huffman_table.symbols.tolist() == [0, 7, -3, 2]
+
+    restored = huffman_encoder.HuffmanTable.from_bytes(huffman_table.to_bytes())
+    assert restored.symbols.dtype == np.int16
+    np.testing.assert_array_equal(restored.symbols, huffman_table.symbols)
+    np.testing.assert_array_equal(restored.codes, huffman_table.codes)
+
+
+def test_code_lengths_are_limited():
+    lengths = huffman_encoder.huffman_code_lengths(fibonacci(80))
+    assert lengths.max() <= huffman_encoder.MAX_CODE_LENGTH
+    assert np.sum(2.0 ** -lengths) <= 1.0
+    huffman_table = huffman_encoder.HuffmanTable(np.arange(80), lengths)
+    assert huffman_decoder.build_decode_table(huffman_table)["width"] <= huffman_encoder.MAX_CODE_LENGTH
+
+    lengths = huffman_encoder.huffman_code_lengths(fibonacci(20), max_length=8)
+    assert lengths.max() <= 8
+    assert np.sum(2.0 ** -lengths) <= 1.0
+
+
+def test_decoder_rejects_long_codes():
+    huffman_table = huffman_encoder.HuffmanTable(np.arange(62), huffman_encoder.huffman_code_lengths(fibonacci(62), max_length=64))
+    with pytest.raises(ValueError):
+        huffman_decoder.build_decode_table(huffman_table)
+
+
+def test_run_length_encode():
+    values, counts = huffman_encoder.run_length_encode(np.array([4, 4, 4, -1, 0, 0, 4], dtype=np.int16))
+    assert values.tolist() == [4, -1, 0, 4]
+    assert counts.tolist() == [3, 1, 2, 1]
+    assert values.dtype == np.int16
+
+    values, counts = huffman_encoder.run_length_encode(np.zeros(0, dtype=np.int16))
+    assert values.size == 0 and counts.size == 0
+
+
+def test_zigzag_round_trip():
+    values = np.array([0, -1, 1, -2, 2, -32768, 32767], dtype=np.int16)
+    mapped = huffman_encoder.zigzag_encode(values)
+    assert mapped.tolist() == [0, 1, 2, 3, 4, 65535, 65534]
+    np.testing.assert_array_equal(huffman_encoder.zigzag_decode(mapped, np.int16), values)
+
+
+@pytest.mark.parametrize("values", [
+    np.array([3, -1, 3, 0, -1, 3, 7], dtype=np.int16),
+    np.array([65535, 0, 65535, 12], dtype=np.uint16),
+    np.array([-1 << 40, 1 << 40, 5, 5], dtype=np.int64),  # Too wide for the dense histogram
+])
+def test_calculate_statistics(values):
+    symbols, frequencies = huffman_encoder.calculate_statistics(values)
+    expected = dict(zip(*np.unique(values, return_counts=True)))
+    assert symbols.dtype == values.dtype
+    assert dict(zip(symbols.tolist(), frequencies.tolist())) == expected
+
+
+def test_calculate_band_statistics():
+    image = np.array([[[0, 1], [1, 1]], [[-2, 0], [0, 0]]], dtype=np.int16)
+    symbols, frequencies = huffman_encoder.calculate_band_statistics(image)
+    assert dict(zip(symbols.tolist(), frequencies[0].tolist())) == {0: 1, 1: 3, -2: 0}
+    assert dict(zip(symbols.tolist(), frequencies[1].tolist())) == {0: 3, 1: 0, -2: 1}
@@ -0,0 +1,64 @@
+import numpy as np
+import compression_analysis
+import instrumentation
+import predictor
+import upload_picture
+
+
+def test_stages_are_only_recorded_while_active():
+    with instrumentation.stage("predict", 100) as record:
+        pass
+    assert "duration" not in record and not instrumentation.is_active()
+
+    trace = instrumentation.start(trace_memory=False)
+    try:
+        with instrumentation.stage("encode", 2000000):
+            with instrumentation.stage("pack"):
+                pass
+    finally:
+        assert instrumentation.stop() is trace
+    assert [record["name"] for record in trace.stages] == ["pack", "encode"]
+    assert trace.stages[0]["depth"] == 1 and trace.stages[1]["depth"] == 0
+    assert trace.stages[1]["throughput"] > 0
+    assert trace.stages[1]["peak_bytes"] is None
+
+
+def test_peak_memory_includes_the_nested_stages():
+    trace = instrumentation.start()
+    try:
+        with instrumentation.stage("outer"):
+            with instrumentation.stage("inner"):
+                buffer = np.ones(1 << 20, dtype=np.uint8)
+                del buffer
+    finally:
+        instrumentation.stop()
+    inner, outer = trace.stages
+    assert inner["peak_bytes"] >= 1 << 20
+    assert outer["peak_bytes"] >= inner["peak_bytes"]
+
+
+def test_summary_and_chrome_trace(tmp_path):
+    stages = [
+        {"name": "decode", "start": 2.0, "duration": 0.5, "bytes": 1000000, "throughput": 2.0, "peak_bytes": 10, "pid": 1, "tid": 1},
+        {"name": "decode", "start": 1.0, "duration": 0.5, "bytes": 1000000, "throughput": 2.0, "peak_bytes": 30, "pid": 2, "tid": 1}
+    ]
+    summary = instrumentation.summarize(stages)["decode"]
+    assert (summary["calls"], summary["seconds"], summary["bytes"], summary["peak_bytes"]) == (2, 1.0, 2000000, 30)
+    assert summary["throughput"] == 2.0
+
+    events = instrumentation.chrome_trace(stages)["traceEvents"]
+    assert [event["pid"] for event in events] == [2, 1]
+    assert events[0]["ph"] == "X" and events[0]["ts"] == 1e6
+
+
+def test_evaluate_predictor_records_its_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    matrix = np.random.default_rng(23).integers(0, 2000, (3, 16, 16)).astype(np.int16)
+    object_to_compress = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+    result = compression_analysis.evaluate_predictor(
+        object_to_compress, "median_edge_detector", predictor.median_edge_detector, trace=True
+    )
+    names = {record["name"] for record in result["stages"]}
+    assert {"predict", "encode", "decode"} <= names
+    assert not instrumentation.is_active()
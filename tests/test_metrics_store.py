@@ -0,0 +1,70 @@
+import numpy as np
+import compression_analysis
+import metrics_store
+
+
+def result(predictor_name, compression_ratio):
+    values = {field: 1.0 for field in metrics_store.METRIC_FIELDS}
+    values.update(scene="scene", predictor=predictor_name, codec="huffman", parameters="", compression_ratio=compression_ratio)
+    return values
+
+
+def test_append_and_load(tmp_path):
+    store_path = str(tmp_path / "metrics.csv")
+    metrics_store.append_results(store_path, [result("median_edge_detector", 2.0), result("column_oriented", 1.5)])
+    metrics_store.append_results(store_path, [result("median_edge_detector", 2.5)])
+
+    results = metrics_store.load_results(store_path)
+    assert [row["predictor"] for row in results] == ["median_edge_detector", "column_oriented"]
+    assert results[0]["compression_ratio"] == 2.5
+    assert metrics_store.load_results(store_path, predictor="column_oriented")[0]["compression_ratio"] == 1.5
+
+
+def test_interrupted_row_is_skipped(tmp_path):
+    store_path = str(tmp_path / "metrics.csv")
+    metrics_store.append_results(store_path, [result("median_edge_detector", 2.0)])
+    with open(store_path, "a", newline="") as file:
+        file.write("scene,column_oriented,huffman,,0.0,12")  # Cut short, without a line end
+    metrics_store.append_results(store_path, [result("wide_neighbor_oriented", 1.8)])
+
+    assert metrics_store.measured_keys(store_path) == {
+        ("scene", "median_edge_detector", "huffman", ""),
+        ("scene", "wide_neighbor_oriented", "huffman", "")
+    }
+
+
+def test_stage_summary_and_older_stores(tmp_path):
+    store_path = str(tmp_path / "metrics.csv")
+    summary = {"decode": {"calls": 1, "seconds": 0.5, "bytes": 8, "throughput": 1.6e-05, "peak_bytes": None}}
+    traced = dict(result("median_edge_detector", 2.0), stage_summary=summary)
+    metrics_store.append_results(store_path, [traced])
+    assert metrics_store.load_results(store_path)[0]["stage_summary"] == summary
+
+    # A store written before the decode times were recorded keeps its columns
+    old_store_path = str(tmp_path / "old.csv")
+    old_fields = [field for field in metrics_store.FIELDS if field not in ("time_to_decode", "time_to_decode_rle", "time_to_reconstruct", "stage_summary")]
+    with open(old_store_path, "w", newline="") as file:
+        file.write(",".join(old_fields) + "\r\n")
+    metrics_store.append_results(old_store_path, [traced])
+    loaded = metrics_store.load_results(old_store_path)[0]
+    assert loaded["compression_ratio"] == 2.0
+    assert loaded["time_to_decode"] is None and loaded["stage_summary"] is None
+
+
+def test_sweep_resumes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scene = str(tmp_path / "scene.npy")
+    np.save(scene, np.random.default_rng(13).integers(0, 80, (3, 16, 16)).astype(np.uint8))
+    store_path = str(tmp_path / "metrics.csv")
+
+    compression_analysis.sweep([scene], ["median_edge_detector"], store_path=store_path, workers=1)
+    assert len(metrics_store.load_results(store_path)) == 1
+    with open(store_path) as file:
+        rows = file.read()
+
+    # The measured combination is skipped, only the new one is appended
+    results = compression_analysis.sweep([scene], ["median_edge_detector", "column_oriented"], store_path=store_path, workers=1)
+    assert [row["predictor"] for row in results] == ["median_edge_detector", "column_oriented"]
+    with open(store_path) as file:
+        assert file.read().startswith(rows)
+    assert not list(tmp_path.glob("*.hsic"))
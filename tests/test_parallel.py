@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import container
+import huffman_encoder
+import parallel
+import predictor
+import residual_image
+import upload_picture
+
+PREDICTORS = ["previous_pixel_predictor", "fixed_value_predictor", "median_edge_detector", "column_oriented", "inter_band_predictor"]
+
+
+def new_object(matrix):
+    return upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return np.random.default_rng(9).integers(0, 2000, (7, 21, 19)).astype(np.int16)
+
+
+def test_band_groups():
+    assert parallel.band_groups(10, 2, band_group=4) == [(0, 4), (4, 8), (8, 10)]
+    groups = parallel.band_groups(10, 2)
+    assert groups[0][0] == 0 and groups[-1][1] == 10
+    assert all(stop == start for (_, stop), (start, _) in zip(groups, groups[1:]))
+    assert parallel.band_groups(0, 4) == []
+
+
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_parallel_matches_serial(tmp_path, matrix, predictor_name):
+    predictor_function = getattr(predictor, predictor_name)
+    serial_path = str(tmp_path / "serial.hsic")
+    parallel_path = str(tmp_path / "parallel.hsic")
+    compression_object = predictor_function(new_object(matrix))
+    if predictor_name == "inter_band_predictor":
+        compression_object = residual_image.create_inter_band_residual(compression_object)
+    else:
+        compression_object = residual_image.create_residual_image(compression_object)
+    container.save(huffman_encoder.encode_image(compression_object), serial_path)
+    container.save(parallel.compress(new_object(matrix), predictor_function, workers=2, band_group=2), parallel_path)
+
+    with open(serial_path, "rb") as serial, open(parallel_path, "rb") as parallel_file:
+        assert serial.read() == parallel_file.read()
+    reconstructed = parallel.decompress(parallel_path, workers=2, band_group=2).reconstructed_matrix
+    np.testing.assert_array_equal(reconstructed, matrix)
+
+
+def test_single_band_inter_band(tmp_path):
+    matrix = np.random.default_rng(10).integers(0, 255, (1, 9, 7)).astype(np.uint8)
+    file_path = str(tmp_path / "cube.hsic")
+    container.save(parallel.compress(new_object(matrix), predictor.inter_band_predictor, workers=2), file_path)
+
+    np.testing.assert_array_equal(parallel.decompress(file_path, workers=2).reconstructed_matrix, matrix)
+    np.testing.assert_array_equal(container.load(file_path).reconstructed_matrix, matrix)
+
+
+def test_adaptive(tmp_path, adaptive_matrix):
+    file_path = str(tmp_path / "cube.hsic")
+    compression_object = parallel.compress(new_object(adaptive_matrix), predictor.adaptive_predictor, workers=2, band_group=3)
+    container.save(compression_object, file_path)
+
+    assert compression_object.band_predictors[3] != "inter_band_predictor"
+    np.testing.assert_array_equal(parallel.decompress(file_path, workers=2, band_group=2).reconstructed_matrix, adaptive_matrix)
+    np.testing.assert_array_equal(container.load(file_path, 4, 6).reconstructed_matrix, adaptive_matrix[4:6])
+
+
+@pytest.mark.parametrize("predictor_name", ["median_edge_detector", "column_oriented", "inter_band_predictor"])
+def test_full_range_uint16(tmp_path, predictor_name):
+    matrix = np.random.default_rng(24).integers(0, 1 << 16, (5, 17, 13)).astype(np.uint16)
+    file_path = str(tmp_path / "cube.hsic")
+    container.save(parallel.compress(new_object(matrix), getattr(predictor, predictor_name), workers=2, band_group=2), file_path)
+
+    reconstructed = parallel.decompress(file_path, workers=2, band_group=2).reconstructed_matrix
+    assert reconstructed.dtype == matrix.dtype
+    np.testing.assert_array_equal(reconstructed, matrix)
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+import predictor
+import reconstruct_original
+import residual_image
+import synthetic
+import upload_picture
+
+SPATIAL_PREDICTORS = [
+    "previous_pixel_predictor",
+    "median_edge_detector",
+    "wide_neighbor_oriented",
+    "narrow_neighbor_oriented",
+    "column_oriented"
+]
+
+
+def new_object(matrix):
+    return upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+
+
+def reference_prediction(name, image):
+    """
+    Predicts every pixel on its own from the list of its neighbors.
+    """
+    bands, rows, cols = image.shape
+    predicted = np.zeros(image.shape, dtype=image.dtype)
+    for b in range(bands):
+        for r in range(rows):
+            for c in range(cols):
+                above = r > 0
+                left = c > 0
+                right = c < cols - 1
+                if name == "previous_pixel_predictor":
+                    if left:
+                        predicted[b, r, c] = image[b, r, c - 1]
+                    continue
+                if name == "column_oriented":
+                    if above:
+                        # Four times the pixel above, wrapped into the image dtype
+                        predicted[b, r, c] = np.int64(4 * int(image[b, r - 1, c])).astype(image.dtype)
+                    continue
+                if name == "median_edge_detector":
+                    neighbors = [image[b, r - 1, c]] if above else []
+                    neighbors += [image[b, r, c - 1]] if left else []
+                    neighbors += [image[b, r - 1, c - 1]] if above and left else []
+                    predicted[b, r, c] = np.median(neighbors) if neighbors else image[b, r, c]
+                elif name == "wide_neighbor_oriented":
+                    neighbors = [image[b, r - 1, c]] if above else []
+                    neighbors += [image[b, r, c - 1]] if left else []
+                    neighbors += [image[b, r - 1, c - 1]] if above and left else []
+                    neighbors += [image[b, r - 1, c + 1]] if above and right else []
+                    predicted[b, r, c] = np.mean(neighbors) if neighbors else image[b, r, c]
+                else:
+                    neighbors = [2 * int(image[b, r - 1, c])] if above else []
+                    neighbors += [image[b, r - 1, c - 1]] if above and left else []
+                    neighbors += [image[b, r - 1, c + 1]] if above and right else []
+                    predicted[b, r, c] = np.mean(neighbors) if neighbors else image[b, r, c]
+    return predicted
+
+
+@pytest.mark.parametrize("shape", [(2, 5, 6), (1, 1, 7), (2, 6, 1)])
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.uint16])
+@pytest.mark.parametrize("predictor_name", SPATIAL_PREDICTORS)
+def test_spatial_predictors_match_the_per_pixel_reference(predictor_name, dtype, shape):
+    info = np.iinfo(dtype)
+    image = np.random.default_rng(1).integers(max(info.min, -1000), min(info.max, 1000), shape, endpoint=True).astype(dtype)
+    compression_object = getattr(predictor, predictor_name)(new_object(image))
+
+    expected = reference_prediction(predictor_name, image)
+    assert compression_object.predicted_image.dtype == expected.dtype
+    np.testing.assert_array_equal(compression_object.predicted_image, expected)
+    assert compression_object.predictor_name == predictor_name
+
+
+def test_untouched_data():
+    image = np.arange(2 * 3 * 4, dtype=np.int16).reshape(2, 3, 4)
+    np.testing.assert_array_equal(predictor.previous_pixel_predictor(new_object(image)).untouched_data, image[:, :, 0])
+    np.testing.assert_array_equal(predictor.median_edge_detector(new_object(image)).untouched_data, image[:, 0, 0])
+    np.testing.assert_array_equal(predictor.column_oriented(new_object(image)).untouched_data, image[:, 0, :])
+    np.testing.assert_array_equal(predictor.inter_band_predictor(new_object(image)).predicted_image[1:], image[:-1])
+
+
+def test_adaptive_predictor_picks_the_cheapest_predictor_of_every_band(adaptive_matrix):
+    compression_object = predictor.adaptive_predictor(new_object(adaptive_matrix))
+    candidates, costs = predictor.band_predictor_costs(adaptive_matrix)
+
+    assert compression_object.band_predictors == [candidates[index] for index in np.argmin(costs, axis=0)]
+    assert compression_object.band_predictors[0] != "inter_band_predictor"
+    assert set(compression_object.band_predictors[2:4]) == {"inter_band_predictor"}
+    assert compression_object.predictor_name == "adaptive_predictor"
+
+
+@pytest.mark.parametrize("candidates", [["inter_band_predictor"], ["inter_band_predictor", "unknown_predictor"]])
+def test_adaptive_predictor_needs_an_intra_band_candidate(adaptive_matrix, candidates):
+    with pytest.raises(ValueError):
+        predictor.adaptive_predictor(new_object(adaptive_matrix), candidates)
+    with pytest.raises(ValueError):
+        predictor.predict_residual(new_object(adaptive_matrix), predictor.adaptive_predictor, candidates=candidates)
+
+
+def test_adaptive_predictor_only_uses_the_band_before_after_the_first_band(adaptive_matrix):
+    compression_object = predictor.adaptive_predictor(new_object(adaptive_matrix), ["inter_band_predictor", "first_pixel_predictor"])
+
+    assert compression_object.band_predictors[0] == "first_pixel_predictor"
+
+
+@pytest.fixture(scope="module", params=["uint8", "uint16", "int16"])
+def matrix(request):
+    if request.param == "int16":
+        return np.random.default_rng(10).integers(-1 << 15, 1 << 15, (3, 7, 9)).astype(np.int16)
+    return synthetic.generate_cube((5, 11, 13), np.dtype(request.param), seed=11)
+
+
+@pytest.mark.parametrize("predictor_name", sorted(predictor.FUSED_KERNELS) + ["inter_band_predictor", "adaptive_predictor"])
+def test_fused_kernels_match_the_two_step_pipeline(matrix, predictor_name):
+    predictor_function = getattr(predictor, predictor_name)
+    expected = predictor_function(new_object(matrix))
+    if predictor_name == "inter_band_predictor":
+        expected = residual_image.create_inter_band_residual(expected)
+    else:
+        expected = residual_image.create_residual_image(expected)
+    fused = predictor.predict_residual(new_object(matrix), predictor_function)
+
+    assert fused.residual_image.dtype == residual_image.residual_dtype(matrix.dtype)
+    np.testing.assert_array_equal(fused.residual_image, expected.residual_image)
+    np.testing.assert_array_equal(np.asarray(fused.untouched_data), np.asarray(expected.untouched_data))
+    assert fused.decompression_key == expected.decompression_key
+    assert fused.band_predictors == expected.band_predictors
+    assert fused.predicted_image is None
+
+    reconstructed = reconstruct_original.reconstruct_with_predictor(fused, predictor_function).reconstructed_matrix
+    assert reconstructed.dtype == matrix.dtype
+    np.testing.assert_array_equal(reconstructed, matrix)
+
+
+def test_predict_residual_into_a_buffer(matrix):
+    out = np.zeros(matrix.shape, dtype=residual_image.residual_dtype(matrix.dtype))
+    compression_object = predictor.predict_residual(new_object(matrix), predictor.median_edge_detector, out=out, keep_prediction=True)
+
+    assert compression_object.residual_image is out
+    assert compression_object.predicted_image is not None
+    expected = residual_image.create_residual_image(predictor.median_edge_detector(new_object(matrix)))
+    np.testing.assert_array_equal(out, expected.residual_image)
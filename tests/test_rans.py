@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import entropy_coder
+import predictor
+import rans
+import synthetic
+import upload_picture
+
+
+def test_quantize_frequencies():
+    quantized = rans.quantize_frequencies(np.array([1, 1, 1000000, 3, 0]))
+    assert quantized.sum() == 1 << rans.PROB_BITS
+    assert quantized.min() >= 1
+    assert rans.quantize_frequencies(np.array([7])).tolist() == [1 << rans.PROB_BITS]
+    assert rans.quantize_frequencies(np.zeros(0)).size == 0
+
+
+def test_table_to_bytes():
+    table = rans.generate_rans_table((np.array([-3, 0, 5], dtype=np.int16), np.array([10, 0, 30])))
+    restored = entropy_coder.table_from_bytes(table.to_bytes(), "rans")
+    np.testing.assert_array_equal(restored.symbols, [-3, 5])
+    np.testing.assert_array_equal(restored.frequencies, table.frequencies)
+
+
+def test_lane_counts_restart_at_every_band():
+    assert rans.lane_counts(2, 5, 2).tolist() == [2, 2, 1, 2, 2, 1]
+    assert rans.lane_counts(0, 5, 2).size == 0
+
+
+@pytest.mark.parametrize("shape", [(3, 40, 37), (1, 1, 1), (2, 1, 300), (2, 130, 131)])
+def test_round_trip(shape):
+    residual = (np.random.default_rng(16).geometric(0.1, shape) - 8).astype(np.int16)
+    table, encoded, bit_length, sync_index, band_index = entropy_coder.encode_residual(residual, "rans")
+
+    assert bit_length == encoded.size * 8
+    assert band_index.size == shape[0] + 1
+    decoded = np.empty_like(residual)
+    entropy_coder.decode_residual(encoded, table, sync_index, decoded)
+    np.testing.assert_array_equal(decoded, residual)
+
+
+def test_smaller_than_huffman_on_a_median_edge_detector_residual():
+    matrix = synthetic.generate_cube((4, 128, 128), np.uint16, bit_depth=12, seed=1)
+    compression_object = upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+    residual = predictor.predict_residual(compression_object, predictor.median_edge_detector).residual_image
+    assert entropy_coder.encode_residual(residual, "rans")[1].size < entropy_coder.encode_residual(residual, "huffman")[1].size
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import predictor
+import predictor_names
+import reconstruct_original
+import residual_image
+import upload_picture
+
+
+def round_trip(matrix, predictor_name):
+    predictor_function = getattr(predictor, predictor_name)
+    compression_object = predictor_function(upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape))
+    if predictor_name == "inter_band_predictor":
+        compression_object = residual_image.create_inter_band_residual(compression_object)
+    else:
+        compression_object = residual_image.create_residual_image(compression_object)
+    return reconstruct_original.reconstruct_with_predictor(compression_object, predictor_function).reconstructed_matrix
+
+
+@pytest.mark.parametrize("shape", [(3, 9, 11), (2, 1, 6), (2, 7, 1)])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16])
+@pytest.mark.parametrize("predictor_name", predictor_names.PREDICTORS)
+def test_reconstruct_round_trip(predictor_name, dtype, shape):
+    # The full range of the dtype, where the predictions and the residual wrap
+    info = np.iinfo(dtype)
+    matrix = np.random.default_rng(2).integers(info.min, info.max, shape, endpoint=True).astype(dtype)
+    reconstructed = round_trip(matrix, predictor_name)
+    assert reconstructed.dtype == matrix.dtype
+    np.testing.assert_array_equal(reconstructed, matrix)
+
+
+@pytest.mark.parametrize("dtype, expected", [(np.uint8, np.int8), (np.uint16, np.int16), (np.int16, np.int16), (np.float32, np.int16)])
+def test_residual_dtype(dtype, expected):
+    assert residual_image.residual_dtype(dtype) == np.dtype(expected)
+
+
+def test_modular_residual_wraps():
+    original = np.array([[[0, 255, 10]]], dtype=np.uint8)
+    predicted = np.array([[[255, 0, 1034]]], dtype=np.int32)
+    residual = residual_image.modular_residual(original, predicted, chunk_bands=1)
+    assert residual.dtype == np.int8
+    assert residual.tolist() == [[[1, -1, 0]]]
+
+
+def test_unknown_predictor():
+    def unknown_predictor(compression_object):
+        return compression_object
+
+    with pytest.raises(ValueError):
+        reconstruct_original.reconstruct_with_predictor(upload_picture.CompressionObject(None, None, None), unknown_predictor)
+
+
+@pytest.mark.parametrize("candidates", [None, ["median_edge_detector", "column_oriented", "inter_band_predictor"]])
+def test_adaptive_round_trip(adaptive_matrix, candidates):
+    compression_object = upload_picture.CompressionObject(matrix=adaptive_matrix, name=None, shape=adaptive_matrix.shape)
+    compression_object = residual_image.create_residual_image(predictor.adaptive_predictor(compression_object, candidates))
+    reconstructed = reconstruct_original.reconstruct_with_predictor(compression_object, predictor.adaptive_predictor).reconstructed_matrix
+    np.testing.assert_array_equal(reconstructed, adaptive_matrix)
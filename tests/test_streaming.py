@@ -0,0 +1,79 @@
+import io
+import numpy as np
+import pytest
+import entropy_coder
+import predictor
+import streaming
+import upload_picture
+
+PREDICTORS = ["previous_pixel_predictor", "fixed_value_predictor", "median_edge_detector", "column_oriented", "inter_band_predictor"]
+
+
+def new_object(matrix):
+    return upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return np.random.default_rng(12).integers(0, 2000, (6, 21, 19)).astype(np.int16)
+
+
+@pytest.mark.parametrize("bands_per_chunk", [1, 4])
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_round_trip(tmp_path, matrix, predictor_name, bands_per_chunk):
+    file_path = str(tmp_path / "cube.hsis")
+    size = streaming.compress_to_file(new_object(matrix), getattr(predictor, predictor_name), file_path, bands_per_chunk)
+
+    assert size == (tmp_path / "cube.hsis").stat().st_size
+    reconstructed = streaming.decompress_to_memmap(file_path, str(tmp_path / "cube.raw"))
+    assert isinstance(reconstructed, np.memmap)
+    np.testing.assert_array_equal(reconstructed, matrix)
+
+
+def test_chunks_are_decoded_one_at_a_time(matrix):
+    stream = io.BytesIO(b"".join(streaming.compress_bands(new_object(matrix), predictor.inter_band_predictor, bands_per_chunk=2)))
+    bands = streaming.decompress_bands(stream)
+    header = next(bands)
+
+    assert header["shape"] == list(matrix.shape)
+    chunks = list(bands)
+    assert [start for start, _ in chunks] == [0, 2, 4]
+    np.testing.assert_array_equal(np.concatenate([values for _, values in chunks]), matrix)
+
+
+def test_single_band_inter_band(tmp_path):
+    matrix = np.random.default_rng(13).integers(0, 255, (1, 9, 7)).astype(np.uint8)
+    file_path = str(tmp_path / "cube.hsis")
+    streaming.compress_to_file(new_object(matrix), predictor.inter_band_predictor, file_path)
+
+    np.testing.assert_array_equal(streaming.decompress_to_memmap(file_path, str(tmp_path / "cube.raw")), matrix)
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+@pytest.mark.parametrize("predictor_name", ["median_edge_detector", "inter_band_predictor"])
+def test_codecs(tmp_path, matrix, predictor_name, codec):
+    file_path = str(tmp_path / "cube.hsis")
+    streaming.compress_to_file(new_object(matrix), getattr(predictor, predictor_name), file_path, 4, codec)
+
+    with open(file_path, "rb") as file:
+        assert streaming.read_stream_header(file)["codec"] == codec
+    np.testing.assert_array_equal(streaming.decompress_to_memmap(file_path, str(tmp_path / "cube.raw")), matrix)
+
+
+@pytest.mark.parametrize("bands_per_chunk", [1, 4])
+def test_adaptive(tmp_path, adaptive_matrix, bands_per_chunk):
+    file_path = str(tmp_path / "cube.hsis")
+    streaming.compress_to_file(new_object(adaptive_matrix), predictor.adaptive_predictor, file_path, bands_per_chunk)
+
+    np.testing.assert_array_equal(streaming.decompress_to_memmap(file_path, str(tmp_path / "cube.raw")), adaptive_matrix)
+
+
+@pytest.mark.parametrize("predictor_name", ["median_edge_detector", "column_oriented", "inter_band_predictor"])
+def test_full_range_uint16(tmp_path, predictor_name):
+    matrix = np.random.default_rng(24).integers(0, 1 << 16, (5, 17, 13)).astype(np.uint16)
+    file_path = str(tmp_path / "cube.hsis")
+    streaming.compress_to_file(new_object(matrix), getattr(predictor, predictor_name), file_path, 2)
+
+    reconstructed = streaming.decompress_to_memmap(file_path, str(tmp_path / "cube.raw"))
+    assert reconstructed.dtype == matrix.dtype
+    np.testing.assert_array_equal(reconstructed, matrix)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import synthetic
+
+
+def test_cube_is_reproducible_and_in_range():
+    cube = synthetic.generate_cube((4, 20, 30), np.uint16, bit_depth=12, seed=3)
+    assert cube.dtype == np.uint16 and cube.max() <= 4095
+    np.testing.assert_array_equal(cube, synthetic.generate_cube((4, 20, 30), np.uint16, bit_depth=12, seed=3))
+    assert not np.array_equal(cube, synthetic.generate_cube((4, 20, 30), np.uint16, bit_depth=12, seed=4))
+
+
+def test_bands_are_correlated():
+    cube = synthetic.generate_cube((6, 64, 64), np.uint8, noise=0.5, seed=5).astype(np.float64)
+    assert np.corrcoef(cube[3].reshape(-1), cube[4].reshape(-1))[0, 1] > 0.9
+
+
+def test_strips_cover_the_whole_cube():
+    out = np.full((2, 10, 7), 255, dtype=np.uint8)
+    synthetic.fill_scene(out, bit_depth=6, seed=1, strip_rows=3)
+    assert out.max() <= 63
+    assert out.std() > 0
+
+
+def test_scene_is_written_to_npy(tmp_path):
+    file_path = str(tmp_path / "scene.npy")
+    compression_object = synthetic.generate_scene(file_path, (3, 12, 9), np.uint16, seed=2)
+
+    assert isinstance(compression_object.matrix, np.memmap)
+    np.testing.assert_array_equal(compression_object.matrix, synthetic.generate_cube((3, 12, 9), np.uint16, seed=2))
+    np.testing.assert_array_equal(np.load(file_path), compression_object.matrix)
+
+
+def test_signed_dtypes_are_rejected():
+    with pytest.raises(ValueError):
+        synthetic.generate_cube((1, 4, 4), np.int16)
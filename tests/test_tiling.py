@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import entropy_coder
+import predictor
+import tiling
+import upload_picture
+
+PREDICTORS = ["previous_pixel_predictor", "median_edge_detector", "column_oriented", "inter_band_predictor"]
+
+
+def new_object(matrix):
+    return upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return np.random.default_rng(13).integers(0, 2000, (6, 21, 19)).astype(np.int16)
+
+
+def test_tile_windows():
+    assert tiling.tile_windows(5, 3, 2) == [(0, 2, 0, 2), (0, 2, 2, 3), (2, 4, 0, 2), (2, 4, 2, 3), (4, 5, 0, 2), (4, 5, 2, 3)]
+
+
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+def test_round_trip(tmp_path, matrix, predictor_name):
+    file_path = str(tmp_path / "cube.hsit")
+    size = tiling.compress(new_object(matrix), getattr(predictor, predictor_name), file_path, tile_size=8)
+
+    assert size == (tmp_path / "cube.hsit").stat().st_size
+    decompressed = tiling.load_region(file_path)
+    assert decompressed.predictor_name == predictor_name
+    np.testing.assert_array_equal(decompressed.reconstructed_matrix, matrix)
+
+
+@pytest.mark.parametrize("codec", entropy_coder.CODECS)
+@pytest.mark.parametrize("predictor_name", PREDICTORS)
+@pytest.mark.parametrize("bands", [(0, 1), (2, 5), (5, 6)])
+def test_region(tmp_path, matrix, predictor_name, bands, codec):
+    file_path = str(tmp_path / "cube.hsit")
+    tiling.compress(new_object(matrix), getattr(predictor, predictor_name), file_path, tile_size=8, codec=codec)
+
+    region = tiling.load_region(file_path, 3, 17, 5, 12, *bands).reconstructed_matrix
+    np.testing.assert_array_equal(region, matrix[bands[0]:bands[1], 3:17, 5:12])
+
+
+def test_invalid_region(tmp_path, matrix):
+    file_path = str(tmp_path / "cube.hsit")
+    tiling.compress(new_object(matrix), predictor.median_edge_detector, file_path, tile_size=8)
+
+    with pytest.raises(ValueError):
+        tiling.load_region(file_path, 4, 4)
+    with pytest.raises(ValueError):
+        tiling.load_region(file_path, band_start=2, band_stop=7)
+
+
+@pytest.mark.parametrize("predictor_name", ["median_edge_detector", "inter_band_predictor"])
+def test_workers(tmp_path, matrix, predictor_name):
+    serial_path = str(tmp_path / "serial.hsit")
+    parallel_path = str(tmp_path / "parallel.hsit")
+    tiling.compress(new_object(matrix), getattr(predictor, predictor_name), serial_path, tile_size=8)
+    tiling.compress(new_object(matrix), getattr(predictor, predictor_name), parallel_path, tile_size=8, workers=2)
+
+    with open(serial_path, "rb") as serial, open(parallel_path, "rb") as parallel_file:
+        assert serial.read() == parallel_file.read()
+    region = tiling.load_region(parallel_path, 0, 10, 4, 19, 1, 6, workers=2).reconstructed_matrix
+    np.testing.assert_array_equal(region, matrix[1:6, 0:10, 4:19])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_adaptive(tmp_path, adaptive_matrix, workers):
+    file_path = str(tmp_path / "cube.hsit")
+    tiling.compress(new_object(adaptive_matrix), predictor.adaptive_predictor, file_path, tile_size=8, workers=workers)
+
+    np.testing.assert_array_equal(tiling.load_region(file_path, workers=workers).reconstructed_matrix, adaptive_matrix)
+    region = tiling.load_region(file_path, 3, 17, 5, 12, 3, 5).reconstructed_matrix
+    np.testing.assert_array_equal(region, adaptive_matrix[3:5, 3:17, 5:12])
+
+
+@pytest.mark.parametrize("predictor_name", ["median_edge_detector", "column_oriented", "inter_band_predictor"])
+def test_full_range_uint16(tmp_path, predictor_name):
+    matrix = np.random.default_rng(24).integers(0, 1 << 16, (5, 17, 13)).astype(np.uint16)
+    file_path = str(tmp_path / "cube.hsit")
+    tiling.compress(new_object(matrix), getattr(predictor, predictor_name), file_path, tile_size=8)
+
+    region = tiling.load_region(file_path, 2, 15, 3, 13, 1, 4).reconstructed_matrix
+    assert region.dtype == matrix.dtype
+    np.testing.assert_array_equal(region, matrix[1:4, 2:15, 3:13])
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+import scipy.io as sio
+import entropy_coder
+import predictor
+import reconstruct_original
+import residual_image
+import upload_picture
+
+
+@pytest.fixture(scope="module")
+def cube():
+    return np.arange(3 * 4 * 5, dtype=np.uint16).reshape(3, 4, 5)
+
+
+def test_npy_defaults_to_band_sequential(tmp_path, cube):
+    file_path = str(tmp_path / "cube.npy")
+    np.save(file_path, cube)
+    compression_object = upload_picture.load_cube(file_path)
+
+    assert isinstance(compression_object.matrix, np.memmap)
+    assert compression_object.shape == cube.shape
+    assert compression_object.name == "cube"
+    np.testing.assert_array_equal(compression_object.matrix, cube)
+
+
+@pytest.mark.parametrize("interleave, axes", [("bil", (1, 0, 2)), ("bip", (1, 2, 0))])
+def test_npy_interleave(tmp_path, cube, interleave, axes):
+    file_path = str(tmp_path / "cube.npy")
+    np.save(file_path, cube.transpose(axes))
+    np.testing.assert_array_equal(upload_picture.load_cube(file_path, interleave=interleave).matrix, cube)
+
+
+@pytest.mark.parametrize("interleave, axes", [("bsq", (0, 1, 2)), ("bil", (1, 0, 2)), ("bip", (1, 2, 0))])
+def test_raw_interleave(tmp_path, cube, interleave, axes):
+    file_path = str(tmp_path / "cube.raw")
+    (tmp_path / "cube.raw").write_bytes(b"\0" * 16 + np.ascontiguousarray(cube.transpose(axes)).astype('>u2').tobytes())
+    compression_object = upload_picture.load_cube(file_path, shape=cube.shape, dtype='>u2', interleave=interleave, offset=16)
+    np.testing.assert_array_equal(compression_object.matrix, cube)
+
+
+def test_mat_detects_the_cube(tmp_path, cube):
+    file_path = str(tmp_path / "scene.mat")
+    sio.savemat(file_path, {"small": np.zeros((2, 2, 2)), "scene_cube": cube.transpose(1, 2, 0), "labels": np.ones((4, 5))})
+    compression_object = upload_picture.load_cube(file_path)
+
+    assert compression_object.name == "scene_cube"
+    np.testing.assert_array_equal(compression_object.matrix, cube)
+    with pytest.raises(ValueError):
+        upload_picture.load_cube(file_path, matrix_name="missing")
+
+
+def test_hdf5_mat(tmp_path, cube):
+    h5py = pytest.importorskip("h5py")
+    file_path = str(tmp_path / "scene.mat")
+    with h5py.File(file_path, "w") as mat_file:
+        mat_file["scene"] = cube.transpose(0, 2, 1)  # Column-major (rows, cols, bands)
+    compression_object = upload_picture.load_cube(file_path)
+
+    assert isinstance(compression_object.matrix.base, np.memmap)
+    np.testing.assert_array_equal(compression_object.matrix, cube)
+
+
+def test_split_into_band_matrices_is_a_view(cube):
+    stored = np.ascontiguousarray(cube.transpose(1, 2, 0))
+    bands = upload_picture.split_into_band_matrices(stored)
+    assert np.shares_memory(bands, stored)
+    np.testing.assert_array_equal(bands, cube)
+
+
+def run_pipeline(matrix, lean):
+    compression_object = upload_picture.CompressionObject(matrix=matrix, name="scene", shape=matrix.shape, lean=lean)
+    compression_object = residual_image.create_residual_image(predictor.median_edge_detector(compression_object))
+    compression_object = entropy_coder.reconstruct_image(entropy_coder.encode_image(compression_object))
+    return reconstruct_original.reconstruct_with_predictor(compression_object, predictor.median_edge_detector)
+
+
+def test_compression_object_has_slots():
+    compression_object = upload_picture.CompressionObject(matrix=None, name=None, shape=(1, 1, 1))
+    with pytest.raises(AttributeError):
+        compression_object.typo = 1
+
+
+@pytest.mark.parametrize("lean", [False, True])
+def test_lean_pipeline(lean):
+    matrix = np.random.default_rng(21).integers(0, 2000, (3, 12, 10)).astype(np.int16)
+    compression_object = run_pipeline(matrix, lean)
+    arrays = compression_object.arrays()
+
+    np.testing.assert_array_equal(compression_object.reconstructed_matrix, matrix)
+    for attribute in ("predicted_image", "residual_image", "decoded_rle_data"):
+        assert (attribute in arrays) != lean
+    # The RLE stream of a lean object is decoded when it is read
+    np.testing.assert_array_equal(compression_object.reconstructed_rle_residual_image, matrix - predictor.median_edge_detector(
+        upload_picture.CompressionObject(matrix=matrix, name=None, shape=matrix.shape)
+    ).predicted_image)
+    assert compression_object.nbytes() <= sum(array.nbytes for array in compression_object.arrays().values())
+
+
+def test_lean_object_holds_less():
+    matrix = np.random.default_rng(22).integers(0, 2000, (3, 12, 10)).astype(np.int16)
+    lean_object, full_object = run_pipeline(matrix, True), run_pipeline(matrix, False)
+
+    assert lean_object.nbytes() < full_object.nbytes()
+    assert "Lean: True" in str(lean_object)
+    assert "scene" in repr(lean_object)
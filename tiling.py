@@ -0,0 +1,244 @@
+import json
+import struct
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import entropy_coder
+import parallel
+import predictor
+import reconstruct_original
+import residual_image
+import streaming
+import upload_picture
+
+# File layout: magic, version, header size, JSON header (with the tile index), then the tile chunks
+MAGIC = b'HSIT'
+VERSION = 1
+
+# Default height and width of a tile
+TILE_SIZE = 64
+
+def tile_windows(rows, cols, tile_size=TILE_SIZE):
+    """
+    Cuts a band into tiles of tile_size x tile_size pixels (smaller on the bottom and right edges).
+
+    Parameters:
+    rows (int): The number of rows of a band.
+    cols (int): The number of columns of a band.
+    tile_size (int): The height and width of a tile.
+
+    Returns:
+    list: The (row_start, row_stop, col_start, col_stop) window of every tile, row by row.
+    """
+    return [
+        (row, min(row + tile_size, rows), col, min(col + tile_size, cols))
+        for row in range(0, rows, tile_size)
+        for col in range(0, cols, tile_size)
+    ]
+
+def _compress_window(matrix, predictor_function, window, codec=entropy_coder.DEFAULT_CODEC):
+    """
+    Predicts one tile through all the bands and encodes it into a chunk with its own table.
+    Returns the chunk, the shape and dtype of the untouched data, the decompression key and
+    the band predictors (chosen for the tile with the adaptive predictor).
+    """
+    row_start, row_stop, col_start, col_stop = window
+    tile = np.asarray(matrix[:, row_start:row_stop, col_start:col_stop])
+    compression_object = upload_picture.CompressionObject(matrix=tile, name=None, shape=tile.shape)
+    compression_object = predictor.predict_residual(compression_object, predictor_function)
+    untouched_data = np.asarray(compression_object.untouched_data)
+    chunk = streaming.encode_chunk(untouched_data, compression_object.residual_image, codec)
+    return chunk, list(untouched_data.shape), untouched_data.dtype.str, compression_object.decompression_key, compression_object.band_predictors
+
+def _compress_shared_window(cube_spec, predictor_name, window, codec):
+    """
+    Worker: compresses one tile of the read-only shared cube.
+    """
+    cube_shm, cube = parallel.attach_shared_array(cube_spec, read_only=True)
+    try:
+        result = _compress_window(cube, getattr(predictor, predictor_name), window, codec)
+    finally:
+        cube = None
+        cube_shm.close()
+    return result
+
+def compress(compression_object, predictor_function, file_path, tile_size=TILE_SIZE, workers=1, codec=entropy_coder.DEFAULT_CODEC):
+    """
+    Compresses a cube tile by tile into a tiled file (.hsit).
+    Every tile is a tile_size x tile_size window through all the bands that is predicted and
+    entropy coded on its own with its own table, so tiles can be decoded independently.
+    The header holds the index of the tiles with their file offset and size.
+
+    Parameters:
+    compression_object (CompressionObject): The object containing the original matrix.
+    predictor_function (function): The predictor to apply to every tile.
+    file_path (str): The path of the tiled file to write.
+    tile_size (int): The height and width of a tile.
+    workers (int): The number of worker processes that compress tiles, sharing the cube in shared memory.
+    codec (str): The entropy coder, "huffman", "rans" or "golomb_rice".
+
+    Returns:
+    int: The size of the written file in bytes.
+    """
+    matrix = compression_object.matrix
+    bands, rows, cols = matrix.shape
+    windows = tile_windows(rows, cols, tile_size)
+
+    if workers > 1:
+        cube_shm, cube, cube_spec = parallel.create_shared_array(matrix.shape, matrix.dtype)
+        try:
+            cube[...] = matrix
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    _compress_shared_window, [cube_spec] * len(windows), [predictor_function.__name__] * len(windows), windows, [codec] * len(windows)
+                ))
+        finally:
+            del cube
+            cube_shm.close()
+            cube_shm.unlink()
+    else:
+        results = [_compress_window(matrix, predictor_function, window, codec) for window in windows]
+
+    tiles = []
+    offset = 0
+    for window, (chunk, untouched_shape, _, _, band_predictors) in zip(windows, results):
+        tiles.append({"window": list(window), "offset": offset, "size": len(chunk), "untouched_shape": untouched_shape})
+        if band_predictors is not None:
+            tiles[-1]["band_predictors"] = band_predictors
+        offset += len(chunk)
+    header = {
+        "name": compression_object.name,
+        "shape": [bands, rows, cols],
+        "tile_size": tile_size,
+        "predictor_name": predictor_function.__name__,
+        "decompression_key": results[0][3],
+        "dtype": residual_image.residual_dtype(matrix.dtype).str,  # The residual dtype of residual_image
+        "untouched_dtype": results[0][2],
+        "codec": codec,
+        "sync_interval": streaming.STREAM_SYNC_INTERVAL,
+        "tiles": tiles
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    with open(file_path, "wb") as file:
+        file.write(MAGIC + struct.pack('<BI', VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        for chunk, _, _, _, _ in results:
+            file.write(chunk)
+        return file.tell()
+
+def read_header(file):
+    """
+    Reads the header of an open tiled file.
+
+    Parameters:
+    file (file): The tiled file opened in binary mode.
+
+    Returns:
+    dict: The header, with the absolute file offset of the first tile under "data_offset".
+    """
+    file.seek(0)
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a tiled compressed hyperspectral image.")
+    version, header_size = struct.unpack('<BI', file.read(5))
+    if version != VERSION:
+        raise ValueError(f"Unsupported tiled file version: {version}")
+    header = json.loads(file.read(header_size).decode('utf-8'))
+    header["data_offset"] = len(MAGIC) + 5 + header_size
+    return header
+
+def _decode_tile(file_path, header, tile, band_start=0, band_stop=None):
+    """
+    Decodes and reconstructs the bands [band_start, band_stop) of one tile. Only the residual
+    bands they depend on are decoded: the bands of the range themselves, and with the
+    inter-band predictor every band before them as well.
+    """
+    bands = header["shape"][0]
+    band_stop = bands if band_stop is None else band_stop
+    row_start, row_stop, col_start, col_stop = tile["window"]
+    predictor_name = header["predictor_name"]
+    inter_band = predictor_name == "inter_band_predictor"
+    band_predictors = tile.get("band_predictors")
+    residual_shape = (bands - 1 if inter_band else bands, row_stop - row_start, col_stop - col_start)
+    # Residual band r of the inter-band predictor is band r + 1 predicted from band r
+    first_band, residual_range = (0, (0, band_stop - 1)) if inter_band else (band_start, (band_start, band_stop))
+    if band_predictors is not None:
+        # Inter-band bands of the adaptive predictor depend on the bands before them, back to an intra-band one
+        while band_predictors[first_band] == "inter_band_predictor":
+            first_band -= 1
+        residual_range = (first_band, band_stop)
+
+    with open(file_path, "rb") as file:
+        file.seek(header["data_offset"] + tile["offset"])
+        untouched_data, residual = streaming.read_chunk(
+            file, residual_shape, np.dtype(header["dtype"]), np.dtype(header["untouched_dtype"]), header["sync_interval"],
+            header.get("codec", "huffman"), *residual_range
+        )
+
+    untouched_data = untouched_data.reshape(tile["untouched_shape"])
+    compression_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=residual.shape)
+    compression_object.decompression_key = header["decompression_key"]
+    if band_predictors is not None:
+        offsets = reconstruct_original.adaptive_untouched_offsets(band_predictors, *residual_shape[1:])
+        compression_object.untouched_data = untouched_data[offsets[first_band]:offsets[band_stop]]
+        compression_object.band_predictors = band_predictors[first_band:band_stop]
+    else:
+        compression_object.untouched_data = untouched_data if inter_band else untouched_data[band_start:band_stop]
+    compression_object.residual_image = residual
+    compression_object = reconstruct_original.reconstruct_with_predictor(compression_object, getattr(predictor, predictor_name))
+    return compression_object.reconstructed_matrix[band_start - first_band:]
+
+def load_region(file_path, row_start=0, row_stop=None, col_start=0, col_stop=None, band_start=0, band_stop=None, workers=1):
+    """
+    Decodes a region of interest of a tiled file. Only the tiles overlapping the region are
+    read, only the bands of the region are decoded in them (and the bands before them with the
+    inter-band predictor), and with workers > 1 the tiles are decoded in parallel.
+
+    Parameters:
+    file_path (str): The path of the tiled file.
+    row_start, row_stop (int): The rows of the region (all the rows by default).
+    col_start, col_stop (int): The columns of the region (all the columns by default).
+    band_start, band_stop (int): The bands of the region (all the bands by default).
+    workers (int): The number of worker processes that decode tiles.
+
+    Returns:
+    CompressionObject: An object with the region in reconstructed_matrix.
+    """
+    with open(file_path, "rb") as file:
+        header = read_header(file)
+    bands, rows, cols = header["shape"]
+    row_stop = rows if row_stop is None else row_stop
+    col_stop = cols if col_stop is None else col_stop
+    band_stop = bands if band_stop is None else band_stop
+    if not (0 <= row_start < row_stop <= rows and 0 <= col_start < col_stop <= cols and 0 <= band_start < band_stop <= bands):
+        raise ValueError("Invalid region.")
+
+    # Tiles overlapping the region
+    tiles = [
+        tile for tile in header["tiles"]
+        if tile["window"][0] < row_stop and tile["window"][1] > row_start and tile["window"][2] < col_stop and tile["window"][3] > col_start
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            decoded_tiles = list(executor.map(
+                _decode_tile, [file_path] * len(tiles), [header] * len(tiles), tiles, [band_start] * len(tiles), [band_stop] * len(tiles)
+            ))
+    else:
+        decoded_tiles = [_decode_tile(file_path, header, tile, band_start, band_stop) for tile in tiles]
+
+    region = None
+    for tile, decoded_tile in zip(tiles, decoded_tiles):
+        if region is None:
+            region = np.empty((band_stop - band_start, row_stop - row_start, col_stop - col_start), dtype=decoded_tile.dtype)
+        tile_row_start, tile_row_stop, tile_col_start, tile_col_stop = tile["window"]
+        # Overlap of the tile and the region
+        top, bottom = max(tile_row_start, row_start), min(tile_row_stop, row_stop)
+        left, right = max(tile_col_start, col_start), min(tile_col_stop, col_stop)
+        region[:, top - row_start:bottom - row_start, left - col_start:right - col_start] = decoded_tile[
+            :, top - tile_row_start:bottom - tile_row_start, left - tile_col_start:right - tile_col_start
+        ]
+
+    compression_object = upload_picture.CompressionObject(matrix=None, name=header["name"], shape=region.shape)
+    compression_object.predictor_name = header["predictor_name"]
+    compression_object.decompression_key = header["decompression_key"]
+    compression_object.reconstructed_matrix = region
+    return compression_object
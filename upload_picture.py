@@ -1,48 +1,183 @@
 import os
 import numpy as np
-import scipy.io as sio
+import instrumentation
 
 # Class to represent the object to compress
 class CompressionObject:
-    def __init__(self, matrix, name, shape):
+    # The attributes are fixed, so instances hold them in slots instead of a dictionary
+    __slots__ = (
+        "matrix", "name", "shape", "lean",
+        "predictor_name", "predicted_image", "untouched_data", "decompression_key", "band_predictors", "residual_image",
+        "codec", "huffman_table", "rans_table", "golomb_rice_model", "rle_values_huffman_table", "rle_counts_huffman_table",
+        "encoded_image", "encoded_image_bit_length", "encoded_image_index", "encoded_image_band_index",
+        "encoded_image_with_rle", "encoded_image_with_rle_bit_length", "encoded_image_with_rle_index",
+        "decoded_data", "_decoded_rle_data", "reconstructed_residual_image", "_reconstructed_rle_residual_image",
+        "values_num", "reconstructed_matrix",
+        "predict_and_residual_time", "encode_time", "encode_with_rle_time", "decode_time", "decode_rle_time", "reconstruct_time"
+    )
+
+    def __init__(self, matrix, name, shape, lean=False):
         """
         Initialize the CompressionObject with matrix, name, and shape.
 
+        In lean mode every stage releases the intermediates it has consumed (see release):
+        the predicted image once the residual is computed, the residual image once it is encoded,
+        and the decoded residual once the matrix is reconstructed. The RLE stream is then only
+        decoded when decoded_rle_data or reconstructed_rle_residual_image is read.
+
         Parameters:
         matrix (np.array): The matrix to compress.
         name (str): The name of the matrix.
         shape (tuple): The shape of the matrix.
+        lean (bool): Whether to release the intermediates of every stage.
         """
         self.matrix = matrix
         self.name = name
         self.shape = shape
+        self.lean = lean
         self.predictor_name = None
         self.predicted_image = None
         self.untouched_data = None
         self.decompression_key = None
+        self.band_predictors = None
         self.residual_image = None  
-        self.huffman_dict = None
-        self.rle_values_huffman_dict = None
-        self.rle_counts_huffman_dict = None
+        self.codec = None
+        self.huffman_table = None
+        self.rans_table = None
+        self.golomb_rice_model = None
+        self.rle_values_huffman_table = None
+        self.rle_counts_huffman_table = None
         self.encoded_image = None
+        self.encoded_image_bit_length = None
+        self.encoded_image_index = None
+        self.encoded_image_band_index = None
         self.encoded_image_with_rle = None
+        self.encoded_image_with_rle_bit_length = None
+        self.encoded_image_with_rle_index = None
         self.decoded_data = None
-        self.decoded_rle_data = None
+        self._decoded_rle_data = None
         self.reconstructed_residual_image = None
-        self.reconstructed_rle_residual_image = None
+        self._reconstructed_rle_residual_image = None
         self.values_num = None
         self.reconstructed_matrix = None
         self.predict_and_residual_time = None
         self.encode_time = None
         self.encode_with_rle_time = None
+        self.decode_time = None
+        self.decode_rle_time = None
+        self.reconstruct_time = None
+
+    @property
+    def decoded_rle_data(self):
+        """
+        The decoded RLE residual image. In lean mode it is decoded from the RLE stream on first read.
+        """
+        if self._decoded_rle_data is None and self.lean and self.encoded_image_with_rle is not None:
+            import huffman_decoder
+            huffman_decoder.decode_rle(self)
+        return self._decoded_rle_data
+
+    @decoded_rle_data.setter
+    def decoded_rle_data(self, value):
+        self._decoded_rle_data = value
+
+    @property
+    def reconstructed_rle_residual_image(self):
+        """
+        The reconstructed RLE residual image. In lean mode it is decoded from the RLE stream on first read.
+        """
+        if self._reconstructed_rle_residual_image is None and self.lean and self.encoded_image_with_rle is not None:
+            return self.decoded_rle_data.reshape(self.shape)
+        return self._reconstructed_rle_residual_image
+
+    @reconstructed_rle_residual_image.setter
+    def reconstructed_rle_residual_image(self, value):
+        self._reconstructed_rle_residual_image = value
+
+    def release(self, *attributes):
+        """
+        Drops the given intermediates in lean mode, once a later stage has consumed them.
+        Nothing is dropped otherwise.
+
+        Parameters:
+        attributes (str): The names of the attributes to drop.
+        """
+        if self.lean:
+            for attribute in attributes:
+                setattr(self, attribute, None)
+
+    def arrays(self):
+        """
+        Lists the arrays the object currently holds, without triggering any lazy decoding.
+
+        Returns:
+        dict: Every attribute holding an np.array, by name.
+        """
+        arrays = {}
+        for attribute in self.__slots__:
+            value = getattr(self, attribute)
+            if isinstance(value, np.ndarray):
+                arrays[attribute.lstrip("_")] = value
+        return arrays
+
+    def nbytes(self):
+        """
+        Computes the memory held by the arrays of the object. Views of the same array are counted once.
+
+        Returns:
+        int: The number of bytes.
+        """
+        owners = {}
+        for value in self.arrays().values():
+            owner = value
+            while isinstance(owner.base, np.ndarray):
+                owner = owner.base
+            owners[id(owner)] = owner.nbytes if owner.base is None else value.nbytes  # Memory maps are not counted as a whole
+        return sum(owners.values())
+
+    def summary(self):
+        """
+        Summary representation of the CompressionObject: its metadata, sizes and timings,
+        and the shape and dtype of every array it holds instead of the arrays themselves.
+
+        Returns:
+        str: The summary.
+        """
+        shape_to_print = (self.shape[0] + 1, *self.shape[1:]) if self.predictor_name == "inter_band_predictor" else self.shape
+        arrays = ", ".join(f"{attribute} {value.shape} {value.dtype}" for attribute, value in self.arrays().items())
+        return (
+            f"Compression Object:\n"
+            f"Name: {self.name}\n"
+            f"Shape: {shape_to_print}\n"
+            f"Lean: {self.lean}\n"
+            f"Predictor Name: {self.predictor_name}\n"
+            f"Decompression Key: {self.decompression_key}\n"
+            f"Codec: {self.codec}\n"
+            f"The length of the encoded image: {self.encoded_image_bit_length} bits\n"
+            f"The length of the encoded image with RLE: {self.encoded_image_with_rle_bit_length} bits\n"
+            f"Arrays: {arrays or None}\n"
+            f"Memory: {self.nbytes()} bytes\n"
+            f"Predict and Residual Time: {self.predict_and_residual_time}\n"
+            f"Encode Time: {self.encode_time}\n"
+            f"Encode with RLE Time: {self.encode_with_rle_time}\n"
+            f"Decode Time: {self.decode_time}\n"
+            f"Decode RLE Time: {self.decode_rle_time}\n"
+            f"Reconstruct Time: {self.reconstruct_time}\n"
+        )
+
+    def __repr__(self):
+        return f"<CompressionObject {self.name!r} {self.shape} predictor={self.predictor_name} codec={self.codec} {self.nbytes()} bytes>"
 
     def __str__(self):
         """
         String representation of the CompressionObject.
+        Lean objects only print their summary, so that printing them does not decode the RLE stream.
 
         Returns:
         str: A string containing the attributes of the object.
         """
+        if self.lean:
+            return self.summary()
         shape_to_print = (self.shape[0] + 1, *self.shape[1:]) if self.predictor_name == "inter_band_predictor" else self.shape
         return (
             f"Compression Object:\n"
@@ -54,16 +189,20 @@ class CompressionObject:
             f"Predicted Image:\n{self.predicted_image}\n"
             f"Decompression Key: {self.decompression_key}\n"
             f"Untouched Data: {self.untouched_data}\n"
+            f"Band Predictors: {self.band_predictors}\n"
             f"Residual Image:\n{self.residual_image}\n"
             f"-------------------------\n"
-            f"Huffman Dictionary:\n{self.huffman_dict}\n"
+            f"Codec: {self.codec}\n"
+            f"Huffman Table:\n{self.huffman_table}\n"
+            f"rANS Table:\n{self.rans_table}\n"
+            f"Golomb-Rice Model:\n{self.golomb_rice_model}\n"
             f"Encoded Image:\n{self.encoded_image}\n"
-            f"RLE Huffman Dictionary (values):\n{self.rle_values_huffman_dict}\n"
-            f"RLE Huffman Dictionary (counts):\n{self.rle_counts_huffman_dict}\n"
+            f"RLE Huffman Table (values):\n{self.rle_values_huffman_table}\n"
+            f"RLE Huffman Table (counts):\n{self.rle_counts_huffman_table}\n"
             f"values_num : {self.values_num}\n"
             f"Encoded Image with RLE:\n{self.encoded_image_with_rle}\n"
-            f"The length of the encoded image: {len(self.encoded_image)}\n"
-            f"The length of the encoded image with RLE: {len(self.encoded_image_with_rle)}\n"
+            f"The length of the encoded image: {self.encoded_image_bit_length} bits\n"
+            f"The length of the encoded image with RLE: {self.encoded_image_with_rle_bit_length} bits\n"
             f"-------------------------\n"
             f"Decoded Data:\n{self.decoded_data}\n"
             f"Decoded RLE Data:\n{self.decoded_rle_data}\n"
@@ -75,44 +214,171 @@ class CompressionObject:
             f"Predict and Residual Time: {self.predict_and_residual_time}\n"
             f"Encode Time: {self.encode_time}\n"
             f"Encode with RLE Time: {self.encode_with_rle_time}\n"
+            f"Decode Time: {self.decode_time}\n"
+            f"Decode RLE Time: {self.decode_rle_time}\n"
+            f"Reconstruct Time: {self.reconstruct_time}\n"
             f"--------------------------\n"
         )
 
+# Byte layout of raw cubes and the axes that turn each one into (bands, rows, cols)
+INTERLEAVE_AXES = {
+    "bsq": (0, 1, 2),  # Stored as (bands, rows, cols)
+    "bil": (1, 0, 2),  # Stored as (rows, bands, cols)
+    "bip": (2, 0, 1)   # Stored as (rows, cols, bands)
+}
+
+# Signature at the start of the HDF5 data of v7.3 .mat files
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
 def split_into_band_matrices(cube):
     """
-    Splits a hyperspectral cube of shape (rows, cols, bands)
-    into a list of 2D band matrices of shape (rows, cols).
+    Views a hyperspectral cube of shape (rows, cols, bands)
+    as a stack of 2D band matrices of shape (bands, rows, cols).
+    The view only swaps the strides, no data is copied.
 
     Parameters:
         cube (np.ndarray): A 3D numpy array of shape (rows, cols, bands)
 
     Returns:
-        List of 2D numpy arrays, one per band
+        np.ndarray: A view of the cube of shape (bands, rows, cols)
+    """
+    return cube.transpose(2, 0, 1)
+
+def _find_cube_name(variables, matrix_name=None):
+    """
+    Picks the variable holding the cube: matrix_name when given, otherwise the
+    largest 3D variable. variables maps every variable name to its shape.
+    """
+    if matrix_name is not None:
+        if matrix_name not in variables:
+            raise ValueError(f"Matrix '{matrix_name}' not found in the file.")
+        return matrix_name
+    cubes = {name: shape for name, shape in variables.items() if len(shape) == 3}
+    if not cubes:
+        raise ValueError("No 3D matrix found in the file.")
+    return max(cubes, key=lambda name: np.prod(cubes[name]))
+
+def _is_hdf5(file_path):
+    """
+    Checks for the HDF5 signature, which v7.3 .mat files place after their 512 byte header.
+    """
+    with open(file_path, "rb") as file:
+        for offset in (0, 512):
+            file.seek(offset)
+            if file.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE:
+                return True
+    return False
+
+def _extract_matrix_from_hdf5(file_path, matrix_name=None):
+    """
+    Extracts a matrix from a v7.3 (HDF5) .mat file. A contiguous, uncompressed dataset
+    is memory mapped, any other dataset is read into memory.
     """
-    bands = cube.shape[2]
-    return np.array([cube[:, :, i] for i in range(bands)])
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Reading v7.3 .mat files requires the h5py package.")
+
+    with h5py.File(file_path, "r") as mat_file:
+        variables = {name: item.shape for name, item in mat_file.items() if isinstance(item, h5py.Dataset)}
+        matrix_name = _find_cube_name(variables, matrix_name)
+        dataset = mat_file[matrix_name]
+        offset = dataset.id.get_offset()
+        if offset is not None and dataset.chunks is None and dataset.compression is None:
+            matrix = np.memmap(file_path, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+        else:
+            matrix = dataset[()]
+    # MATLAB stores arrays column-major, so the dataset is (bands, cols, rows)
+    return matrix.transpose(0, 2, 1), matrix_name
 
 # Extract the matrix and create a CompressionObject instance
-def extract_matrix_from_mat(file_path):
+def extract_matrix_from_mat(file_path, matrix_name=None):
     """
     Extracts a matrix from a .mat file and creates a CompressionObject instance.
+    Only the cube variable is read. Version 7.3 files are read with h5py and memory mapped when possible.
 
     Parameters:
     file_path (str): The path to the .mat file.
+    matrix_name (str): The variable holding the cube (the largest 3D variable by default).
 
     Returns:
     CompressionObject: An instance of the CompressionObject class containing the matrix and its metadata.
     """
-    mat_data = sio.loadmat(file_path)
-    # Extract the matrix name from the file name without the '.mat' extension
-    #matrix_name = os.path.splitext(os.path.basename(file_path))[0].lower()
-    matrix_name = 'paviaU'
-    if matrix_name in mat_data:
-        matrix = mat_data[matrix_name]
-        matrix = split_into_band_matrices(matrix)
+    if _is_hdf5(file_path):
+        matrix, matrix_name = _extract_matrix_from_hdf5(file_path, matrix_name)
         return CompressionObject(matrix=matrix, name=matrix_name, shape=matrix.shape)
-    else:
-        raise ValueError(f"Matrix '{matrix_name}' not found in the file.")
+
+    import scipy.io as sio  # Only loaded for .mat files, it is slow to import
+
+    variables = {name: shape for name, shape, _ in sio.whosmat(file_path)}
+    matrix_name = _find_cube_name(variables, matrix_name)
+    matrix = sio.loadmat(file_path, variable_names=[matrix_name])[matrix_name]
+    matrix = split_into_band_matrices(matrix)
+    return CompressionObject(matrix=matrix, name=matrix_name, shape=matrix.shape)
+
+def extract_matrix_from_npy(file_path, interleave="bsq"):
+    """
+    Memory maps a cube saved with np.save and creates a CompressionObject instance.
+
+    Parameters:
+    file_path (str): The path to the .npy file.
+    interleave (str): The axis order of the saved cube, "bsq" (bands, rows, cols, as the pipeline keeps cubes),
+                      "bil" (rows, bands, cols) or "bip" (rows, cols, bands).
+
+    Returns:
+    CompressionObject: An instance of the CompressionObject class containing the matrix and its metadata.
+    """
+    matrix = np.load(file_path, mmap_mode="r")
+    if matrix.ndim != 3:
+        raise ValueError(f"Expected a 3D matrix, got shape {matrix.shape}.")
+    matrix = matrix.transpose(INTERLEAVE_AXES[interleave.lower()])
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return CompressionObject(matrix=matrix, name=name, shape=matrix.shape)
+
+def extract_matrix_from_raw(file_path, shape, dtype, interleave="bsq", offset=0):
+    """
+    Memory maps a raw (headerless) cube and creates a CompressionObject instance.
+
+    Parameters:
+    file_path (str): The path to the raw file.
+    shape (tuple): The shape of the cube as (bands, rows, cols).
+    dtype (np.dtype): The sample type, including its byte order (e.g. '<u2').
+    interleave (str): The byte layout of the file, "bsq", "bil" or "bip".
+    offset (int): The number of header bytes to skip.
+
+    Returns:
+    CompressionObject: An instance of the CompressionObject class containing the matrix and its metadata.
+    """
+    axes = INTERLEAVE_AXES[interleave.lower()]
+    bands, rows, cols = shape
+    stored_shape = {"bsq": (bands, rows, cols), "bil": (rows, bands, cols), "bip": (rows, cols, bands)}[interleave.lower()]
+    matrix = np.memmap(file_path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=stored_shape)
+    matrix = matrix.transpose(axes)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return CompressionObject(matrix=matrix, name=name, shape=matrix.shape)
+
+def load_cube(file_path, **kwargs):
+    """
+    Creates a CompressionObject from a .mat, .npy or raw cube file, chosen by the file extension.
+    The matrix is a (bands, rows, cols) view of the file whenever the format allows it.
+
+    Parameters:
+    file_path (str): The path to the cube file.
+    kwargs: Passed on to extract_matrix_from_mat, extract_matrix_from_npy or extract_matrix_from_raw.
+
+    Returns:
+    CompressionObject: An instance of the CompressionObject class containing the matrix and its metadata.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    with instrumentation.stage("load") as stage:
+        if extension == ".mat":
+            compression_object = extract_matrix_from_mat(file_path, **kwargs)
+        elif extension == ".npy":
+            compression_object = extract_matrix_from_npy(file_path, **kwargs)
+        else:
+            compression_object = extract_matrix_from_raw(file_path, **kwargs)
+        stage["bytes"] = compression_object.matrix.nbytes
+    return compression_object
 
 # Main function
 def main():
@@ -120,12 +386,8 @@ def main():
     Main function to demonstrate the creation of a CompressionObject instance.
     """
     spectral_file = r'C:\Users\Amir\Downloads\Indian_pines.mat'
-    compression_object = extract_matrix_from_mat(spectral_file)
+    compression_object = load_cube(spectral_file)
     print(compression_object)
 
 if __name__ == "__main__":
     main()
-
-
-
-